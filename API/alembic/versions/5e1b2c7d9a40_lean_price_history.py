@@ -0,0 +1,121 @@
+"""lean price_history: composite key, integer instrument ids
+
+Replaces the original price_history (surrogate id, string instrument_symbol
+foreign key, indexes on id / symbol / date / (symbol, date) plus a unique
+index on the same pair — five index writes per bar) with one row per
+(instrument_id, date) keyed by that pair alone. instruments gains an
+integer identity column for the key.
+
+Pass `-x partition=year` (or set PRICE_HISTORY_PARTITION_BY_YEAR) to range
+partition the table by year while it is converted. On a fresh database the
+revision runs right after init_db's create_all and partitions the new, empty
+table the same way. That choice is made once: a stamped revision never runs
+again, so to partition a lean table later, run
+`python reindex_price_history.py partition`.
+
+Revision ID: 5e1b2c7d9a40
+Revises:
+Create Date: 2026-10-17 09:12:44.318207
+
+"""
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+
+from app.core.config import settings
+from app.db import price_history_layout as layout
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e1b2c7d9a40'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+_STAGING = "price_history_lean"
+_LEGACY = "price_history_legacy"
+
+
+def _partition_requested() -> bool:
+    arg = context.get_x_argument(as_dictionary=True).get("partition")
+    if arg is None:
+        return settings.PRICE_HISTORY_PARTITION_BY_YEAR
+    return arg.lower() in ("year", "1", "true", "yes")
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    if not layout.columns(conn, "instruments") or not layout.columns(conn):
+        return                                   # empty database: init_db's create_all builds the lean layout
+
+    if "id" not in layout.columns(conn, "instruments"):
+        op.execute("ALTER TABLE instruments ADD COLUMN id integer GENERATED BY DEFAULT AS IDENTITY")
+        op.create_unique_constraint("uq_instruments_id", "instruments", ["id"])
+
+    partitioned = _partition_requested()
+    legacy = layout.is_legacy(conn)
+    if not legacy and (layout.is_partitioned(conn) or not partitioned):
+        return                                   # already in the requested layout
+
+    years = layout.year_span(conn, layout.TABLE) if partitioned else []
+    layout.create_table(conn, _STAGING, partitioned, years)
+    if legacy:
+        # Duplicates (pre unique-index data) keep the oldest row, as init_db used to
+        op.execute(f"""
+            INSERT INTO {_STAGING}
+            SELECT DISTINCT ON (i.id, p.date)
+                   i.id, p.date, p.open, p.high, p.low, p.close, p.volume, p.adjusted_close
+            FROM price_history p
+            JOIN instruments i ON i.symbol = p.instrument_symbol
+            ORDER BY i.id, p.date, p.id
+        """)
+    else:
+        op.execute(f"""
+            INSERT INTO {_STAGING}
+            SELECT instrument_id, date, open, high, low, close, volume, adjusted_close
+            FROM price_history ORDER BY instrument_id, date
+        """)
+    op.execute("DROP TABLE price_history")
+    op.execute(f"ALTER TABLE {_STAGING} RENAME TO price_history")
+    layout.add_keys(conn)
+    op.execute("ANALYZE price_history")
+
+
+def downgrade() -> None:
+    conn = op.get_bind()
+    if not layout.is_legacy(conn):
+        op.execute(f"""
+            CREATE TABLE {_LEGACY} (
+                id serial PRIMARY KEY,
+                instrument_symbol varchar REFERENCES instruments (symbol),
+                date date NOT NULL,
+                open double precision,
+                high double precision,
+                low double precision,
+                close double precision,
+                volume double precision,
+                adjusted_close double precision
+            )
+        """)
+        op.execute(f"""
+            INSERT INTO {_LEGACY} (instrument_symbol, date, open, high, low, close, volume, adjusted_close)
+            SELECT i.symbol, p.date, p.open, p.high, p.low, p.close, p.volume, p.adjusted_close
+            FROM price_history p JOIN instruments i ON i.id = p.instrument_id
+            ORDER BY i.symbol, p.date
+        """)
+        op.execute("DROP TABLE price_history")
+        op.execute(f"ALTER TABLE {_LEGACY} RENAME TO price_history")
+        op.execute(f"ALTER TABLE price_history RENAME CONSTRAINT {_LEGACY}_pkey TO price_history_pkey")
+        op.execute(f"ALTER TABLE price_history RENAME CONSTRAINT {_LEGACY}_instrument_symbol_fkey "
+                   f"TO price_history_instrument_symbol_fkey")
+        op.execute(f"ALTER SEQUENCE {_LEGACY}_id_seq RENAME TO price_history_id_seq")
+        op.create_index("ix_price_history_id", "price_history", ["id"])
+        op.create_index("ix_price_history_instrument_symbol", "price_history", ["instrument_symbol"])
+        op.create_index("ix_price_history_date", "price_history", ["date"])
+        op.create_index("ix_price_history_symbol_date", "price_history", ["instrument_symbol", "date"])
+        op.create_unique_constraint("uq_price_history_symbol_date", "price_history", ["instrument_symbol", "date"])
+
+    if "id" in layout.columns(conn, "instruments"):
+        op.drop_constraint("uq_instruments_id", "instruments", type_="unique")
+        op.drop_column("instruments", "id")
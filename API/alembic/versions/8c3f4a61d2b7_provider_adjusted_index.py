@@ -0,0 +1,37 @@
+"""provider-adjusted bars: partial index for rebasing them
+
+Bars ingested before corporate actions were stored as factors hold the
+provider's adjusted closes (adjusted_close set). Ingestion re-downloads a
+symbol's such bars as traded the first time it touches the symbol; this
+partial index lets it find them without scanning the symbol's history, and
+empties as they are rebased.
+
+Revision ID: 8c3f4a61d2b7
+Revises: 5e1b2c7d9a40
+Create Date: 2026-10-17 14:06:21.583910
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.db import price_history_layout as layout
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8c3f4a61d2b7'
+down_revision: Union[str, None] = '5e1b2c7d9a40'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    if not layout.columns(conn) or layout.is_legacy(conn):
+        return
+    layout.add_provider_adjusted_index(conn)
+
+
+def downgrade() -> None:
+    op.execute(f"DROP INDEX IF EXISTS {layout.PROVIDER_ADJUSTED_INDEX}")
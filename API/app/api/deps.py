@@ -1,5 +1,5 @@
 from typing import Generator, Optional
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Query, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
 from pydantic import ValidationError
@@ -13,6 +13,9 @@ from app.db.session import SessionLocal
 reusable_oauth2 = OAuth2PasswordBearer(
     tokenUrl=f"{settings.API_V1_STR}/login/access-token"
 )
+optional_oauth2 = OAuth2PasswordBearer(
+    tokenUrl=f"{settings.API_V1_STR}/login/access-token", auto_error=False
+)
 
 def get_db() -> Generator:
     try:
@@ -21,9 +24,7 @@ def get_db() -> Generator:
     finally:
         db.close()
 
-def get_current_user(
-    db: Session = Depends(get_db), token: str = Depends(reusable_oauth2)
-) -> models.User:
+def _user_from_token(db: Session, token: str) -> models.User:
     try:
         payload = jwt.decode(
             token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM]
@@ -39,6 +40,31 @@ def get_current_user(
         raise HTTPException(status_code=404, detail="User not found")
     return user
 
+def get_current_user(
+    db: Session = Depends(get_db), token: str = Depends(reusable_oauth2)
+) -> models.User:
+    return _user_from_token(db, token)
+
+def get_stream_user(
+    db: Session = Depends(get_db),
+    token: Optional[str] = Depends(optional_oauth2),
+    access_token: Optional[str] = Query(None),
+) -> models.User:
+    """
+    Bearer header or ?access_token= — browsers' EventSource cannot send
+    headers, so Server-Sent Event streams accept the token in the query.
+    """
+    if not (token or access_token):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    user = _user_from_token(db, token or access_token)
+    if not user.is_active:
+        raise HTTPException(status_code=400, detail="Inactive user")
+    return user
+
 def get_current_active_user(
     current_user: models.User = Depends(get_current_user),
 ) -> models.User:
@@ -7,6 +7,7 @@ from app import models, schemas
 from app.api import deps
 from app.models.portfolio import Portfolio, Collaborator
 from app.services.analytics import AnalyticsService
+from app.services import analytics_cache
 
 router = APIRouter()
 
@@ -23,6 +24,8 @@ def get_portfolio_analytics(
     """
     Get portfolio analytics (performance, risk metrics, allocation).
     Accepts optional benchmark, start_date, end_date overrides.
+    Results are cached until the holdings or the price data they use change
+    (see services/analytics_cache.py).
     """
     portfolio = db.query(Portfolio).filter(Portfolio.id == id).first()
     if not portfolio:
@@ -36,6 +39,11 @@ def get_portfolio_analytics(
         if not collab:
             raise HTTPException(status_code=403, detail="Access denied")
 
+    cache_key = analytics_cache.analytics_key(db, portfolio, benchmark, start_date, end_date)
+    cached = analytics_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
     analytics_service = AnalyticsService(db)
     try:
         data = analytics_service.get_portfolio_analytics(
@@ -44,6 +52,7 @@ def get_portfolio_analytics(
             start_date_override=start_date,
             end_date_override=end_date,
         )
+        analytics_cache.put(cache_key, data)
         return data
     except Exception as e:
         print(f"Analytics Error: {e}")
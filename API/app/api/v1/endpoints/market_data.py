@@ -1,12 +1,18 @@
-from typing import Any, Optional, List
-from datetime import date, timedelta
+from typing import Any, Literal, Optional, List
+from datetime import date
+import json
 import logging
 from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
 from sqlalchemy.orm import Session
 
 from app import models, schemas
 from app.api import deps
-from app.services.market_data import MarketDataService, _KNOWN_META
+from app.db.session import SessionLocal
+from app.services.market_data import MarketDataService
+from app.services.ticker_validation import TickerValidator
+from app.services.instrument_search import search_instruments
 
 logger = logging.getLogger(__name__)
 
@@ -26,72 +32,98 @@ def get_price(
     md_service = MarketDataService(db)
 
     try:
-        # Try a 7-day window backwards to find the nearest trading day
-        start_window = date - timedelta(days=7)
-        history = md_service.get_price_history(symbol, start_window, date)
+        # As-of lookup (fetching missing history first) within the 7-day staleness window
+        found = md_service.as_of().lookup([symbol], [date], fetch=True)
     except Exception as e:
         logger.error(f"Error fetching price for {symbol}: {e}")
         raise HTTPException(status_code=500, detail=f"Error fetching market data for '{symbol}'")
 
-    if not history:
+    price = found["price"][0]
+    if price != price:
         raise HTTPException(status_code=404, detail=f"No market data found for '{symbol}'. The symbol may be delisted or invalid.")
 
-    # Return the most recent data point (closest to requested date)
-    latest = history[-1]
-    return {"symbol": symbol, "date": str(latest.date), "price": latest.close}
+    # The most recent bar on or before the requested date
+    return {"symbol": symbol, "date": str(found["date"][0]), "price": float(price)}
+
+
+_MAX_PRICE_QUERIES = 100_000
+
+
+class AsOfPricesRequest(BaseModel):
+    symbols: List[str]
+    dates: List[date]
+    grid: bool = False                     # every symbol on every date instead of parallel pairs
+    max_staleness_days: Optional[int] = Field(None, ge=0, le=3660)
+    fetch: bool = False                    # fetch missing history from the provider first
+    adjust: Literal["split", "total", "raw"] = "split"   # corporate-action adjustment of the prices
+
+
+@router.post("/prices")
+def get_prices(
+    body: AsOfPricesRequest,
+    db: Session = Depends(deps.get_db),
+    current_user: models.User = Depends(deps.get_current_active_user),
+) -> Any:
+    """
+    Bulk as-of prices: the close on or before each date, for parallel
+    symbols[i] / dates[i] pairs (or, with grid=true, every symbol × every
+    date, dates-major). A bar older than max_staleness_days (default
+    PRICE_ASOF_MAX_STALENESS_DAYS) before its date counts as missing.
+    adjust: "split" (default), "total" (dividends reinvested) or "raw" (as traded).
+    Returns {results: [{symbol, date, price, price_date}], missing}.
+    """
+    symbols = [s.strip().upper() for s in body.symbols]
+    dates = body.dates
+    if body.grid:
+        count = len(symbols) * len(dates)
+    elif len(symbols) != len(dates):
+        raise HTTPException(status_code=400, detail="symbols and dates must have the same length (or set grid=true)")
+    else:
+        count = len(symbols)
+    if count > _MAX_PRICE_QUERIES:
+        raise HTTPException(status_code=400, detail=f"At most {_MAX_PRICE_QUERIES} symbol/date pairs per request")
+    if body.grid:
+        symbols, dates = symbols * len(body.dates), [d for d in body.dates for _ in body.symbols]
+
+    try:
+        found = MarketDataService(db).as_of().lookup(
+            symbols, dates, body.max_staleness_days, fetch=body.fetch, adjust=body.adjust,
+        )
+    except Exception as e:
+        logger.error(f"As-of price lookup failed for {count} pairs: {e}")
+        raise HTTPException(status_code=500, detail="Error looking up prices")
+
+    prices, bar_dates = found["price"], found["date"].astype(str)
+    missing = prices != prices
+    results = [
+        {
+            "symbol": sym,
+            "date": str(d),
+            "price": None if miss else float(p),
+            "price_date": None if miss else bd,
+        }
+        for sym, d, p, bd, miss in zip(symbols, dates, prices.tolist(), bar_dates.tolist(), missing.tolist())
+    ]
+    return {"results": results, "missing": int(missing.sum())}
 
 
 @router.get("/search/{query}")
 def search_ticker(
     query: str,
+    remote: bool = Query(False, description="Also ask the market-data provider when nothing matches exactly"),
     db: Session = Depends(deps.get_db),
     current_user: models.User = Depends(deps.get_current_active_user),
 ) -> Any:
     """
     Search for tickers matching the query string.
-    First checks known metadata, then tries yfinance.
+    Answers from the in-memory instrument index (known metadata + instruments
+    table), ranked exact symbol → symbol prefix → name word → substring.
+    With remote=true an unknown ticker is also looked up on the provider in
+    the background; its results are added to the index.
     Returns list of matching tickers with metadata.
     """
-    query_upper = query.strip().upper()
-    if not query_upper:
-        return []
-
-    results = []
-
-    # Search in known metadata
-    for sym, meta in _KNOWN_META.items():
-        if query_upper in sym.upper() or query_upper in meta.get("name", "").upper():
-            results.append({
-                "symbol": sym,
-                "name": meta.get("name", sym),
-                "sector": meta.get("sector", ""),
-                "country": meta.get("country", "US"),
-                "asset_class": meta.get("asset_class", "Equity"),
-                "currency": meta.get("currency", "USD"),
-            })
-
-    # If exact match not found in known, try yfinance lookup
-    if len(results) == 0 or not any(r["symbol"] == query_upper for r in results):
-        try:
-            md_service = MarketDataService(db)
-            info = md_service.get_instrument_info(query_upper)
-            if info and info.get("name"):
-                results.insert(0, {
-                    "symbol": query_upper,
-                    "name": info.get("name", query_upper),
-                    "sector": info.get("sector", ""),
-                    "country": info.get("country", "US"),
-                    "asset_class": info.get("asset_class", "Equity"),
-                    "currency": info.get("currency", "USD"),
-                })
-        except Exception as e:
-            logger.warning(f"yfinance lookup failed for '{query_upper}': {e}")
-
-    # Limit results
-    return results[:15]
-
-
-from pydantic import BaseModel
+    return search_instruments(db.get_bind(), query, limit=15, remote=remote)
+
 
 class ValidateTickersRequest(BaseModel):
     symbols: List[str]
@@ -110,57 +142,36 @@ def validate_tickers(
     (e.g. RACE + EUR → RACE.MI on Milan exchange).
     Returns { valid: [{symbol, name, sector, country, currency, asset_class}], unresolved: [symbol ...] }
     """
-    md_service = MarketDataService(db)
-    valid = []
-    unresolved = []
-
-    hints = body.currency_hints or []
-
-    for idx, sym in enumerate(body.symbols):
-        sym = sym.strip().upper()
-        if not sym:
-            continue
-
-        currency_hint = hints[idx].strip().upper() if idx < len(hints) and hints[idx] else None
-
-        # If a currency hint is provided and it's not USD, try to resolve
-        # the symbol to the correct exchange listing
-        resolved_sym = sym
-        if currency_hint and currency_hint != "USD":
-            resolved_sym = md_service.resolve_symbol_for_currency(sym, currency_hint)
-            logger.info(f"validate_tickers: {sym} + hint={currency_hint} → {resolved_sym}")
-
-        # Try known meta first (only for the original symbol)
-        meta = _KNOWN_META.get(resolved_sym) or _KNOWN_META.get(sym)
-        if meta and meta.get("name"):
-            # If we resolved to a different symbol, still use the resolved one
-            final_sym = resolved_sym if resolved_sym != sym else sym
-            valid.append({
-                "symbol": final_sym,
-                "name": meta.get("name", final_sym),
-                "sector": meta.get("sector", ""),
-                "country": meta.get("country", ""),
-                "asset_class": meta.get("asset_class", "Equity"),
-                "currency": meta.get("currency", "USD"),
-            })
-            continue
-
-        # Try yfinance with the resolved symbol
+    return TickerValidator(db).validate(body.symbols, body.currency_hints)
+
+
+@router.post("/validate-tickers/stream")
+def validate_tickers_stream(
+    body: ValidateTickersRequest,
+    current_user: models.User = Depends(deps.get_current_active_user),
+) -> Any:
+    """
+    Same validation as /validate-tickers, streamed as NDJSON so the client
+    can show progress: {"type": "start", total}, then one
+    {"type": "result", symbol, currency_hint, status, instrument, source, done, total}
+    per unique symbol as soon as it is known, then {"type": "end", ...}.
+    """
+    def lines():
+        # The request's DB dependency is closed before the body streams; own a session
+        db = SessionLocal()
         try:
-            info = md_service.get_instrument_info(resolved_sym)
-            if info and info.get("name"):
-                valid.append({
-                    "symbol": resolved_sym,
-                    "name": info.get("name", resolved_sym),
-                    "sector": info.get("sector", ""),
-                    "country": info.get("country", ""),
-                    "asset_class": info.get("asset_class", "Equity"),
-                    "currency": info.get("currency", "USD"),
-                })
-                continue
-        except Exception as e:
-            logger.warning(f"validate_tickers: yfinance lookup failed for '{resolved_sym}': {e}")
-        unresolved.append(sym)
-
-    return {"valid": valid, "unresolved": unresolved}
+            for event in TickerValidator(db).stream(body.symbols, body.currency_hints):
+                yield json.dumps(event) + "\n"
+        finally:
+            db.close()
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
 
+
+@router.get("/cache-stats")
+def cache_stats(
+    current_user: models.User = Depends(deps.get_current_active_user),
+) -> Any:
+    """Hit/miss counters and L1 occupancy of the shared market-data cache."""
+    from app.services.cache import get_cache
+    return get_cache().stats()
@@ -1,32 +1,49 @@
 from typing import List, Any, Optional
 from pydantic import BaseModel as PydanticBaseModel
-from datetime import date, timedelta
+from datetime import date
+import json
 import logging
+import time
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 
 from app import models, schemas
 from app.api import deps
 from app.models.portfolio import Portfolio, Position, Transaction, Collaborator
 from app.services.market_data import MarketDataService
+from app.services.quote_hub import get_quote_hub
+from app.services.analytics_cache import bump_holdings
+from app.services.trading_calendar import calendar_for_symbol
 
 logger = logging.getLogger(__name__)
 
 
-def _last_trading_day(d: date) -> date:
-    """Return d if weekday, else roll back to Friday."""
-    wd = d.weekday()
-    if wd == 5:  # Saturday
-        return d - timedelta(days=1)
-    elif wd == 6:  # Sunday
-        return d - timedelta(days=2)
-    return d
+def _previous_closes(md_service: MarketDataService, symbols: List[str], quotes: dict) -> dict:
+    """
+    {symbol: close of the session before the current one}. Previous close is
+    per exchange (a Paris listing and a NYSE listing can have different
+    previous sessions) → one bulk query per distinct date.
+    """
+    today = date.today()
+    by_prev_td = {}
+    for sym in symbols:
+        prev_td = _prev_trading_day(_last_trading_day(today, sym), sym)
+        by_prev_td.setdefault(prev_td, []).append(sym)
+    prev_prices = {}
+    for prev_td, syms in by_prev_td.items():
+        prev_prices.update(md_service.get_prices_at_date_bulk(syms, prev_td, latest=quotes))
+    return prev_prices
+
+
+def _last_trading_day(d: date, symbol: Optional[str] = None) -> date:
+    """Return d if it is a session on the symbol's exchange, else the session before it."""
+    return calendar_for_symbol(symbol).last_session_on_or_before(d)
 
 
-def _prev_trading_day(d: date) -> date:
-    """Return the trading day before d."""
-    prev = d - timedelta(days=1)
-    return _last_trading_day(prev)
+def _prev_trading_day(d: date, symbol: Optional[str] = None) -> date:
+    """Return the session before d on the symbol's exchange."""
+    return calendar_for_symbol(symbol).previous_session(d)
 
 router = APIRouter()
 
@@ -81,13 +98,11 @@ def read_portfolio(
     symbols = list({p.instrument_symbol for p in portfolio.positions})
     inst_map = md_service.ensure_instruments_exist(symbols)
 
-    # ── Batch: get latest prices + previous day prices (2 DB queries, no yfinance) ──
-    latest_prices = md_service.get_latest_prices_bulk(symbols)
+    # ── Batch: latest + previous prices from one latest_prices lookup (no yfinance) ──
+    quotes = md_service.get_latest_quotes(symbols)
+    latest_prices = {sym: q.last_close for sym, q in quotes.items() if q.last_close}
 
-    today = date.today()
-    td = _last_trading_day(today)
-    prev_td = _prev_trading_day(td)
-    prev_prices = md_service.get_prices_at_date_bulk(symbols, prev_td)
+    prev_prices = _previous_closes(md_service, symbols, quotes)
 
     # Enrich positions (native currency values first)
     enriched_positions = []
@@ -124,7 +139,7 @@ def read_portfolio(
 
     total_value = 0.0
     for ep in enriched_positions:
-        rate = fx_rates.get(ep["original_currency"].upper(), 1.0)
+        rate = fx_rates.get(ep["original_currency"].strip(), 1.0)
         ep["fx_rate"] = round(rate, 6)
         ep["currency"] = display_ccy
         # Preserve original entry price before conversion
@@ -153,10 +168,12 @@ def read_portfolio(
         ep["daily_change"] = round(daily_chg, 2)
         daily_pnl_total += ep["quantity"] * (ep["current_price"] - prev_price_converted)
 
-    # Enrich collaborators with username/email
+    # Enrich collaborators with username/email (one query for all of them)
+    collab_ids = [c.user_id for c in portfolio.collaborators]
+    users = {u.id: u for u in db.query(models.User).filter(models.User.id.in_(collab_ids)).all()} if collab_ids else {}
     enriched_collabs = []
     for c in portfolio.collaborators:
-        user = db.query(models.User).filter(models.User.id == c.user_id).first()
+        user = users.get(c.user_id)
         enriched_collabs.append({
             "id": c.id,
             "portfolio_id": c.portfolio_id,
@@ -214,6 +231,7 @@ def update_portfolio(
     update_data = portfolio_in.model_dump(exclude_unset=True)
     for field, value in update_data.items():
         setattr(portfolio, field, value)
+    bump_holdings(db, portfolio.id)
     db.commit()
     db.refresh(portfolio)
     return portfolio
@@ -318,6 +336,7 @@ def create_position(
         current_price=position_in.current_price or (instrument.current_price if instrument else position_in.entry_price),
     )
     db.add(position)
+    bump_holdings(db, portfolio.id)
     db.commit()
     db.refresh(position)
     return position
@@ -327,7 +346,7 @@ def create_position(
 class ImportPositionItem(PydanticBaseModel):
     symbol: str
     quantity: float
-    entry_price: float
+    entry_price: Optional[float] = None  # None → close as of entry_date
     entry_date: str  # YYYY-MM-DD
     currency: Optional[str] = None  # if None, use yfinance detection
     pricing_mode: str = "market"
@@ -346,8 +365,10 @@ def import_positions(
 ) -> Any:
     """
     Bulk import positions into a portfolio.
-    Each position is a {symbol, quantity, entry_price, entry_date, currency?, pricing_mode?}.
-    Instruments are synced via yfinance automatically.
+    Each position is a {symbol, quantity, entry_price?, entry_date, currency?, pricing_mode?}.
+    Instruments are synced via yfinance automatically. Positions without an
+    entry_price are valued at the close as of their entry_date (one bulk
+    as-of lookup for all of them).
     """
     portfolio = _get_portfolio_with_access(db, id, current_user, need_edit=True)
     md_service = MarketDataService(db)
@@ -355,8 +376,26 @@ def import_positions(
     created = []
     errors = []
 
-    for item in body.positions:
+    unpriced = [i for i, item in enumerate(body.positions) if not item.entry_price]
+    entry_prices = {}
+    if unpriced:
+        try:
+            found = md_service.as_of().lookup(
+                [body.positions[i].symbol.strip().upper() for i in unpriced],
+                [date.fromisoformat(body.positions[i].entry_date) for i in unpriced],
+                fetch=True,
+            )["price"]
+            entry_prices = {i: float(p) for i, p in zip(unpriced, found) if p == p}
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"Import: as-of entry prices failed: {e}")
+
+    for idx, item in enumerate(body.positions):
         sym = item.symbol.strip().upper()
+        entry_price = item.entry_price or entry_prices.get(idx)
+        if not entry_price:
+            errors.append({"symbol": sym, "error": f"no price for {sym} on or before {item.entry_date}"})
+            continue
         try:
             instrument = md_service.sync_instrument(sym)
             if not instrument:
@@ -370,12 +409,13 @@ def import_positions(
                 portfolio_id=portfolio.id,
                 instrument_symbol=sym,
                 quantity=item.quantity,
-                entry_price=item.entry_price,
+                entry_price=entry_price,
                 entry_date=item.entry_date,
                 pricing_mode=item.pricing_mode,
-                current_price=instrument.current_price if instrument else item.entry_price,
+                current_price=instrument.current_price if instrument else entry_price,
             )
             db.add(pos)
+            bump_holdings(db, portfolio.id)
             db.commit()
             db.refresh(pos)
             created.append({"symbol": sym, "id": pos.id})
@@ -409,6 +449,7 @@ def update_position(
     update_data = position_in.model_dump(exclude_unset=True)
     for field, value in update_data.items():
         setattr(position, field, value)
+    bump_holdings(db, id)
     db.commit()
     db.refresh(position)
     return position
@@ -427,6 +468,7 @@ def delete_position(
     if not position:
         raise HTTPException(status_code=404, detail="Position not found")
     db.delete(position)
+    bump_holdings(db, id)
     db.commit()
     return {"ok": True}
 
@@ -510,6 +552,7 @@ def merge_duplicates(
             deleted_count += 1
         merged_count += 1
 
+    bump_holdings(db, id)
     db.commit()
     return {
         "merged_groups": merged_count,
@@ -548,6 +591,7 @@ def remove_duplicates(
             db.delete(dup)
             deleted_count += 1
 
+    bump_holdings(db, id)
     db.commit()
     return {
         "deleted_positions": deleted_count,
@@ -577,8 +621,20 @@ def create_transaction(
     tx_in: schemas.portfolio.TransactionCreate,
     current_user: models.User = Depends(deps.get_current_active_user),
 ) -> Any:
-    """Add a transaction. Buy/sell also update positions."""
+    """Add a transaction. Buy/sell also update positions; a buy/sell without a price is priced as of its date."""
     portfolio = _get_portfolio_with_access(db, id, current_user, need_edit=True)
+    tx_in.symbol = (tx_in.symbol or '').strip().upper() or '—'
+    if tx_in.type in ('buy', 'sell') and tx_in.symbol != '—' and not tx_in.price:
+        try:
+            priced = MarketDataService(db).as_of().lookup([tx_in.symbol], [tx_in.date], fetch=True)["price"][0]
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"As-of price for transaction in {tx_in.symbol} failed: {e}")
+            priced = float("nan")
+        if priced == priced:
+            tx_in.price = float(priced)
+            if not tx_in.total:
+                tx_in.total = (tx_in.quantity or 0) * tx_in.price
     tx = Transaction(
         portfolio_id=id,
         **tx_in.model_dump(),
@@ -627,6 +683,7 @@ def create_transaction(
             if existing_pos.quantity <= 0:
                 db.delete(existing_pos)
 
+    bump_holdings(db, id)
     db.commit()
     db.refresh(tx)
     return tx
@@ -645,9 +702,69 @@ def delete_transaction(
     if not tx:
         raise HTTPException(status_code=404, detail="Transaction not found")
     db.delete(tx)
+    bump_holdings(db, id)
     db.commit()
     return {"ok": True}
 
+# ========== LIVE QUOTES ==========
+
+# Comment frame sent when no price moved for this long, so proxies keep the stream open
+_STREAM_KEEPALIVE_SECONDS = 15.0
+
+
+def _sse(event: str, payload: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(payload, separators=(',', ':'))}\n\n"
+
+
+@router.get("/{id}/quotes/stream")
+def stream_portfolio_quotes(
+    *,
+    db: Session = Depends(deps.get_db),
+    id: int,
+    current_user: models.User = Depends(deps.get_stream_user),
+) -> Any:
+    """
+    Server-Sent Events with live prices of the portfolio's market-priced
+    positions, in each instrument's own currency (× the position's fx_rate
+    from GET /portfolios/{id} for display):
+
+        event: snapshot   data: {"t": epoch s, "p": {symbol: price}, "prev": {symbol: previous close}}
+        event: quotes     data: {"t": epoch s, "p": {symbol: price}}   — changed symbols only
+
+    Prices come from the shared quote hub (one provider poll per symbol per
+    QUOTE_HUB_INTERVAL, whatever the number of viewers). The symbol set is
+    fixed when the stream opens: reconnect after editing positions.
+    EventSource clients pass the token as ?access_token=.
+    """
+    hub = get_quote_hub()
+    if hub is None:
+        raise HTTPException(status_code=503, detail="Live quotes are disabled")
+    portfolio = _get_portfolio_with_access(db, id, current_user)
+    symbols = sorted({p.instrument_symbol for p in portfolio.positions if p.pricing_mode == 'market'})
+
+    md_service = MarketDataService(db)
+    quotes = md_service.get_latest_quotes(symbols)
+    prices = {sym: q.last_close for sym, q in quotes.items() if q.last_close}
+    prices.update(hub.last_prices(symbols))
+    snapshot = {"t": int(time.time()), "p": prices, "prev": _previous_closes(md_service, symbols, quotes)}
+
+    async def events():
+        sub = hub.subscribe(symbols)
+        try:
+            yield f"retry: {int(hub.interval * 1000)}\n\n"
+            yield _sse("snapshot", snapshot)
+            while True:
+                delta = await sub.next_delta(_STREAM_KEEPALIVE_SECONDS)
+                yield _sse("quotes", {"t": int(time.time()), "p": delta}) if delta else ": keep-alive\n\n"
+        finally:
+            sub.close()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 # ========== COLLABORATORS ==========
 
 @router.get("/{id}/collaborators", response_model=List[schemas.portfolio.Collaborator])
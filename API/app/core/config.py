@@ -19,6 +19,56 @@ class Settings(BaseSettings):
     
     REDIS_URL: str
 
+    # Market data provider: "yfinance" (live), "record" (live + save to disk)
+    # or "replay" (serve saved responses only, no network)
+    MARKET_DATA_PROVIDER: str = "yfinance"
+    MARKET_DATA_REPLAY_DIR: str = "replay_data"
+    MARKET_DATA_REPLAY_LATENCY_MS: float = 0.0
+
+    # Outbound fetch scheduler: one token bucket shared by all workers
+    # ("file" = flock'd state file on this host, "postgres" = shared row, "local" = per process)
+    MARKET_DATA_RATE_LIMIT_BACKEND: str = "file"
+    MARKET_DATA_RATE_LIMIT_FILE: Optional[str] = None
+    MARKET_DATA_RATE_PER_SEC: float = 2.5
+    MARKET_DATA_RATE_BURST: float = 3.0
+    MARKET_DATA_FETCH_WORKERS: int = 4
+    MARKET_DATA_BATCH_WINDOW_MS: float = 25.0
+    MARKET_DATA_FETCH_TIMEOUT: Optional[float] = 120.0
+
+    # Two-tier market-data cache (in-process LRU in front of Redis).
+    # URL defaults to REDIS_URL; "memory://" uses an in-process stand-in.
+    MARKET_DATA_CACHE_URL: Optional[str] = None
+    MARKET_DATA_CACHE_L1_MAX_BYTES: int = 16 * 1024 * 1024
+    MARKET_DATA_CACHE_L1_TTL: float = 60.0
+    MARKET_DATA_CACHE_MAX_VALUE_BYTES: int = 256 * 1024
+    # Largest analytics result kept by the versioned result cache (0 = cache off)
+    ANALYTICS_CACHE_MAX_VALUE_BYTES: int = 4 * 1024 * 1024
+
+    # Host-local memory-mapped mirror of stored closes ("" = read price_history directly)
+    PRICE_STORE_DIR: str = "price_store"
+    # Range-partition price_history by year when the lean_price_history migration runs (first
+    # start of a fresh database, or conversion of an existing one; later: reindex_price_history.py partition)
+    PRICE_HISTORY_PARTITION_BY_YEAR: bool = False
+    # In-process LRU of aligned price matrices used by analytics/backtests (0 = off)
+    PRICE_MATRIX_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    # Shared-memory segments letting workers on one host share those matrices (0 = off).
+    # Docker's default /dev/shm is 64 MB (raise shm_size to go beyond).
+    PRICE_MATRIX_SHARED_MAX_BYTES: int = 48 * 1024 * 1024
+    PRICE_MATRIX_SHARED_PREFIX: str = "pmatrix"
+    # Oldest bar (calendar days before the requested date) an as-of price lookup may use
+    PRICE_ASOF_MAX_STALENESS_DAYS: int = 7
+    # Ingestion quality screen (price_quality.py): robust z-score above which a daily
+    # return counts as an outlier (0 = screen off), and the run of identical closes
+    # from which repeats are treated as stale prints
+    PRICE_QUALITY_RETURN_Z: float = 10.0
+    PRICE_QUALITY_STALE_RUN: int = 5
+
+    # Seconds between background re-validations of quarantined symbols (0 = off)
+    MARKET_DATA_QUARANTINE_RETRY_INTERVAL: float = 900.0
+
+    # Seconds between live-quote polls for open /portfolios/{id}/quotes/stream connections (0 = off)
+    QUOTE_HUB_INTERVAL: float = 15.0
+
     class Config:
         env_file = ".env"
         case_sensitive = True
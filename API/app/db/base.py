@@ -1,4 +1,8 @@
 from app.db.base_class import Base
 from app.models.user import User
 from app.models.portfolio import Portfolio, Position, Transaction, Collaborator
-from app.models.instrument import Instrument, PriceHistory
+from app.models.instrument import Instrument, PriceHistory, PriceCoverage
+from app.models.rate_limit import RateLimitBucket
+from app.models.negative_result import NegativeResult
+from app.models.fx_rate import FxRate
+from app.models.symbol_listing import SymbolListing
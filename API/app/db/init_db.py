@@ -8,6 +8,7 @@ from app.models.portfolio import Portfolio, Position
 from app.db.base import Base
 from app.db.session import engine
 from datetime import date, timedelta
+import os
 
 def init_db(db: Session) -> None:
     # Create tables if they don't exist (handles NEW tables like transactions, collaborators)
@@ -18,13 +19,11 @@ def init_db(db: Session) -> None:
     _add_column_if_not_exists(db, "users", "display_name", "VARCHAR")
     _add_column_if_not_exists(db, "users", "organization", "VARCHAR")
     _add_column_if_not_exists(db, "users", "avatar_url", "VARCHAR")
+    _add_column_if_not_exists(db, "portfolios", "holdings_version", "INTEGER NOT NULL DEFAULT 0")
+    _add_column_if_not_exists(db, "latest_prices", "data_version", "BIGINT NOT NULL DEFAULT 0")
 
-    # Deduplicate price_history rows BEFORE creating unique constraint
-    _deduplicate_price_history(db)
-
-    # Add composite index & unique constraint on price_history (idempotent)
-    _create_index_if_not_exists(db, "ix_price_history_symbol_date", "price_history", "instrument_symbol, date")
-    _create_unique_constraint_if_not_exists(db, "uq_price_history_symbol_date", "price_history", "instrument_symbol, date")
+    # Schema changes create_all can't make (price_history layout) live in alembic/versions
+    _run_migrations(db)
 
     # Check by email OR username to avoid unique constraint violations
     user = db.query(User).filter(
@@ -176,39 +175,23 @@ def _add_column_if_not_exists(db: Session, table: str, column: str, col_type: st
         print(f"Column migration skipped ({table}.{column}): {e}")
 
 
-def _deduplicate_price_history(db: Session) -> None:
-    """Remove duplicate (instrument_symbol, date) rows, keeping the one with the lowest id."""
-    try:
-        result = db.execute(text(
-            "DELETE FROM price_history "
-            "WHERE id NOT IN ("
-            "  SELECT MIN(id) FROM price_history GROUP BY instrument_symbol, date"
-            ")"
-        ))
-        db.commit()
-        removed = result.rowcount
-        if removed > 0:
-            print(f"Deduplicated price_history: removed {removed} duplicate rows")
-    except Exception as e:
-        db.rollback()
-        print(f"Deduplication skipped: {e}")
-
-
-def _create_index_if_not_exists(db: Session, index_name: str, table: str, columns: str) -> None:
-    """Create a DB index if it doesn't already exist."""
-    try:
-        db.execute(text(f"CREATE INDEX IF NOT EXISTS {index_name} ON {table} ({columns})"))
-        db.commit()
-    except Exception as e:
-        db.rollback()
-        print(f"Index migration skipped ({index_name}): {e}")
-
+def _run_migrations(db: Session) -> None:
+    """alembic upgrade head, serialized across workers starting at the same time."""
+    from alembic import command
+    from alembic.config import Config
 
-def _create_unique_constraint_if_not_exists(db: Session, constraint_name: str, table: str, columns: str) -> None:
-    """Create a unique index (acts as unique constraint) if it doesn't exist."""
+    api_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    cfg = Config(os.path.join(api_dir, "alembic.ini"))
+    cfg.set_main_option("script_location", os.path.join(api_dir, "alembic"))
+    cfg.attributes["configure_logger"] = False
     try:
-        db.execute(text(f"CREATE UNIQUE INDEX IF NOT EXISTS {constraint_name} ON {table} ({columns})"))
+        db.execute(text("SELECT pg_advisory_lock(hashtext('alembic_upgrade'))"))
+        try:
+            command.upgrade(cfg, "head")
+        finally:
+            db.execute(text("SELECT pg_advisory_unlock(hashtext('alembic_upgrade'))"))
         db.commit()
     except Exception as e:
         db.rollback()
-        print(f"Unique constraint migration skipped ({constraint_name}): {e}")
+        print(f"Database migration failed: {e}")
+        raise
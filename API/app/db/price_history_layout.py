@@ -0,0 +1,140 @@
+"""
+Physical layout helpers for price_history, shared by the lean_price_history
+migration and reindex_price_history.py.
+
+The lean layout is one row per (instrument_id, date) with that pair as the
+primary key, plus a partial index over the bars still holding the provider's
+old adjustment (adjusted_close set; empty once ingestion has rebased them). Optionally the table is range partitioned by
+year: one partition per calendar year (price_history_y2024, …) plus
+price_history_default catching anything outside them, so a late backfill
+never fails on a missing partition. Range scans then touch only the years
+they ask for, and old years can be reindexed / clustered one at a time.
+"""
+
+import logging
+from datetime import date
+from typing import List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+logger = logging.getLogger(__name__)
+
+TABLE = "price_history"
+DEFAULT_PARTITION = f"{TABLE}_default"
+PROVIDER_ADJUSTED_INDEX = f"ix_{TABLE}_provider_adjusted"
+YEARS_AHEAD = 1                  # partitions created past the current year
+
+_BAR_COLUMNS = """
+    instrument_id integer NOT NULL,
+    date date NOT NULL,
+    open double precision,
+    high double precision,
+    low double precision,
+    close double precision,
+    volume double precision,
+    adjusted_close double precision
+"""
+
+
+def partition_name(year: int) -> str:
+    return f"{TABLE}_y{year}"
+
+
+def columns(conn: Connection, table: str = TABLE) -> List[str]:
+    return [r[0] for r in conn.execute(text(
+        "SELECT column_name FROM information_schema.columns "
+        "WHERE table_schema = current_schema() AND table_name = :t"
+    ), {"t": table})]
+
+
+def is_legacy(conn: Connection) -> bool:
+    """True for the original layout (surrogate id, instrument_symbol, five indexes)."""
+    return "instrument_symbol" in columns(conn)
+
+
+def is_partitioned(conn: Connection, table: str = TABLE) -> bool:
+    return conn.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table pt "
+        "JOIN pg_class c ON c.oid = pt.partrelid "
+        "WHERE c.relname = :t AND c.relnamespace = current_schema()::regnamespace)"
+    ), {"t": table}).scalar()
+
+
+def partitions(conn: Connection, table: str = TABLE) -> List[str]:
+    """Names of the partitions attached to `table` (empty when not partitioned)."""
+    return [r[0] for r in conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid "
+        "JOIN pg_class p ON p.oid = i.inhparent "
+        "WHERE p.relname = :t AND p.relnamespace = current_schema()::regnamespace "
+        "ORDER BY c.relname"
+    ), {"t": table})]
+
+
+def create_table(conn: Connection, name: str, partitioned: bool, years: List[int]) -> None:
+    """
+    Create the lean table `name` without its primary key (add_keys() builds
+    it after a bulk load, which is much faster than maintaining it per row).
+    """
+    suffix = " PARTITION BY RANGE (date)" if partitioned else ""
+    conn.execute(text(f"CREATE TABLE {name} ({_BAR_COLUMNS}){suffix}"))
+    if partitioned:
+        for year in years:
+            conn.execute(text(
+                f"CREATE TABLE {partition_name(year)} PARTITION OF {name} "
+                f"FOR VALUES FROM ('{year}-01-01') TO ('{year + 1}-01-01')"
+            ))
+        conn.execute(text(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {name} DEFAULT"))
+
+
+def add_keys(conn: Connection, table: str = TABLE) -> None:
+    conn.execute(text(f"ALTER TABLE {table} ADD CONSTRAINT {TABLE}_pkey PRIMARY KEY (instrument_id, date)"))
+    conn.execute(text(
+        f"ALTER TABLE {table} ADD CONSTRAINT {TABLE}_instrument_id_fkey "
+        f"FOREIGN KEY (instrument_id) REFERENCES instruments (id)"
+    ))
+    add_provider_adjusted_index(conn, table)
+
+
+def add_provider_adjusted_index(conn: Connection, table: str = TABLE) -> None:
+    conn.execute(text(
+        f"CREATE INDEX IF NOT EXISTS {PROVIDER_ADJUSTED_INDEX} ON {table} (instrument_id, date) "
+        f"WHERE adjusted_close IS NOT NULL"
+    ))
+
+
+def year_span(conn: Connection, source: str, years_ahead: int = YEARS_AHEAD,
+              today: Optional[date] = None) -> List[int]:
+    """Calendar years from the oldest bar in `source` through `years_ahead` past today."""
+    today = today or date.today()
+    first = conn.execute(text(f"SELECT min(date) FROM {source}")).scalar()
+    start = first.year if first else today.year
+    return list(range(start, today.year + years_ahead + 1))
+
+
+def ensure_year_partitions(conn: Connection, years: List[int]) -> List[str]:
+    """
+    Add missing yearly partitions to a partitioned price_history, moving any
+    rows the default partition already holds for those years. Returns the
+    partitions created.
+    """
+    existing = set(partitions(conn))
+    created = []
+    for year in sorted(years):
+        name = partition_name(year)
+        if name in existing:
+            continue
+        lo, hi = f"{year}-01-01", f"{year + 1}-01-01"
+        conn.execute(text(f"CREATE TABLE {name} (LIKE {TABLE} INCLUDING DEFAULTS)"))
+        if DEFAULT_PARTITION in existing:
+            moved = conn.execute(text(
+                f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} "
+                f"WHERE date >= :lo AND date < :hi RETURNING *) "
+                f"INSERT INTO {name} SELECT * FROM moved"
+            ), {"lo": lo, "hi": hi}).rowcount
+            if moved:
+                logger.info(f"{name}: moved {moved} rows out of {DEFAULT_PARTITION}")
+        conn.execute(text(f"ALTER TABLE {TABLE} ATTACH PARTITION {name} FOR VALUES FROM ('{lo}') TO ('{hi}')"))
+        created.append(name)
+    return created
@@ -1,4 +1,5 @@
 import threading
+import time
 import logging
 from fastapi import FastAPI
 from app.core.config import settings
@@ -32,6 +33,20 @@ def _background_price_refresh():
         logger.error(f"Background price refresh thread error: {e}")
 
 
+def _quarantine_retrier():
+    """Periodically re-validate quarantined symbols (see services/negative_cache.py)."""
+    from app.services.market_data import MarketDataService
+    while True:
+        time.sleep(settings.MARKET_DATA_QUARANTINE_RETRY_INTERVAL)
+        db = SessionLocal()
+        try:
+            MarketDataService(db).revalidate_quarantined()
+        except Exception as e:
+            logger.warning(f"Quarantine re-validation failed: {e}")
+        finally:
+            db.close()
+
+
 @app.on_event("startup")
 def startup_event():
     db = SessionLocal()
@@ -43,6 +58,9 @@ def startup_event():
     t.start()
     logger.info("Background price refresh thread started")
 
+    if settings.MARKET_DATA_QUARANTINE_RETRY_INTERVAL > 0:
+        threading.Thread(target=_quarantine_retrier, daemon=True).start()
+
 from fastapi.middleware.cors import CORSMiddleware
 import os
 
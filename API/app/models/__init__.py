@@ -1,3 +1,7 @@
 from .user import User
 from .portfolio import Portfolio, Position, Transaction, Collaborator
-from .instrument import Instrument, PriceHistory
+from .instrument import Instrument, PriceHistory, PriceCoverage, LatestPrice, CorporateAction, PriceQuarantine
+from .rate_limit import RateLimitBucket
+from .negative_result import NegativeResult
+from .fx_rate import FxRate
+from .symbol_listing import SymbolListing
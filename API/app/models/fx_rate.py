@@ -0,0 +1,10 @@
+from sqlalchemy import Column, String, Float, Date
+from app.db.base_class import Base
+
+class FxRate(Base):
+    """Daily close of a currency against USD: pair "EURUSD" → 1 EUR = rate USD (see services/fx.py)."""
+    __tablename__ = "fx_rates"
+
+    pair = Column(String, primary_key=True)
+    date = Column(Date, primary_key=True)
+    rate = Column(Float, nullable=False)
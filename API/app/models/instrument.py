@@ -1,11 +1,15 @@
-from sqlalchemy import Column, String, Float, Date, Integer, ForeignKey, Index, UniqueConstraint
+from sqlalchemy import Column, String, Float, Date, DateTime, Integer, BigInteger, ForeignKey, Identity, Index, UniqueConstraint, JSON, text
 from sqlalchemy.orm import relationship
 from app.db.base_class import Base
 
 class Instrument(Base):
     __tablename__ = "instruments"
+    __table_args__ = (
+        UniqueConstraint('id', name='uq_instruments_id'),
+    )
 
     symbol = Column(String, primary_key=True, index=True)
+    id = Column(Integer, Identity(), nullable=False)  # compact key for price_history rows
     name = Column(String)
     asset_class = Column(String)
     sector = Column(String)
@@ -15,15 +19,26 @@ class Instrument(Base):
     last_updated = Column(Date)
 
 class PriceHistory(Base):
+    """
+    One bar per (instrument, date). The composite primary key is the only
+    index every lookup uses: by instrument and date range. Existing databases
+    are converted by the lean_price_history migration (optionally range
+    partitioned by year).
+
+    Prices are stored as traded; splits and dividends live in
+    corporate_actions and are applied on read. adjusted_close is only set
+    on bars ingested before that (the provider's adjustment at download);
+    the partial index finds those for ingestion to rebase, and holds no
+    other row, so new bars never write to it.
+    """
     __tablename__ = "price_history"
     __table_args__ = (
-        UniqueConstraint('instrument_symbol', 'date', name='uq_price_history_symbol_date'),
-        Index('ix_price_history_symbol_date', 'instrument_symbol', 'date'),
+        Index("ix_price_history_provider_adjusted", "instrument_id", "date",
+              postgresql_where=text("adjusted_close IS NOT NULL")),
     )
 
-    id = Column(Integer, primary_key=True, index=True)
-    instrument_symbol = Column(String, ForeignKey("instruments.symbol"), index=True)
-    date = Column(Date, nullable=False, index=True)
+    instrument_id = Column(Integer, ForeignKey("instruments.id"), primary_key=True)
+    date = Column(Date, primary_key=True)
     open = Column(Float)
     high = Column(Float)
     low = Column(Float)
@@ -32,3 +47,49 @@ class PriceHistory(Base):
     adjusted_close = Column(Float)
 
     instrument = relationship("Instrument", backref="price_history")
+
+class PriceCoverage(Base):
+    """Per-symbol summary of what price_history holds, maintained by ingestion."""
+    __tablename__ = "price_coverage"
+
+    symbol = Column(String, ForeignKey("instruments.symbol"), primary_key=True)
+    first_date = Column(Date)
+    last_date = Column(Date)
+    last_fetched_at = Column(DateTime)
+    known_holes = Column(JSON, default=list)  # [["YYYY-MM-DD", "YYYY-MM-DD"], ...] the provider has no bars for
+
+class CorporateAction(Base):
+    """Split (amount = ratio) or dividend (amount = cash per share) with its price factor."""
+    __tablename__ = "corporate_actions"
+
+    symbol = Column(String, ForeignKey("instruments.symbol"), primary_key=True)
+    ex_date = Column(Date, primary_key=True)
+    kind = Column(String, primary_key=True)   # "split" | "dividend"
+    amount = Column(Float, nullable=False)
+    factor = Column(Float)                    # multiplies bars before ex_date (NULL = unknown, ignored)
+
+class LatestPrice(Base):
+    """Last two priced bars per symbol, maintained by ingestion in the upsert's transaction."""
+    __tablename__ = "latest_prices"
+
+    symbol = Column(String, ForeignKey("instruments.symbol"), primary_key=True)
+    last_date = Column(Date)
+    last_close = Column(Float)   # split-adjusted, like prev_close
+    prev_date = Column(Date)
+    prev_close = Column(Float)
+    data_version = Column(BigInteger, nullable=False, default=0, server_default="0")  # +1 per refresh
+
+class PriceQuarantine(Base):
+    """Provider bar held back by the ingestion quality screen, with the checks it failed."""
+    __tablename__ = "price_quarantine"
+
+    symbol = Column(String, ForeignKey("instruments.symbol"), primary_key=True)
+    date = Column(Date, primary_key=True)
+    open = Column(Float)
+    high = Column(Float)
+    low = Column(Float)
+    close = Column(Float)
+    volume = Column(Float)
+    reasons = Column(String, nullable=False)   # comma-separated, see services/price_quality.py
+    zscore = Column(Float)                     # robust z-score of the bar's daily return
+    detected_at = Column(DateTime)
@@ -0,0 +1,15 @@
+from sqlalchemy import Column, String, Integer, DateTime
+from app.db.base_class import Base
+
+class NegativeResult(Base):
+    """Remembered provider failures per (kind, symbol) — see services/negative_cache.py."""
+    __tablename__ = "negative_results"
+
+    kind = Column(String, primary_key=True)        # "info" | "history"
+    symbol = Column(String, primary_key=True)
+    status = Column(String, nullable=False)        # "failing" | "quarantined"
+    failures = Column(Integer, nullable=False, default=1)
+    first_failed_at = Column(DateTime, nullable=False)
+    last_failed_at = Column(DateTime, nullable=False)
+    retry_after = Column(DateTime, nullable=False, index=True)
+    last_error = Column(String)
@@ -12,6 +12,8 @@ class Portfolio(Base):
     currency = Column(String, default="USD")  # 'USD' or 'EUR'
     owner_id = Column(Integer, ForeignKey("users.id"))
     benchmark_symbol = Column(String, nullable=True)
+    # Bumped by every change to positions, transactions or settings (analytics cache key)
+    holdings_version = Column(Integer, nullable=False, default=0, server_default="0")
 
     owner = relationship("User", backref="portfolios")
     positions = relationship("Position", back_populates="portfolio", cascade="all, delete-orphan")
@@ -0,0 +1,10 @@
+from sqlalchemy import Column, String, Float
+from app.db.base_class import Base
+
+class RateLimitBucket(Base):
+    """Token-bucket state shared by every API worker (see services/fetch_scheduler.py)."""
+    __tablename__ = "rate_limit_buckets"
+
+    name = Column(String, primary_key=True)
+    tokens = Column(Float, nullable=False)
+    updated_at = Column(Float, nullable=False)  # epoch seconds (DB clock)
@@ -0,0 +1,13 @@
+from sqlalchemy import Column, String, Float, DateTime
+from app.db.base_class import Base
+
+class SymbolListing(Base):
+    """Resolved exchange listing for a bare ticker in a given currency (e.g. RACE + EUR → RACE.MI)."""
+    __tablename__ = "symbol_listings"
+
+    base_ticker = Column(String, primary_key=True)
+    currency = Column(String, primary_key=True)
+    resolved_symbol = Column(String, nullable=False)
+    exchange = Column(String)
+    confidence = Column(Float, nullable=False, default=0.0)  # 1 = search exact match … 0 = no listing, kept original
+    checked_at = Column(DateTime, nullable=False)
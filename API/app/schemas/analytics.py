@@ -69,3 +69,4 @@ class PortfolioAnalytics(BaseModel):
     drawdownData: List[Dict[str, Any]] # date, drawdown, cumReturn
     rollingVolatility: List[Dict[str, Any]]
     rollingCorrelation: List[Dict[str, Any]]
+    currencyAttribution: List[Dict[str, Any]] = [] # symbol, currency, localReturn, currencyReturn, totalReturn
@@ -7,9 +7,12 @@ from typing import List, Dict, Any, Optional
 
 from app.models.portfolio import Portfolio, Position
 from app.services.market_data import MarketDataService
+from app.services.price_matrix import PriceMatrixLoader
+from app.services.fx_conversion import convert_price_matrix, currency_attribution
+from app.services import analytics_series
 from app.schemas.analytics import (
     RiskMetrics, PortfolioAnalytics, AllocationItem,
-    PerformancePoint, MonthlyReturn, DistributionBin, CorrelationMatrix
+    DistributionBin, CorrelationMatrix
 )
 
 logger = logging.getLogger(__name__)
@@ -54,29 +57,25 @@ class AnalyticsService:
         benchmark_symbol = benchmark_override or portfolio.benchmark_symbol or "SPY"
         all_symbols = list(set(symbols + [benchmark_symbol]))
 
-        # Batch: ensure all instruments exist (DB only) then download missing history
-        self.md_service.ensure_instruments_exist(all_symbols)
-        self.md_service.batch_download_history(all_symbols, start_date, end_date)
-
-        price_data = {}
-        for sym in all_symbols:
-            try:
-                history = self.md_service.get_price_history(sym, start_date, end_date)
-                if history:
-                    dates = [h.date for h in history]
-                    prices = [h.adjusted_close or h.close for h in history]
-                    s = pd.Series(data=prices, index=pd.to_datetime(dates))
-                    s = s[~s.index.duplicated(keep='first')]
-                    price_data[sym] = s
-            except Exception as e:
-                logger.warning(f"Error fetching {sym}: {e}")
-
-        df_prices = pd.DataFrame(price_data)
-        df_prices = df_prices.ffill().dropna()
+        # One fetch plan + one read: aligned, forward-filled dates × symbols
+        loaded = PriceMatrixLoader(self.db, self.md_service).load(all_symbols, start_date, end_date)
+        inst_map, df_prices = loaded["instruments"], loaded["prices"]
 
         if df_prices.empty or len(df_prices) < 5:
             return self._get_empty_analytics()
 
+        # ── Convert every listing to the portfolio currency (dated FX) ──
+        currencies = {s: (inst_map[s].currency if s in inst_map and inst_map[s].currency else "USD")
+                      for s in df_prices.columns}
+        local_prices = df_prices
+        fx_factors = pd.DataFrame(1.0, index=df_prices.index, columns=df_prices.columns)
+        try:
+            converted = convert_price_matrix(self.db, df_prices, currencies,
+                                             (portfolio.currency or "USD").upper(), self.md_service.provider)
+            df_prices, fx_factors = converted["prices"], converted["fx"]
+        except Exception as e:
+            logger.warning(f"FX conversion failed, using local-currency prices: {e}")
+
         # ── Aggregate position quantities & entry dates ──
         position_qty: Dict[str, float] = {}
         position_entry: Dict[str, date] = {}
@@ -141,27 +140,7 @@ class AnalyticsService:
         metrics = self._compute_risk_metrics(pf_returns, bench_returns)
 
         # ======= PERFORMANCE DATA (cumulative) =======
-        pf_cum_ret = ((1 + pf_returns).cumprod() - 1) * 100
-        bench_cum_ret = ((1 + bench_returns).cumprod() - 1) * 100
-
-        performance_data = []
-        for dt in pf_cum_ret.index:
-            dt_str = dt.strftime('%Y-%m-%d')
-            try:
-                pf_val = _safe_float((1 + pf_returns.loc[:dt]).prod() * 100, 100.0)
-                bench_val = _safe_float((1 + bench_returns.loc[:dt]).prod() * 100, 100.0)
-                pf_ret = _safe_float(pf_cum_ret.loc[dt])
-                bench_ret = _safe_float(bench_cum_ret.loc[dt])
-            except Exception:
-                pf_val, bench_val, pf_ret, bench_ret = 100.0, 100.0, 0.0, 0.0
-
-            performance_data.append(PerformancePoint(
-                date=dt_str,
-                portfolio=round(pf_val, 2),
-                benchmark=round(bench_val, 2),
-                portfolioReturn=round(pf_ret, 2),
-                benchmarkReturn=round(bench_ret, 2),
-            ))
+        performance_data = self._compute_performance_data(pf_returns, bench_returns)
 
         # ======= MONTHLY RETURNS =======
         monthly_data = self._compute_monthly_returns(pf_returns, bench_returns)
@@ -191,6 +170,9 @@ class AnalyticsService:
         # ======= ROLLING CORRELATION =======
         rolling_corr = self._compute_rolling_correlation(pf_returns, bench_returns, window=60)
 
+        # ======= CURRENCY ATTRIBUTION =======
+        ccy_attrib = currency_attribution(local_prices, fx_factors, currencies, valid_symbols)
+
         return PortfolioAnalytics(
             riskMetrics=metrics,
             performanceData=performance_data,
@@ -203,6 +185,7 @@ class AnalyticsService:
             drawdownData=drawdown_data,
             rollingVolatility=rolling_vol,
             rollingCorrelation=rolling_corr,
+            currencyAttribution=ccy_attrib,
         )
 
     def _compute_risk_metrics(self, pf_returns: pd.Series, bench_returns: pd.Series) -> RiskMetrics:
@@ -291,7 +274,7 @@ class AnalyticsService:
         worst_day = float(pf_returns.min()) * 100
 
         # Monthly aggregation
-        monthly_rets = pf_returns.resample('ME').apply(lambda x: (1 + x).prod() - 1)
+        monthly_rets = analytics_series.compound(pf_returns, 'ME')
         best_month = float(monthly_rets.max()) * 100 if len(monthly_rets) > 0 else 0.0
         worst_month = float(monthly_rets.min()) * 100 if len(monthly_rets) > 0 else 0.0
         positive_months = int((monthly_rets > 0).sum() / max(len(monthly_rets), 1) * 100) if len(monthly_rets) > 0 else 0
@@ -327,18 +310,16 @@ class AnalyticsService:
             winRate=round(_safe_float(win_rate), 1),
         )
 
-    def _compute_monthly_returns(self, pf_returns: pd.Series, bench_returns: pd.Series) -> List[MonthlyReturn]:
+    def _compute_performance_data(self, pf_returns: pd.Series, bench_returns: pd.Series) -> List[Dict[str, Any]]:
+        try:
+            return analytics_series.performance_rows(pf_returns, bench_returns)
+        except Exception as e:
+            logger.error(f"Error computing performance data: {e}")
+            return []
+
+    def _compute_monthly_returns(self, pf_returns: pd.Series, bench_returns: pd.Series) -> List[Dict[str, Any]]:
         try:
-            pf_monthly = pf_returns.resample('ME').apply(lambda x: (1 + x).prod() - 1).fillna(0)
-            bench_monthly = bench_returns.resample('ME').apply(lambda x: (1 + x).prod() - 1).fillna(0)
-            data = []
-            for dt in pf_monthly.index:
-                data.append(MonthlyReturn(
-                    month=dt.strftime('%b %y'),
-                    portfolio=round(_safe_float(pf_monthly.loc[dt]) * 100, 2),
-                    benchmark=round(_safe_float(bench_monthly.get(dt, 0)) * 100, 2),
-                ))
-            return data
+            return analytics_series.monthly_rows(pf_returns, bench_returns)
         except Exception as e:
             logger.error(f"Error computing monthly returns: {e}")
             return []
@@ -355,51 +336,22 @@ class AnalyticsService:
 
     def _compute_drawdown_data(self, pf_returns: pd.Series) -> List[Dict[str, float]]:
         try:
-            cum = (1 + pf_returns).cumprod()
-            rolling_max = cum.cummax()
-            drawdown = ((cum - rolling_max) / rolling_max) * 100
-            cum_ret = (cum / cum.iloc[0] - 1) * 100
-            data = []
-            for dt in pf_returns.index:
-                data.append({
-                    "date": dt.strftime('%Y-%m-%d'),
-                    "drawdown": round(_safe_float(drawdown.loc[dt]), 2),
-                    "cumReturn": round(_safe_float(cum_ret.loc[dt]), 2),
-                })
-            return data
+            return analytics_series.drawdown_rows(pf_returns)
         except Exception as e:
             logger.error(f"Error computing drawdown: {e}")
             return []
 
     def _compute_rolling_volatility(self, pf_returns: pd.Series, bench_returns: pd.Series, window: int = 60) -> List[Dict[str, float]]:
         try:
-            pf_vol = pf_returns.rolling(window).std() * np.sqrt(252) * 100
-            bench_vol = bench_returns.rolling(window).std() * np.sqrt(252) * 100
-            data = []
-            # Sample every 5 days
-            sampled = pf_vol.dropna().iloc[::5]
-            for dt in sampled.index:
-                data.append({
-                    "date": dt.strftime('%Y-%m-%d'),
-                    "portfolio": round(_safe_float(pf_vol.loc[dt]), 2),
-                    "benchmark": round(_safe_float(bench_vol.get(dt, 0)), 2),
-                })
-            return data
+            # Sampled every 5 days
+            return analytics_series.rolling_volatility_rows(pf_returns, bench_returns, window)
         except Exception as e:
             logger.error(f"Error computing rolling volatility: {e}")
             return []
 
     def _compute_rolling_correlation(self, pf_returns: pd.Series, bench_returns: pd.Series, window: int = 60) -> List[Dict[str, float]]:
         try:
-            rolling_corr = pf_returns.rolling(window).corr(bench_returns)
-            data = []
-            sampled = rolling_corr.dropna().iloc[::5]
-            for dt in sampled.index:
-                data.append({
-                    "date": dt.strftime('%Y-%m-%d'),
-                    "correlation": round(_safe_float(rolling_corr.loc[dt]), 3),
-                })
-            return data
+            return analytics_series.rolling_correlation_rows(pf_returns, bench_returns, window)
         except Exception as e:
             logger.error(f"Error computing rolling correlation: {e}")
             return []
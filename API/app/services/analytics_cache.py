@@ -0,0 +1,104 @@
+"""
+Versioned analytics result cache.
+
+GET /portfolios/{id}/analytics recomputed the whole result — price matrix,
+FX conversion, metrics, every chart series — on each dashboard load. The
+result only depends on:
+
+  • the holdings      portfolios.holdings_version, bumped in the same
+                      transaction as every position / transaction /
+                      portfolio-settings change (bump_holdings);
+  • the request       benchmark, start date, end date (today when omitted);
+  • the price data    the sum of latest_prices.data_version over the held
+                      symbols and the benchmark — ingestion increments that
+                      counter only for symbols whose bars or corporate
+                      actions changed — plus the row count / last date of
+                      the FX series involved.
+
+All of them go into the key, so an entry is never invalidated explicitly:
+a change to anything it depends on makes the next request compute a new
+key, and entries nothing points at any more age out of the shared cache
+(namespace "analytics", L1 + Redis). The watermark is read before the
+computation, so data arriving while it runs leaves the stored entry under an
+already obsolete key rather than a stale one under the current key.
+Results without a performance series (no prices yet) are not stored.
+"""
+
+import hashlib
+import logging
+from datetime import date
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.portfolio import Portfolio
+from app.services.cache import get_cache
+from app.services.fx import _pair, split_currency
+
+logger = logging.getLogger(__name__)
+
+_SYMBOLS_SQL = text("""
+    SELECT i.currency, COALESCE(lp.data_version, 0)
+    FROM instruments i
+    LEFT JOIN latest_prices lp ON lp.symbol = i.symbol
+    WHERE i.symbol = ANY(CAST(:symbols AS varchar[]))
+""")
+
+_FX_SQL = text("""
+    SELECT count(*), max(date) FROM fx_rates
+    WHERE pair = ANY(CAST(:pairs AS varchar[]))
+""")
+
+
+def bump_holdings(db: Session, portfolio_id: int) -> None:
+    """Advance the portfolio's holdings version in the caller's transaction (no commit)."""
+    db.query(Portfolio).filter(Portfolio.id == portfolio_id).update(
+        {Portfolio.holdings_version: Portfolio.holdings_version + 1}, synchronize_session=False
+    )
+
+
+def _watermark(db: Session, symbols: List[str], display_ccy: str) -> str:
+    rows = db.execute(_SYMBOLS_SQL, {"symbols": symbols}).fetchall()
+    prices = sum(int(version) for _, version in rows)
+    bases = {split_currency(ccy or "USD")[0] for ccy, _ in rows} | {split_currency(display_ccy)[0]}
+    pairs = sorted(_pair(b) for b in bases if b != "USD")
+    fx_rows, fx_last = db.execute(_FX_SQL, {"pairs": pairs}).one() if pairs else (0, None)
+    return f"{prices}.{fx_rows}.{fx_last or '-'}"
+
+
+def analytics_key(
+    db: Session,
+    portfolio: Portfolio,
+    benchmark: Optional[str] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+) -> Optional[str]:
+    """Cache key of this analytics request, or None when the cache is off or the watermark cannot be read."""
+    if settings.ANALYTICS_CACHE_MAX_VALUE_BYTES <= 0:
+        return None
+    bench = benchmark or portfolio.benchmark_symbol or "SPY"
+    symbols = sorted({p.instrument_symbol for p in portfolio.positions} | {bench})
+    display_ccy = (portfolio.currency or "USD").upper()
+    try:
+        watermark = _watermark(db, symbols, display_ccy)
+    except Exception as e:
+        db.rollback()
+        logger.warning(f"analytics cache: watermark unavailable for portfolio {portfolio.id}: {e}")
+        return None
+    request = f"{bench}|{start_date or 'auto'}|{end_date or date.today()}"
+    digest = hashlib.sha1(request.encode()).hexdigest()[:16]
+    return f"analytics:{portfolio.id}:{portfolio.holdings_version or 0}:{watermark}:{digest}"
+
+
+def get(key: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Cached result for `key` (a PortfolioAnalytics dump), or None."""
+    return get_cache().get(key) if key else None
+
+
+def put(key: Optional[str], result: Any) -> None:
+    """Store a PortfolioAnalytics result under `key` (skipped when it has no performance series)."""
+    if not key or not getattr(result, "performanceData", None):
+        return
+    get_cache().set(key, result.model_dump(), max_bytes=settings.ANALYTICS_CACHE_MAX_VALUE_BYTES)
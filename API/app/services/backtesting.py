@@ -18,6 +18,9 @@ from sqlalchemy.orm import Session
 from app.models.portfolio import Portfolio, Position
 from app.services.market_data import MarketDataService
 from app.services.analytics import AnalyticsService, _safe_float
+from app.services.price_matrix import PriceMatrixLoader
+from app.services.fx_conversion import convert_price_matrix, currency_attribution
+from app.services.trading_calendar import TradingCalendar, calendar_for_symbol
 
 logger = logging.getLogger(__name__)
 
@@ -30,6 +33,27 @@ REBALANCE_MAP = {
 }
 
 
+def _rebalance_dates(index: pd.DatetimeIndex, rule: str, calendar: TradingCalendar) -> set:
+    """
+    Rebalance on the last exchange session of each period, snapped back to
+    the last date present in `index`. Period-end labels from resample() are
+    calendar month/quarter ends and often fall on weekends or holidays.
+    """
+    if len(index) == 0:
+        return set()
+    last_available = index[-1].date()
+    out = set()
+    for period_end in index.to_series().resample(rule).last().index:
+        pe = period_end.date()
+        if pe > last_available:      # period still open at the end of the window
+            continue
+        session = pd.Timestamp(calendar.last_session_on_or_before(pe))
+        pos = index.searchsorted(session, side="right") - 1
+        if pos >= 0:
+            out.add(index[pos])
+    return out
+
+
 class BacktestingService:
     def __init__(self, db: Session):
         self.db = db
@@ -64,22 +88,10 @@ class BacktestingService:
         all_symbols = list(set(symbols + [benchmark_symbol]))
 
         # 2) Fetch price data ──────────────────────────────────────────
-        price_data: Dict[str, pd.Series] = {}
-        for sym in all_symbols:
-            try:
-                self.md.sync_instrument(sym)
-                history = self.md.get_price_history(sym, start_date, end_date)
-                if history:
-                    dates = [h.date for h in history]
-                    prices = [h.adjusted_close or h.close for h in history]
-                    s = pd.Series(data=prices, index=pd.to_datetime(dates))
-                    # Remove duplicate dates if any
-                    s = s[~s.index.duplicated(keep='first')]
-                    price_data[sym] = s
-            except Exception as e:
-                logger.warning(f"Backtest: could not fetch {sym}: {e}")
-
-        df = pd.DataFrame(price_data).ffill().dropna()
+        loaded = PriceMatrixLoader(self.db, self.md).load(
+            all_symbols, start_date, end_date, sync_instruments=True
+        )
+        df, inst_map = loaded["prices"], loaded["instruments"]
         if df.empty or len(df) < 5:
             return self._empty_result()
 
@@ -87,6 +99,18 @@ class BacktestingService:
         if not valid:
             return self._empty_result()
 
+        # Convert every listing to the portfolio currency (dated FX)
+        currencies = {s: (inst_map[s].currency if s in inst_map and inst_map[s].currency else "USD")
+                      for s in df.columns}
+        local_df = df
+        fx_factors = pd.DataFrame(1.0, index=df.index, columns=df.columns)
+        try:
+            converted = convert_price_matrix(self.db, df, currencies,
+                                             (portfolio.currency or "USD").upper(), self.md.provider)
+            df, fx_factors = converted["prices"], converted["fx"]
+        except Exception as e:
+            logger.warning(f"Backtest: FX conversion failed, using local-currency prices: {e}")
+
         # re-normalise weights to valid symbols
         total_w = sum(weights[s] for s in valid)
         if total_w <= 0:
@@ -98,7 +122,8 @@ class BacktestingService:
 
         # 3) Simulate ──────────────────────────────────────────────────
         rebal_rule = REBALANCE_MAP.get(rebalance_freq)
-        sim = self._simulate(returns, w, initial_capital, rebal_rule)
+        sim = self._simulate(returns, w, initial_capital, rebal_rule,
+                             calendar_for_symbol(benchmark_symbol))
 
         pf_values = sim["portfolio_values"]         # pd.Series
         pf_returns = sim["portfolio_returns"]        # pd.Series
@@ -214,6 +239,7 @@ class BacktestingService:
             })
         attribs.sort(key=lambda x: x["contribution"], reverse=True)
         result["positionAttribution"] = attribs
+        result["currencyAttribution"] = currency_attribution(local_df, fx_factors, currencies, valid)
 
         # -- trade log
         result["tradeLog"] = trade_log
@@ -248,6 +274,7 @@ class BacktestingService:
         target_weights: Dict[str, float],
         initial_capital: float,
         rebal_rule: Optional[str],
+        calendar: Optional[TradingCalendar] = None,
     ) -> Dict[str, Any]:
         """Walk-forward simulation with optional rebalance."""
         symbols = list(target_weights.keys())
@@ -261,7 +288,7 @@ class BacktestingService:
         weight_history: List[Dict[str, Any]] = []
 
         if rebal_rule:
-            rebal_dates = set(returns.resample(rebal_rule).last().index)
+            rebal_dates = _rebalance_dates(dates, rebal_rule, calendar or calendar_for_symbol(None))
         else:
             rebal_dates = set()
 
@@ -346,6 +373,7 @@ class BacktestingService:
                 "tradingDays": 0, "rebalanceEvents": 0,
             },
             "positionAttribution": [],
+            "currencyAttribution": [],
             "tradeLog": [],
             "weightHistory": [],
             "rollingVolatility": [],
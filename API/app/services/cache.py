@@ -0,0 +1,310 @@
+"""
+Two-tier market-data cache.
+
+  L1  in-process LRU (OrderedDict) with per-entry expiry and a byte budget.
+  L2  Redis (settings.MARKET_DATA_CACHE_URL, defaulting to REDIS_URL), shared
+      by every uvicorn worker and container.
+
+Keys are "<namespace>:<rest>" (e.g. "fx:EURUSD", "info:AAPL"); the namespace
+selects the TTL and is the unit the hit/miss counters are kept per. Redis
+keys are prefixed "axiome:md:" so the cache can share a database with other
+users. Values are stored as JSON, so only JSON-serialisable values (dicts,
+lists, str, numbers) should be cached.
+
+L1 entries live at most MARKET_DATA_CACHE_L1_TTL seconds even when their
+namespace TTL is longer, so a value rewritten by another worker converges
+quickly. If Redis is unreachable the cache degrades to L1 only and retries
+the connection after a short back-off.
+
+REDIS_URL="memory://" selects LocalRedis, an in-process stand-in with the
+subset of the redis-py API used here (get/set with ex/delete/scan_iter/flushdb).
+"""
+
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_KEY_PREFIX = "axiome:md:"
+_DEFAULT_NAMESPACE = "default"
+_L2_RETRY_AFTER = 30.0           # seconds to wait before retrying an unreachable Redis
+
+# Seconds each namespace stays valid
+NAMESPACE_TTLS: Dict[str, int] = {
+    "resolve": 24 * 3600,        # bare ticker + currency → listing symbol
+    "info": 6 * 3600,            # provider instrument metadata
+    "fx": 300,                   # spot FX rates
+    "splits": 24 * 3600,         # provider split history per symbol and day (corporate_actions.py)
+    "fxmatrix": 900,             # dated FX matrices for price conversion
+    "analytics": 6 * 3600,       # versioned analytics results (analytics_cache.py)
+    _DEFAULT_NAMESPACE: 300,
+}
+
+
+def _split_key(key: str) -> Tuple[str, str]:
+    ns, sep, _ = key.partition(":")
+    return (ns, key) if sep else (_DEFAULT_NAMESPACE, key)
+
+
+# ═══════════════════════════════════════════════════════════════
+#  Local Redis stand-in
+# ═══════════════════════════════════════════════════════════════
+class LocalRedis:
+    """In-process stand-in for redis.Redis (tests, single-process dev)."""
+
+    def __init__(self):
+        self._data: Dict[str, Tuple[Optional[float], bytes]] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs) -> "LocalRedis":
+        return cls()
+
+    def _live(self, key: str) -> Optional[bytes]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires is not None and expires <= time.monotonic():
+            del self._data[key]
+            return None
+        return value
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            return self._live(key)
+
+    def set(self, key: str, value: Any, ex: Optional[float] = None) -> bool:
+        if isinstance(value, str):
+            value = value.encode()
+        with self._lock:
+            self._data[key] = (time.monotonic() + ex if ex else None, value)
+        return True
+
+    def delete(self, *keys: str) -> int:
+        with self._lock:
+            return sum(1 for k in keys if self._data.pop(k, None) is not None)
+
+    def scan_iter(self, match: Optional[str] = None, count: Optional[int] = None):
+        prefix = match[:-1] if match and match.endswith("*") else match
+        with self._lock:
+            keys = [k for k in list(self._data) if self._live(k) is not None]
+        return iter(k for k in keys if prefix is None or k.startswith(prefix))
+
+    def flushdb(self) -> bool:
+        with self._lock:
+            self._data.clear()
+        return True
+
+    def ping(self) -> bool:
+        return True
+
+
+def _connect(url: str):
+    if url.startswith("memory://"):
+        return LocalRedis()
+    try:
+        import redis
+    except ImportError:
+        logger.warning("redis package not installed — market-data cache is process-local")
+        return None
+    return redis.Redis.from_url(url, socket_timeout=0.25, socket_connect_timeout=0.25)
+
+
+# ═══════════════════════════════════════════════════════════════
+#  Tiered cache
+# ═══════════════════════════════════════════════════════════════
+class TieredCache:
+    def __init__(
+        self,
+        client: Any = None,
+        l1_max_bytes: int = 16 * 1024 * 1024,
+        l1_ttl: float = 60.0,
+        max_value_bytes: int = 256 * 1024,
+        ttls: Optional[Dict[str, int]] = None,
+    ):
+        self.client = client
+        self.l1_max_bytes = l1_max_bytes
+        self.l1_ttl = l1_ttl
+        self.max_value_bytes = max_value_bytes
+        self.ttls = dict(NAMESPACE_TTLS, **(ttls or {}))
+        self._l1: "OrderedDict[str, Tuple[float, Any, int]]" = OrderedDict()
+        self._l1_bytes = 0
+        self._lock = threading.Lock()
+        self._l2_down_until = 0.0
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    # ── counters ──
+    def _count(self, ns: str, field: str, n: int = 1) -> None:
+        bucket = self._stats.setdefault(
+            ns, {"l1_hits": 0, "l2_hits": 0, "misses": 0, "sets": 0, "evictions": 0, "oversize": 0, "errors": 0}
+        )
+        bucket[field] += n
+
+    def stats(self) -> Dict[str, Any]:
+        """Per-namespace counters plus L1 occupancy."""
+        with self._lock:
+            namespaces = {ns: dict(c) for ns, c in self._stats.items()}
+            for c in namespaces.values():
+                lookups = c["l1_hits"] + c["l2_hits"] + c["misses"]
+                c["hit_rate"] = round((c["l1_hits"] + c["l2_hits"]) / lookups, 4) if lookups else 0.0
+            return {
+                "l1_entries": len(self._l1),
+                "l1_bytes": self._l1_bytes,
+                "l1_max_bytes": self.l1_max_bytes,
+                "l2": self._l2_available(),
+                "namespaces": namespaces,
+            }
+
+    # ── L1 ──
+    def _l1_get(self, key: str) -> Tuple[bool, Any]:
+        entry = self._l1.get(key)
+        if entry is None:
+            return False, None
+        expires, value, size = entry
+        if expires <= time.monotonic():
+            del self._l1[key]
+            self._l1_bytes -= size
+            return False, None
+        self._l1.move_to_end(key)
+        return True, value
+
+    def _l1_put(self, ns: str, key: str, value: Any, size: int, ttl: float) -> None:
+        old = self._l1.pop(key, None)
+        if old is not None:
+            self._l1_bytes -= old[2]
+        self._l1[key] = (time.monotonic() + min(ttl, self.l1_ttl), value, size)
+        self._l1_bytes += size
+        while self._l1_bytes > self.l1_max_bytes and self._l1:
+            evicted_key, (_, _, evicted_size) = self._l1.popitem(last=False)
+            self._l1_bytes -= evicted_size
+            self._count(_split_key(evicted_key)[0], "evictions")
+
+    # ── L2 ──
+    def _l2_available(self) -> bool:
+        return self.client is not None and time.monotonic() >= self._l2_down_until
+
+    def _l2_failed(self, ns: str, op: str, e: Exception) -> None:
+        with self._lock:
+            self._count(ns, "errors")
+            self._l2_down_until = time.monotonic() + _L2_RETRY_AFTER
+        logger.warning(f"cache L2 {op} failed, using L1 only for {_L2_RETRY_AFTER:.0f}s: {e}")
+
+    # ── public API ──
+    def get(self, key: str) -> Any:
+        """Cached value for `key`, or None on a miss."""
+        ns, _ = _split_key(key)
+        with self._lock:
+            hit, value = self._l1_get(key)
+            if hit:
+                self._count(ns, "l1_hits")
+                return value
+
+        raw = None
+        if self._l2_available():
+            try:
+                raw = self.client.get(_KEY_PREFIX + key)
+            except Exception as e:
+                self._l2_failed(ns, "get", e)
+        if raw is None:
+            with self._lock:
+                self._count(ns, "misses")
+            return None
+
+        try:
+            value = json.loads(raw)
+        except (TypeError, ValueError):
+            with self._lock:
+                self._count(ns, "misses")
+            return None
+        with self._lock:
+            self._count(ns, "l2_hits")
+            self._l1_put(ns, key, value, len(raw), self.ttls.get(ns, self.ttls[_DEFAULT_NAMESPACE]))
+        return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None, max_bytes: Optional[int] = None) -> None:
+        """Store `value` in both tiers (namespace TTL unless `ttl` is given, max_value_bytes unless `max_bytes` is)."""
+        ns, _ = _split_key(key)
+        ttl = ttl or self.ttls.get(ns, self.ttls[_DEFAULT_NAMESPACE])
+        try:
+            raw = json.dumps(value, default=str).encode()
+        except (TypeError, ValueError) as e:
+            logger.debug(f"cache: value for {key} is not serialisable: {e}")
+            return
+        with self._lock:
+            if len(raw) > (max_bytes or self.max_value_bytes):
+                self._count(ns, "oversize")
+                return
+            self._count(ns, "sets")
+            self._l1_put(ns, key, value, len(raw), ttl)
+
+        if self._l2_available():
+            try:
+                self.client.set(_KEY_PREFIX + key, raw, ex=int(max(1, ttl)))
+            except Exception as e:
+                self._l2_failed(ns, "set", e)
+
+    def delete(self, key: str) -> None:
+        ns, _ = _split_key(key)
+        with self._lock:
+            entry = self._l1.pop(key, None)
+            if entry is not None:
+                self._l1_bytes -= entry[2]
+        if self._l2_available():
+            try:
+                self.client.delete(_KEY_PREFIX + key)
+            except Exception as e:
+                self._l2_failed(ns, "delete", e)
+
+    def clear(self, namespace: Optional[str] = None) -> None:
+        """Drop every entry (or every entry of one namespace) from both tiers."""
+        prefix = f"{namespace}:" if namespace else ""
+        with self._lock:
+            for key in [k for k in self._l1 if k.startswith(prefix)]:
+                self._l1_bytes -= self._l1.pop(key)[2]
+        if self._l2_available():
+            try:
+                keys = list(self.client.scan_iter(match=f"{_KEY_PREFIX}{prefix}*", count=500))
+                if keys:
+                    self.client.delete(*keys)
+            except Exception as e:
+                self._l2_failed(namespace or _DEFAULT_NAMESPACE, "clear", e)
+
+
+# ────────────── process-wide cache ──────────────
+_cache: Optional[TieredCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> TieredCache:
+    """Return the shared cache configured from settings."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                url = settings.MARKET_DATA_CACHE_URL or settings.REDIS_URL
+                try:
+                    client = _connect(url) if url else None
+                except Exception as e:
+                    logger.warning(f"cache: cannot connect to {url}: {e}")
+                    client = None
+                _cache = TieredCache(
+                    client=client,
+                    l1_max_bytes=settings.MARKET_DATA_CACHE_L1_MAX_BYTES,
+                    l1_ttl=settings.MARKET_DATA_CACHE_L1_TTL,
+                    max_value_bytes=settings.MARKET_DATA_CACHE_MAX_VALUE_BYTES,
+                )
+    return _cache
+
+
+def set_cache(cache: Optional[TieredCache]) -> None:
+    """Swap the process-wide cache (tests: TieredCache(client=LocalRedis()))."""
+    global _cache
+    with _cache_lock:
+        _cache = cache
@@ -0,0 +1,266 @@
+"""
+Corporate actions: splits and dividends as a sparse factor table.
+
+price_history holds closes on one fixed basis — as traded, unadjusted — and
+corporate_actions one row per (symbol, ex_date, kind):
+
+    split     amount = ratio (4.0 for a 4-for-1)   factor = 1 / ratio
+    dividend  amount = cash per share              factor = 1 − amount / previous close
+
+Adjusted series are derived on read (adjust_frame): the bar on day t is
+multiplied by the product of the factors of every action with ex_date > t,
+i.e. one searchsorted into the symbol's action dates and a reversed
+cumulative product, for the whole dates × symbols matrix at once.
+
+    "raw"     stored closes as traded
+    "split"   splits only — prices comparable across splits, as a quote shows them
+    "total"   splits and dividends — total return with dividends reinvested
+
+A new split or dividend is therefore one row insert: no stored bar changes,
+and the raw matrices cached above price_history (mmap price store, matrix
+cache, shared segments) stay valid.
+
+Providers report bars already adjusted for every split up to the fetch
+(Yahoo's Close), including splits after the window that was asked for, so
+ingestion first un-splits each fetched frame with the splits after each bar:
+the ones in the fetched frames, the ones already recorded, and — for frames
+ending before today — the provider's split history from the frame's end
+through today (later_splits; one call per symbol and day, cached in the
+"splits" namespace). Bars ingested before this table existed hold the
+provider's adjustment as of their download (those rows still have
+adjusted_close set); ingestion re-downloads them as traded the first time it
+fetches their symbol (market_data._fetch_and_ingest).
+"""
+
+import logging
+from datetime import date, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.services.cache import get_cache
+from app.services.price_store import _day
+
+logger = logging.getLogger(__name__)
+
+ADJUSTMENTS = ("raw", "split", "total")
+_KINDS = {"raw": (), "split": ("split",), "total": ("split", "dividend")}
+
+# provider frame column → action kind
+_ACTION_COLUMNS = {"Stock Splits": "split", "Dividends": "dividend"}
+_PRICE_COLUMNS = ("Open", "High", "Low", "Close", "Adj Close")
+
+Actions = Dict[str, List[Tuple[Any, str, float]]]          # symbol → [(ex_date, kind, amount)]
+Factors = Dict[str, Tuple[np.ndarray, np.ndarray]]          # symbol → (ex days, factors), sorted
+
+# Dividend factors need the close before the ex-date on the same basis as the
+# amount: run after the bars are upserted, in the same transaction.
+_RECORD_SQL = text("""
+    INSERT INTO corporate_actions (symbol, ex_date, kind, amount, factor)
+    SELECT a.s, a.d, a.k, a.amt,
+           CASE WHEN a.k = 'split' THEN 1.0 / a.amt
+                WHEN prev.close > a.amt THEN 1.0 - a.amt / prev.close
+           END
+    FROM unnest(
+        CAST(:symbols AS varchar[]), CAST(:dates AS date[]),
+        CAST(:kinds AS varchar[]), CAST(:amounts AS float8[])
+    ) AS a(s, d, k, amt)
+    JOIN instruments i ON i.symbol = a.s
+    LEFT JOIN LATERAL (
+        SELECT p.close FROM price_history p
+        WHERE p.instrument_id = i.id AND p.date < a.d AND p.close > 0
+        ORDER BY p.date DESC
+        LIMIT 1
+    ) prev ON true
+    ON CONFLICT (symbol, ex_date, kind) DO UPDATE SET
+        amount = excluded.amount,
+        factor = excluded.factor
+    WHERE (corporate_actions.amount, corporate_actions.factor)
+          IS DISTINCT FROM (excluded.amount, excluded.factor)
+    RETURNING symbol
+""")
+
+_FACTORS_SQL = text("""
+    SELECT symbol, ex_date, factor FROM corporate_actions
+    WHERE symbol = ANY(CAST(:symbols AS varchar[]))
+      AND kind = ANY(CAST(:kinds AS varchar[]))
+      AND factor > 0
+    ORDER BY symbol, ex_date
+""")
+
+
+def _suffix_product(ex_days: np.ndarray, factors: np.ndarray, days: np.ndarray) -> np.ndarray:
+    """Π factors[k] over ex_days[k] > day, for every day (ex_days sorted)."""
+    suffix = np.append(np.cumprod(factors[::-1])[::-1], 1.0)
+    return suffix[np.searchsorted(ex_days, days, side="right")]
+
+
+def _group(rows: Iterable[Tuple[str, Any, float]]) -> Factors:
+    out: Dict[str, Tuple[List[int], List[float]]] = {}
+    for sym, d, f in rows:
+        days, values = out.setdefault(sym, ([], []))
+        days.append(_day(d))
+        values.append(float(f))
+    return {s: (np.asarray(d, dtype=np.int64), np.asarray(v)) for s, (d, v) in out.items()}
+
+
+# ────────────── ingestion ──────────────
+def extract_actions(frames: Dict[str, Any]) -> Actions:
+    """Non-zero "Stock Splits" / "Dividends" cells of provider frames → {symbol: [(ex_date, kind, amount)]}."""
+    actions: Actions = {}
+    for sym, df in frames.items():
+        if df is None or df.empty:
+            continue
+        dates = pd.DatetimeIndex(df.index).normalize().date
+        for column, kind in _ACTION_COLUMNS.items():
+            if column not in df.columns:
+                continue
+            amounts = pd.to_numeric(df[column], errors="coerce").to_numpy(dtype=float)
+            for i in np.flatnonzero(amounts > 0):
+                actions.setdefault(sym, []).append((dates[i], kind, float(amounts[i])))
+    return actions
+
+
+def _provider_splits(provider: Any, symbol: str, start: date, today: date) -> List[Tuple[date, float]]:
+    """Provider splits of `symbol` from `start` through `today`, reusing today's cached lookup when it reaches back far enough."""
+    key = f"splits:{symbol}:{today.isoformat()}"
+    cached = get_cache().get(key)
+    if cached and date.fromisoformat(cached["start"]) <= start:
+        found = [(date.fromisoformat(d), float(r)) for d, r in cached["splits"]]
+    else:
+        found = provider.splits(symbol, start)
+        get_cache().set(key, {"start": start.isoformat(), "splits": [[d.isoformat(), r] for d, r in found]})
+    return [(d, r) for d, r in found if start <= d <= today]
+
+
+def later_splits(
+    provider: Any, frames: Dict[str, Any], today: Optional[date] = None,
+) -> Tuple[Actions, List[str]]:
+    """
+    Splits after the last bar of each frame, through today: the provider
+    adjusted the frame for them, but they are not in it. Returns (actions,
+    symbols whose lookup failed) — the caller must not store those frames,
+    their basis is unknown.
+    """
+    today = today or date.today()
+    actions: Actions = {}
+    failed: List[str] = []
+    for sym, df in frames.items():
+        if df is None or df.empty:
+            continue
+        last = pd.DatetimeIndex(df.index).normalize().max().date()
+        if last >= today:
+            continue
+        try:
+            found = _provider_splits(provider, sym, last + timedelta(days=1), today)
+        except Exception as e:
+            logger.warning(f"Corporate actions: split lookup failed for {sym}: {e}")
+            failed.append(sym)
+            continue
+        if found:
+            actions[sym] = [(d, "split", ratio) for d, ratio in found]
+    return actions, failed
+
+
+def merge_actions(actions: Actions, more: Actions) -> Actions:
+    """`actions` plus `more`, one entry per (symbol, ex_date, kind) (`actions` wins)."""
+    out: Actions = {sym: list(acts) for sym, acts in actions.items()}
+    for sym, acts in more.items():
+        seen = {(d, kind) for d, kind, _ in out.get(sym, ())}
+        out.setdefault(sym, []).extend(a for a in acts if (a[0], a[1]) not in seen)
+    return out
+
+
+def load_factors(db: Session, symbols: Sequence[str], adjust: str = "total") -> Factors:
+    """{symbol: (ex days, factors)} of the actions `adjust` applies, one query (symbols without any omitted)."""
+    kinds = _KINDS[adjust]
+    if not symbols or not kinds:
+        return {}
+    return _group(db.execute(_FACTORS_SQL, {"symbols": list(symbols), "kinds": list(kinds)}))
+
+
+def split_factors(db: Session, symbols: Sequence[str], actions: Actions) -> Factors:
+    """Split factors of `symbols`: the recorded ones (one query) merged with the splits in `actions`."""
+    splits = load_factors(db, list(symbols), "split")
+    for sym, acts in actions.items():
+        fresh = [(_day(d), 1.0 / amount) for d, kind, amount in acts if kind == "split"]
+        if fresh:
+            known = dict(zip(*splits.get(sym, ((), ()))))
+            known.update(fresh)
+            days = np.asarray(sorted(known), dtype=np.int64)
+            splits[sym] = (days, np.asarray([known[d] for d in days]))
+    return splits
+
+
+def unsplit_frames(db: Session, frames: Dict[str, Any], actions: Actions) -> Tuple[Dict[str, Any], Actions]:
+    """
+    Provider frames / actions → the stored basis: prices × (product of the
+    ratios of later splits), volumes ÷ the same, dividend amounts likewise.
+    Splits come from the frames themselves and from the table (one query).
+    Frames of symbols without a later split are returned unchanged.
+    """
+    splits = split_factors(db, list(frames), actions)
+    out_frames: Dict[str, Any] = dict(frames)
+    out_actions: Actions = dict(actions)
+    for sym, (ex_days, factors) in splits.items():
+        df = frames.get(sym)
+        if df is not None and not df.empty:
+            days = pd.DatetimeIndex(df.index).normalize().values.astype("datetime64[D]").astype(np.int64)
+            mult = 1.0 / _suffix_product(ex_days, factors, days)          # later split ratios
+            if (mult != 1.0).any():
+                df = df.copy()
+                for column in _PRICE_COLUMNS + ("Dividends",):
+                    if column in df.columns:
+                        df[column] = pd.to_numeric(df[column], errors="coerce") * mult
+                if "Volume" in df.columns:
+                    df["Volume"] = pd.to_numeric(df["Volume"], errors="coerce") / mult
+                out_frames[sym] = df
+        if sym in actions:
+            out_actions[sym] = [
+                (d, kind, amount / _suffix_product(ex_days, factors, np.asarray([_day(d)]))[0]
+                 if kind == "dividend" else amount)
+                for d, kind, amount in actions[sym]
+            ]
+    return out_frames, out_actions
+
+
+def record_actions(db: Session, actions: Actions) -> List[str]:
+    """
+    Upsert actions in the caller's transaction (no commit), after the bars
+    they refer to. Returns the symbols whose actions are new or changed.
+    """
+    rows = [(sym, d, kind, amount) for sym, acts in actions.items() for d, kind, amount in acts]
+    if not rows:
+        return []
+    symbols, dates, kinds, amounts = (list(c) for c in zip(*rows))
+    changed = db.execute(_RECORD_SQL, {
+        "symbols": symbols, "dates": dates, "kinds": kinds, "amounts": amounts,
+    }).fetchall()
+    if changed:
+        logger.info(f"Corporate actions: {len(changed)} recorded for {len({r[0] for r in changed})} symbols")
+    return sorted({r[0] for r in changed})
+
+
+# ────────────── reads ──────────────
+def adjust_frame(frame: pd.DataFrame, factors: Factors) -> pd.DataFrame:
+    """Raw dates × symbols closes → adjusted (columns without actions untouched)."""
+    cols = [j for j, s in enumerate(frame.columns) if s in factors]
+    if frame.empty or not cols:
+        return frame
+    days = frame.index.values.astype("datetime64[D]").astype(np.int64)
+    values = frame.to_numpy(dtype=np.float64, copy=True)
+    for j in cols:
+        values[:, j] *= _suffix_product(*factors[frame.columns[j]], days)
+    return pd.DataFrame(values, index=frame.index, columns=frame.columns)
+
+
+def adjusted(db: Session, frame: pd.DataFrame, adjust: str = "total") -> pd.DataFrame:
+    """`frame` of raw closes adjusted for the actions recorded for its columns."""
+    if adjust not in ADJUSTMENTS:
+        raise ValueError(f"unknown price adjustment {adjust!r} (expected one of {', '.join(ADJUSTMENTS)})")
+    if adjust == "raw" or frame.empty:
+        return frame
+    return adjust_frame(frame, load_factors(db, list(frame.columns), adjust))
@@ -0,0 +1,373 @@
+"""
+Outbound fetch scheduler.
+
+Every call to the upstream market-data provider is queued here instead of
+sleeping on the request thread:
+
+  • One token bucket budgets provider calls for ALL uvicorn workers. The
+    bucket state lives in a lock-protected file (single host) or in the
+    `rate_limit_buckets` table (several hosts), so N workers share one
+    request rate instead of N independent ones.
+  • history()/quotes() requests with the same arguments that arrive within a
+    short window are merged into multi-symbol provider calls of at most
+    `max_batch` symbols each. Single-symbol history() requests stay on their
+    own when the provider's multi-symbol path swallows HTTP errors
+    (batch_history_raises = False), so a 429 still reaches the backoff.
+  • Provider calls run concurrently on a small thread pool; request threads
+    just wait on a Future for their slice of the result.
+"""
+
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import date
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+from sqlalchemy import text
+
+from app.core.config import settings
+from app.services.providers import MarketDataProvider
+
+try:
+    import fcntl
+except ImportError:  # Windows dev boxes: fall back to an in-process bucket
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+def is_throttled(exc: Exception) -> bool:
+    """The provider answered 429 / rate limited (the error types differ between yfinance versions)."""
+    err = str(exc).lower()
+    return "429" in err or "too many requests" in err or "rate limit" in err
+
+
+# ═══════════════════════════════════════════════════════════════
+#  Token buckets
+# ═══════════════════════════════════════════════════════════════
+class TokenBucket:
+    """Blocking token bucket: `rate` tokens/second, at most `capacity` banked."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = max(capacity, 1.0)
+
+    def _take(self) -> float:
+        """Try to take one token. Returns 0 on success, else seconds to wait."""
+        raise NotImplementedError
+
+    def drain(self, seconds: float) -> None:
+        """Empty the bucket and push it `seconds` into debt (upstream said 429)."""
+        raise NotImplementedError
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            wait = self._take()
+            if wait <= 0:
+                return True
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            time.sleep(min(wait, 1.0))
+
+    @staticmethod
+    def _refill(tokens: float, updated_at: float, now: float, rate: float, capacity: float) -> float:
+        return min(capacity, tokens + max(now - updated_at, 0.0) * rate)
+
+
+class LocalTokenBucket(TokenBucket):
+    """In-process bucket (tests, single worker, or no shared backend available)."""
+
+    def __init__(self, rate: float, capacity: float):
+        super().__init__(rate, capacity)
+        self._lock = threading.Lock()
+        self._tokens = self.capacity
+        self._updated_at = time.time()
+
+    def _take(self) -> float:
+        with self._lock:
+            now = time.time()
+            self._tokens = self._refill(self._tokens, self._updated_at, now, self.rate, self.capacity)
+            self._updated_at = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def drain(self, seconds: float) -> None:
+        with self._lock:
+            self._tokens = -self.rate * seconds
+            self._updated_at = time.time()
+
+
+class FileTokenBucket(TokenBucket):
+    """Bucket state in a small JSON file guarded by flock — shared by every process on the host."""
+
+    def __init__(self, path: str, rate: float, capacity: float):
+        super().__init__(rate, capacity)
+        self.path = path
+        self._local = threading.Lock()  # flock is per-process; serialise our own threads first
+
+    def _update(self, fn: Callable[[float, float, float], Tuple[float, float]]) -> float:
+        with self._local:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o666)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                raw = os.read(fd, 4096)
+                now = time.time()
+                try:
+                    state = json.loads(raw) if raw else {}
+                    tokens = float(state["tokens"])
+                    updated_at = float(state["updated_at"])
+                except (ValueError, KeyError, TypeError):
+                    tokens, updated_at = self.capacity, now
+                tokens, wait = fn(tokens, updated_at, now)
+                payload = json.dumps({"tokens": tokens, "updated_at": now}).encode()
+                os.lseek(fd, 0, os.SEEK_SET)
+                os.ftruncate(fd, 0)
+                os.write(fd, payload)
+                return wait
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+                os.close(fd)
+
+    def _take(self) -> float:
+        def take(tokens: float, updated_at: float, now: float) -> Tuple[float, float]:
+            tokens = self._refill(tokens, updated_at, now, self.rate, self.capacity)
+            if tokens >= 1:
+                return tokens - 1, 0.0
+            return tokens, (1 - tokens) / self.rate
+        return self._update(take)
+
+    def drain(self, seconds: float) -> None:
+        self._update(lambda tokens, updated_at, now: (-self.rate * seconds, 0.0))
+
+
+class PostgresTokenBucket(TokenBucket):
+    """
+    Bucket row in `rate_limit_buckets`, refilled and decremented by a single
+    atomic UPDATE. Uses the database clock so hosts with skewed clocks agree.
+    """
+
+    _NOW = "extract(epoch from clock_timestamp())"
+
+    def __init__(self, engine, name: str, rate: float, capacity: float):
+        super().__init__(rate, capacity)
+        self.engine = engine
+        self.name = name
+        with self.engine.begin() as conn:
+            conn.execute(
+                text(
+                    "INSERT INTO rate_limit_buckets (name, tokens, updated_at) "
+                    f"VALUES (:name, :cap, {self._NOW}) ON CONFLICT (name) DO NOTHING"
+                ),
+                {"name": name, "cap": self.capacity},
+            )
+
+    def _take(self) -> float:
+        refill = f"LEAST(:cap, tokens + GREATEST({self._NOW} - updated_at, 0) * :rate)"
+        params = {"name": self.name, "cap": self.capacity, "rate": self.rate}
+        with self.engine.begin() as conn:
+            row = conn.execute(
+                text(
+                    f"UPDATE rate_limit_buckets SET tokens = {refill} - 1, updated_at = {self._NOW} "
+                    f"WHERE name = :name AND {refill} >= 1 RETURNING tokens"
+                ),
+                params,
+            ).first()
+            if row is not None:
+                return 0.0
+            current = conn.execute(
+                text(f"SELECT {refill} FROM rate_limit_buckets WHERE name = :name"), params
+            ).scalar()
+        return (1 - float(current or 0)) / self.rate
+
+    def drain(self, seconds: float) -> None:
+        with self.engine.begin() as conn:
+            conn.execute(
+                text(f"UPDATE rate_limit_buckets SET tokens = :debt, updated_at = {self._NOW} WHERE name = :name"),
+                {"name": self.name, "debt": -self.rate * seconds},
+            )
+
+
+def build_bucket(backend: str) -> TokenBucket:
+    """Build the shared bucket named by settings.MARKET_DATA_RATE_LIMIT_BACKEND."""
+    rate = settings.MARKET_DATA_RATE_PER_SEC
+    burst = settings.MARKET_DATA_RATE_BURST
+    backend = (backend or "file").lower().strip()
+    if backend == "postgres":
+        try:
+            from app.db.session import engine
+            return PostgresTokenBucket(engine, "yfinance", rate, burst)
+        except Exception as e:
+            logger.warning(f"Postgres rate-limit bucket unavailable ({e}), falling back to file lock")
+            backend = "file"
+    if backend == "file" and fcntl is not None:
+        path = settings.MARKET_DATA_RATE_LIMIT_FILE or os.path.join(
+            tempfile.gettempdir(), "axiome_yfinance_bucket.json"
+        )
+        return FileTokenBucket(path, rate, burst)
+    return LocalTokenBucket(rate, burst)
+
+
+# ═══════════════════════════════════════════════════════════════
+#  Scheduler
+# ═══════════════════════════════════════════════════════════════
+_BATCHABLE = {"history", "quotes"}
+
+
+class _Batch:
+    __slots__ = ("method", "args", "symbols", "waiters", "created")
+
+    def __init__(self, method: str, args: Tuple):
+        self.method = method
+        self.args = args
+        self.symbols: List[str] = []
+        self.waiters: List[Tuple[Future, List[str]]] = []
+        self.created = time.monotonic()
+
+
+class FetchScheduler:
+    """
+    Queues provider calls, merges compatible multi-symbol requests and runs
+    them on a thread pool under a shared token bucket.
+    """
+
+    def __init__(
+        self,
+        provider: MarketDataProvider,
+        bucket: TokenBucket,
+        workers: int = 4,
+        batch_window: float = 0.025,
+        max_batch: int = 50,
+        throttle_backoff: float = 5.0,
+    ):
+        self.provider = provider
+        self.bucket = bucket
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.throttle_backoff = throttle_backoff
+        self._merge_history = getattr(provider, "batch_history_raises", True)
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="md-fetch")
+        self._pending: Dict[Tuple, _Batch] = {}
+        self._cond = threading.Condition()
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, name="md-dispatch", daemon=True)
+        self._dispatcher.start()
+
+    # ── public ──
+    def submit(self, method: str, *args, symbols: Optional[List[str]] = None) -> Future:
+        """Queue `provider.<method>(...)`. Batchable methods take `symbols` separately."""
+        if method not in _BATCHABLE:
+            return self._pool.submit(self._call, method, args)
+
+        fut: Future = Future()
+        wanted = list(dict.fromkeys(symbols or []))
+        if not wanted:
+            fut.set_result({})
+            return fut
+        if method == "history" and len(wanted) == 1 and not self._merge_history:
+            return self._pool.submit(self._call, method, (wanted, *args))
+        key = (method, args)
+        with self._cond:
+            batch = self._pending.get(key)
+            if batch is None:
+                batch = self._pending[key] = _Batch(method, args)
+            for sym in wanted:
+                if sym not in batch.symbols:
+                    batch.symbols.append(sym)
+            batch.waiters.append((fut, wanted))
+            self._cond.notify()
+        return fut
+
+    # ── internals ──
+    def _call(self, method: str, args: Tuple) -> Any:
+        self.bucket.acquire()
+        try:
+            return getattr(self.provider, method)(*args)
+        except Exception as e:
+            if is_throttled(e):
+                logger.warning(f"Provider throttled on {method}; backing off all workers")
+                self.bucket.drain(self.throttle_backoff)
+            raise
+
+    def _run_batch(self, batch: _Batch) -> None:
+        # One provider call per max_batch symbols; a waiter fails only if one of its chunks did
+        result: Dict[str, Any] = {}
+        failed: Dict[str, Exception] = {}
+        for i in range(0, len(batch.symbols), self.max_batch):
+            chunk = batch.symbols[i:i + self.max_batch]
+            try:
+                if batch.method == "history":
+                    result.update(self._call("history", (chunk, *batch.args)))
+                else:
+                    result.update(self._call("quotes", (chunk,)))
+            except Exception as e:
+                failed.update(dict.fromkeys(chunk, e))
+        for fut, wanted in batch.waiters:
+            error = next((failed[s] for s in wanted if s in failed), None)
+            if error is not None:
+                fut.set_exception(error)
+            else:
+                fut.set_result({s: result[s] for s in wanted if s in result})
+
+    def _dispatch_loop(self) -> None:
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                now = time.monotonic()
+                ready = [
+                    k for k, b in self._pending.items()
+                    if now - b.created >= self.batch_window or len(b.symbols) >= self.max_batch
+                ]
+                if not ready:
+                    oldest = min(b.created for b in self._pending.values())
+                    self._cond.wait(max(self.batch_window - (now - oldest), 0.001))
+                    continue
+                batches = [self._pending.pop(k) for k in ready]
+            for batch in batches:
+                self._pool.submit(self._run_batch, batch)
+
+
+class ScheduledProvider(MarketDataProvider):
+    """MarketDataProvider facade that routes every call through a FetchScheduler."""
+
+    def __init__(self, scheduler: FetchScheduler, timeout: Optional[float] = None):
+        self.scheduler = scheduler
+        self.timeout = timeout
+        self.name = scheduler.provider.name
+        self.record = getattr(scheduler.provider, "record", False)
+
+    def history(self, symbols: List[str], start: date, end: date) -> Dict[str, pd.DataFrame]:
+        return self.scheduler.submit("history", start, end, symbols=symbols).result(self.timeout)
+
+    def splits(self, symbol: str, start: date) -> List[Tuple[date, float]]:
+        return self.scheduler.submit("splits", symbol, start).result(self.timeout)
+
+    def quotes(self, symbols: List[str]) -> Dict[str, float]:
+        return self.scheduler.submit("quotes", symbols=symbols).result(self.timeout)
+
+    def info(self, symbol: str) -> Dict[str, Any]:
+        return self.scheduler.submit("info", symbol).result(self.timeout)
+
+    def search(self, query: str, max_results: int = 10) -> List[Dict[str, Any]]:
+        return self.scheduler.submit("search", query, max_results).result(self.timeout)
+
+    def fx_rate(self, from_ccy: str, to_ccy: str) -> Optional[float]:
+        return self.scheduler.submit("fx_rate", from_ccy, to_ccy).result(self.timeout)
+
+
+def schedule(provider: MarketDataProvider) -> ScheduledProvider:
+    """Wrap a network-bound provider in the shared scheduler configured by settings."""
+    scheduler = FetchScheduler(
+        provider,
+        build_bucket(settings.MARKET_DATA_RATE_LIMIT_BACKEND),
+        workers=settings.MARKET_DATA_FETCH_WORKERS,
+        batch_window=settings.MARKET_DATA_BATCH_WINDOW_MS / 1000.0,
+    )
+    return ScheduledProvider(scheduler, timeout=settings.MARKET_DATA_FETCH_TIMEOUT)
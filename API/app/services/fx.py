@@ -0,0 +1,223 @@
+"""
+FX rate store.
+
+`fx_rates` holds one daily series per currency, always quoted against USD
+(pair "EURUSD": 1 EUR = rate USD). Any cross rate is triangulated:
+
+    rate(A → B) = AUSD / BUSD          (USDUSD = 1)
+
+so N currencies need N series instead of N² pairs. Missing or stale series
+are filled by ONE batched provider.history() call over all "XXXUSD=X"
+tickers, written with a single INSERT … SELECT FROM unnest(…).
+
+Sub-unit quotes (GBp, ZAc, ILA) are converted through their parent currency.
+"""
+
+import logging
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.services.cache import get_cache
+from app.services.providers import MarketDataProvider, get_provider
+from app.services.trading_calendar import get_calendar
+
+logger = logging.getLogger(__name__)
+
+_USD = "USD"
+_SPOT_LOOKBACK = timedelta(days=10)      # history fetched for a pair first seen via spot lookups
+_EARLY_SLACK = timedelta(days=5)
+
+# Yahoo quotes some listings in minor units
+_SUBUNITS: Dict[str, Tuple[str, float]] = {
+    "GBp": ("GBP", 0.01),
+    "GBX": ("GBP", 0.01),
+    "ZAc": ("ZAR", 0.01),
+    "ZAC": ("ZAR", 0.01),
+    "ILA": ("ILS", 0.01),
+}
+
+_UPSERT_FX_SQL = text("""
+    INSERT INTO fx_rates (pair, date, rate)
+    SELECT p, d, r
+    FROM unnest(CAST(:pairs AS varchar[]), CAST(:dates AS date[]), CAST(:rates AS float8[])) AS t(p, d, r)
+    ON CONFLICT (pair, date) DO UPDATE SET rate = excluded.rate
+    WHERE fx_rates.rate IS DISTINCT FROM excluded.rate
+""")
+
+_LATEST_SQL = text("""
+    SELECT DISTINCT ON (pair) pair, date, rate
+    FROM fx_rates
+    WHERE pair = ANY(:pairs) AND date <= :on_date
+    ORDER BY pair, date DESC
+""")
+
+_RANGE_SQL = text("""
+    SELECT pair, MIN(date), MAX(date) FROM fx_rates
+    WHERE pair = ANY(:pairs) GROUP BY pair
+""")
+
+
+def split_currency(ccy: str) -> Tuple[str, float]:
+    """'GBp' → ('GBP', 0.01); 'eur' → ('EUR', 1.0)."""
+    ccy = (ccy or _USD).strip()
+    if ccy in _SUBUNITS:
+        return _SUBUNITS[ccy]
+    return ccy.upper(), 1.0
+
+
+def _pair(ccy: str) -> str:
+    return f"{ccy}{_USD}"
+
+
+def _ticker(ccy: str) -> str:
+    return f"{ccy}{_USD}=X"
+
+
+class FxService:
+    def __init__(self, db: Session, provider: Optional[MarketDataProvider] = None):
+        self.db = db
+        self.provider = provider or get_provider()
+        self.calendar = get_calendar("WEEKDAYS")
+
+    # ──────────────────── SPOT (latest on or before a date) ────────────────────
+
+    def rates_on(self, currencies: Iterable[str], target_ccy: str, on_date: Optional[date] = None) -> Dict[str, float]:
+        """
+        {currency: rate to target_ccy} using the latest stored close on or
+        before `on_date` (default today). One query when the store is fresh;
+        stale or unknown series are fetched in one batch and re-read.
+        Currencies with no rate available are omitted.
+        """
+        on_date = on_date or date.today()
+        currencies = {c.strip() for c in currencies if c and c.strip()}
+        target_base, target_factor = split_currency(target_ccy)
+        bases = {split_currency(c)[0] for c in currencies} | {target_base}
+        bases.discard(_USD)
+
+        latest = self._latest(bases, on_date)
+        expected = self.calendar.last_session_on_or_before(min(on_date, date.today()))
+        stale = [b for b in bases if b not in latest or latest[b][0] < expected]
+        stale = [b for b in stale if not self._recently_fetched(b, expected)]
+        if stale:
+            starts = {b: (latest[b][0] + timedelta(days=1)) if b in latest else on_date - _SPOT_LOOKBACK for b in stale}
+            if self._fetch(starts, min(on_date, date.today()), mark=expected):
+                latest.update(self._latest(stale, on_date))
+
+        usd = {b: rate for b, (_, rate) in latest.items()}
+        usd[_USD] = 1.0
+        if target_base not in usd:
+            return {}
+        target_usd = usd[target_base] * target_factor
+        out: Dict[str, float] = {}
+        for ccy in currencies:
+            base, factor = split_currency(ccy)
+            if base in usd:
+                out[ccy] = usd[base] * factor / target_usd
+        return out
+
+    # ──────────────────── HISTORICAL SERIES ────────────────────
+
+    def usd_series(self, currencies: Iterable[str], start: date, end: date) -> pd.DataFrame:
+        """
+        Daily XXX→USD rates for every (base) currency in [start, end]:
+        DataFrame indexed by date with one column per base currency (USD = 1),
+        forward-filled across days a series has no print.
+        """
+        bases = sorted({split_currency(c)[0] for c in currencies} - {_USD})
+        self.ensure_history(bases, start, end)
+
+        frame = pd.DataFrame(index=pd.DatetimeIndex([]))
+        if bases:
+            # start a week early so the first day has a value to forward-fill from
+            rows = self.db.execute(
+                text("SELECT pair, date, rate FROM fx_rates WHERE pair = ANY(:pairs) "
+                     "AND date BETWEEN :lo AND :hi ORDER BY date"),
+                {"pairs": [_pair(b) for b in bases], "lo": start - timedelta(days=7), "hi": end},
+            ).fetchall()
+            if rows:
+                raw = pd.DataFrame(rows, columns=["pair", "date", "rate"])
+                raw["date"] = pd.to_datetime(raw["date"])
+                frame = raw.pivot(index="date", columns="pair", values="rate")
+                frame.columns = [c[: -len(_USD)] for c in frame.columns]
+        frame[_USD] = 1.0
+        frame = frame.sort_index().ffill()
+        return frame[frame.index >= pd.Timestamp(start)] if len(frame) else frame
+
+    def ensure_history(self, bases: List[str], start: date, end: date) -> None:
+        """Make sure every base currency's USD series covers [start, end]."""
+        bases = [b for b in bases if b != _USD]
+        if not bases:
+            return
+        rows = self.db.execute(_RANGE_SQL, {"pairs": [_pair(b) for b in bases]}).fetchall()
+        have = {pair[: -len(_USD)]: (lo, hi) for pair, lo, hi in rows}
+        expected = self.calendar.last_session_on_or_before(min(end, date.today()))
+        starts: Dict[str, date] = {}
+        for b in bases:
+            lo_hi = have.get(b)
+            if self._recently_fetched(b, expected):
+                continue
+            if lo_hi is None or lo_hi[0] > start + _EARLY_SLACK:
+                starts[b] = start
+            elif lo_hi[1] < expected:
+                starts[b] = lo_hi[1] + timedelta(days=1)
+        if starts:
+            self._fetch(starts, min(end, date.today()), mark=expected)
+
+    # ──────────────────── INTERNALS ────────────────────
+
+    def _latest(self, bases: Iterable[str], on_date: date) -> Dict[str, Tuple[date, float]]:
+        pairs = [_pair(b) for b in bases]
+        if not pairs:
+            return {}
+        rows = self.db.execute(_LATEST_SQL, {"pairs": pairs, "on_date": on_date}).fetchall()
+        return {pair[: -len(_USD)]: (d, float(rate)) for pair, d, rate in rows}
+
+    @staticmethod
+    def _recently_fetched(base: str, through: date) -> bool:
+        return get_cache().get(f"fx:fetched:{base}") == through.isoformat()
+
+    def _fetch(self, starts: Dict[str, date], end: date, mark: date) -> bool:
+        """
+        One provider call for all `starts` (from the earliest start) and one
+        upsert. Returns False if the provider failed.
+        """
+        tickers = {_ticker(b): b for b in starts}
+        fetch_start = min(starts.values())
+        try:
+            frames = self.provider.history(list(tickers), fetch_start, end + timedelta(days=1))
+        except Exception as e:
+            logger.warning(f"FX history download failed for {sorted(starts)}: {e}")
+            return False
+
+        pairs: List[str] = []
+        dates: List[date] = []
+        rates: List[float] = []
+        for ticker, df in frames.items():
+            base = tickers.get(ticker)
+            if base is None or df is None or df.empty or "Close" not in df.columns:
+                continue
+            closes = pd.to_numeric(df["Close"], errors="coerce").to_numpy(dtype=float)
+            idx = pd.DatetimeIndex(df.index).normalize()
+            keep = ~np.isnan(closes) & (closes > 0) & ~idx.duplicated(keep="last")
+            pairs.extend([_pair(base)] * int(keep.sum()))
+            dates.extend(idx[keep].date.tolist())
+            rates.extend(closes[keep].tolist())
+
+        if pairs:
+            try:
+                self.db.execute(_UPSERT_FX_SQL, {"pairs": pairs, "dates": dates, "rates": rates})
+                self.db.commit()
+            except Exception as e:
+                self.db.rollback()
+                logger.warning(f"fx_rates upsert failed: {e}")
+                return False
+        # The provider has answered for this session; don't ask again until the TTL expires
+        for b in starts:
+            get_cache().set(f"fx:fetched:{b}", mark.isoformat())
+        logger.info(f"FX: stored {len(pairs)} rates for {len(frames)}/{len(starts)} pairs")
+        return True
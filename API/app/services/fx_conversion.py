@@ -0,0 +1,133 @@
+"""
+Historical FX conversion for price matrices.
+
+Analytics and backtests work on a dates × symbols matrix of local-currency
+closes (RACE.MI in EUR next to AAPL in USD). convert_price_matrix() turns it
+into one currency in a single NumPy broadcast:
+
+    factor[t, j] = USD-rate[t, base(j)] × subunit(j) / USD-rate[t, target]
+    converted    = local × factor
+
+The FX matrix comes from the fx_rates store (fx.py) and is cached in the
+"fxmatrix" cache namespace per (currency set, target, date range), so repeat
+analytics calls on the same portfolio make no FX queries at all.
+
+currency_attribution() splits each column's return over the window into the
+local-market and currency components: (1 + total) = (1 + local) × (1 + fx).
+"""
+
+import logging
+from datetime import date
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from sqlalchemy.orm import Session
+
+from app.services.cache import get_cache
+from app.services.fx import FxService, split_currency
+from app.services.providers import MarketDataProvider
+
+logger = logging.getLogger(__name__)
+
+
+def _matrix_key(bases: List[str], start: date, end: date) -> str:
+    return f"fxmatrix:{','.join(bases)}:{start.isoformat()}:{end.isoformat()}"
+
+
+def load_usd_matrix(
+    db: Session, currencies: List[str], start: date, end: date,
+    provider: Optional[MarketDataProvider] = None,
+) -> pd.DataFrame:
+    """Dates × base-currency matrix of XXX→USD rates (cached per currency set and range)."""
+    bases = sorted({split_currency(c)[0] for c in currencies} | {"USD"})
+    key = _matrix_key(bases, start, end)
+    cached = get_cache().get(key)
+    if cached is not None:
+        return pd.DataFrame(cached["values"], index=pd.to_datetime(cached["dates"]), columns=cached["columns"])
+
+    frame = FxService(db, provider).usd_series(bases, start, end)
+    get_cache().set(key, {
+        "dates": [d.strftime("%Y-%m-%d") for d in frame.index],
+        "columns": list(frame.columns),
+        "values": np.where(np.isnan(frame.to_numpy(dtype=float)), None, frame.to_numpy(dtype=float)).tolist(),
+    })
+    return frame
+
+
+def fx_factor_matrix(
+    index: pd.DatetimeIndex, columns: List[str], currencies: Dict[str, str],
+    target_ccy: str, usd: pd.DataFrame,
+) -> np.ndarray:
+    """
+    T × N matrix of local→target multipliers aligned to `index`/`columns`.
+    Columns whose currency has no FX series keep a factor of 1 (logged).
+    """
+    target_base, target_sub = split_currency(target_ccy)
+    usd = usd.reindex(usd.index.union(index)).sort_index().ffill().bfill().reindex(index)
+    if target_base not in usd.columns:
+        logger.warning(f"No FX series for {target_base}; leaving prices unconverted")
+        return np.ones((len(index), len(columns)))
+
+    col_pos = {c: i for i, c in enumerate(usd.columns)}
+    rates = usd.to_numpy(dtype=float)                      # T × B
+    target = rates[:, col_pos[target_base]] * target_sub  # T
+    base_idx = np.empty(len(columns), dtype=int)
+    sub = np.ones(len(columns))
+    missing = []
+    for j, sym in enumerate(columns):
+        base, factor = split_currency(currencies.get(sym) or target_ccy)
+        if base not in col_pos:
+            missing.append(sym)
+            base, factor = target_base, target_sub
+        base_idx[j] = col_pos[base]
+        sub[j] = factor
+    if missing:
+        logger.warning(f"No FX series for {missing}; treating them as {target_ccy}")
+
+    factors = rates[:, base_idx] * sub[None, :] / target[:, None]
+    return np.where(np.isfinite(factors), factors, 1.0)
+
+
+def convert_price_matrix(
+    db: Session, prices: pd.DataFrame, currencies: Dict[str, str], target_ccy: str,
+    provider: Optional[MarketDataProvider] = None,
+) -> Dict[str, Any]:
+    """
+    Convert every column of `prices` (local currency) to `target_ccy`.
+    Returns {"prices": converted DataFrame, "fx": DataFrame of factors}.
+    No-op (factors = 1) when every column is already in the target currency.
+    """
+    cols = list(prices.columns)
+    if prices.empty or all(currencies.get(c, target_ccy) == target_ccy for c in cols):
+        return {"prices": prices, "fx": pd.DataFrame(1.0, index=prices.index, columns=cols)}
+
+    start, end = prices.index[0].date(), prices.index[-1].date()
+    usd = load_usd_matrix(db, [currencies.get(c) or target_ccy for c in cols] + [target_ccy], start, end, provider)
+    factors = fx_factor_matrix(prices.index, cols, currencies, target_ccy, usd)
+    converted = pd.DataFrame(prices.to_numpy(dtype=float) * factors, index=prices.index, columns=cols)
+    return {"prices": converted, "fx": pd.DataFrame(factors, index=prices.index, columns=cols)}
+
+
+def currency_attribution(
+    local_prices: pd.DataFrame, fx: pd.DataFrame, currencies: Dict[str, str], symbols: List[str],
+) -> List[Dict[str, Any]]:
+    """Per symbol: local-market, currency and total return (%) over the whole window."""
+    cols = [s for s in symbols if s in local_prices.columns]
+    if not cols or len(local_prices) < 2:
+        return []
+    p = local_prices[cols].to_numpy(dtype=float)
+    f = fx[cols].to_numpy(dtype=float)
+    local = p[-1] / p[0] - 1
+    ccy = f[-1] / f[0] - 1
+    total = (1 + local) * (1 + ccy) - 1
+    return [
+        {
+            "symbol": sym,
+            "currency": currencies.get(sym) or "",
+            "localReturn": round(float(local[j]) * 100, 2) if np.isfinite(local[j]) else 0.0,
+            "currencyReturn": round(float(ccy[j]) * 100, 2) if np.isfinite(ccy[j]) else 0.0,
+            "totalReturn": round(float(total[j]) * 100, 2) if np.isfinite(total[j]) else 0.0,
+        }
+        for j, sym in enumerate(cols)
+    ]
@@ -0,0 +1,325 @@
+"""
+In-memory instrument search for /market-data/search typeahead.
+
+The endpoint used to scan every _KNOWN_META entry with substring checks on
+each keystroke, then fall through to a synchronous provider call whenever
+there was no exact match. InstrumentSearchIndex answers from memory instead:
+
+  • symbols are kept sorted, so symbol prefixes are a bisect range;
+  • every word of every name is kept sorted the same way (name-word prefixes);
+  • a trigram → symbols map narrows substring matches (queries of 3+ chars)
+    to a handful of candidates before the actual `in` check.
+
+Ranking: exact symbol, symbol prefix, name-word prefix, symbol substring,
+name substring; ties go to the shorter symbol.
+
+The index is built from _KNOWN_META plus every real row of `instruments`
+(placeholders with name == symbol are skipped), then kept current:
+ORM inserts/updates of Instrument are applied when their session commits,
+and a periodic background reload picks up rows written by other workers.
+
+Remote lookups are opt-in (search(..., remote=True)). They run on a small
+background pool, de-duplicated per query; their results are written back into
+the index whether or not the request that started them is still waiting.
+"""
+
+import bisect
+import logging
+import re
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from app.models.instrument import Instrument
+from app.services.cache import get_cache
+
+logger = logging.getLogger(__name__)
+
+_RELOAD_INTERVAL = 300.0         # seconds between background reloads from `instruments`
+_REMOTE_WAIT = 1.5               # seconds a request waits for its remote lookup
+_REMOTE_WORKERS = 2
+_PENDING_KEY = "instrument_search_pending"
+
+_HIGH = "\uffff"                 # sorts after any symbol/word character (prefix range end)
+_WORD_RE = re.compile(r"[A-Z0-9]+")
+
+Entry = Dict[str, Any]
+
+
+def _grams(text: str) -> Set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _entry(symbol: str, source: Dict[str, Any]) -> Entry:
+    return {
+        "symbol": symbol,
+        "name": source.get("name") or symbol,
+        "sector": source.get("sector") or "",
+        "country": source.get("country") or "US",
+        "asset_class": source.get("asset_class") or "Equity",
+        "currency": source.get("currency") or "USD",
+    }
+
+
+def _instrument_entry(inst: Instrument) -> Optional[Entry]:
+    if not inst.symbol or not inst.name or inst.name == inst.symbol:
+        return None
+    return _entry(inst.symbol, {
+        "name": inst.name, "sector": inst.sector, "country": inst.country,
+        "asset_class": inst.asset_class, "currency": inst.currency,
+    })
+
+
+# ═══════════════════════════════════════════════════════════════
+#  Index
+# ═══════════════════════════════════════════════════════════════
+class InstrumentSearchIndex:
+    def __init__(self):
+        self._entries: Dict[str, Entry] = {}
+        self._keys: Dict[str, Tuple[str, List[str]]] = {}     # symbol → (upper name, name words)
+        self._symbols: List[str] = []                          # sorted
+        self._words: List[Tuple[str, str]] = []                # sorted (word, symbol)
+        self._grams: Dict[str, Set[str]] = defaultdict(set)    # trigram → symbols
+        self._lock = threading.RLock()
+        self.loaded_at = 0.0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    # ── writes ──
+    def add_many(self, entries: Iterable[Entry]) -> None:
+        with self._lock:
+            for e in entries:
+                self._add(e)
+
+    def add(self, entry: Entry) -> None:
+        self.add_many([entry])
+
+    def _add(self, entry: Entry) -> None:
+        sym = entry["symbol"].upper()
+        if sym in self._entries:
+            if self._entries[sym] == entry:
+                return
+            self._remove(sym)
+        name = (entry.get("name") or "").upper()
+        words = sorted(set(_WORD_RE.findall(name)))
+        self._entries[sym] = entry
+        self._keys[sym] = (name, words)
+        bisect.insort(self._symbols, sym)
+        for w in words:
+            bisect.insort(self._words, (w, sym))
+        for g in _grams(sym) | _grams(name):
+            self._grams[g].add(sym)
+
+    def _remove(self, sym: str) -> None:
+        name, words = self._keys.pop(sym)
+        del self._entries[sym]
+        del self._symbols[bisect.bisect_left(self._symbols, sym)]
+        for w in words:
+            del self._words[bisect.bisect_left(self._words, (w, sym))]
+        for g in _grams(sym) | _grams(name):
+            bucket = self._grams.get(g)
+            if bucket is not None:
+                bucket.discard(sym)
+                if not bucket:
+                    del self._grams[g]
+
+    def replace(self, entries: Iterable[Entry]) -> None:
+        """Swap the whole content (used by reloads)."""
+        fresh = InstrumentSearchIndex()
+        fresh.add_many(entries)
+        with self._lock:
+            self._entries, self._keys = fresh._entries, fresh._keys
+            self._symbols, self._words, self._grams = fresh._symbols, fresh._words, fresh._grams
+            self.loaded_at = time.monotonic()
+
+    # ── reads ──
+    def get(self, symbol: str) -> Optional[Entry]:
+        return self._entries.get(symbol.strip().upper())
+
+    def search(self, query: str, limit: int = 15) -> List[Entry]:
+        q = query.strip().upper()
+        if not q:
+            return []
+        ranks: Dict[str, int] = {}
+
+        def rank(sym: str, r: int) -> None:
+            if r < ranks.get(sym, 99):
+                ranks[sym] = r
+
+        with self._lock:
+            if q in self._entries:
+                rank(q, 0)
+            lo = bisect.bisect_left(self._symbols, q)
+            hi = bisect.bisect_left(self._symbols, q + _HIGH)
+            for sym in self._symbols[lo:hi]:
+                rank(sym, 1)
+            lo = bisect.bisect_left(self._words, (q, ""))
+            hi = bisect.bisect_left(self._words, (q + _HIGH, ""))
+            for _, sym in self._words[lo:hi]:
+                rank(sym, 2)
+            if len(q) >= 3:
+                buckets = sorted((self._grams.get(g, set()) for g in _grams(q)), key=len)
+                candidates = set.intersection(*buckets) if buckets else set()
+                for sym in candidates:
+                    if q in sym:
+                        rank(sym, 3)
+                    elif q in self._keys[sym][0]:
+                        rank(sym, 4)
+            ordered = sorted(ranks, key=lambda s: (ranks[s], len(s), s))[:limit]
+            return [dict(self._entries[s]) for s in ordered]
+
+
+# ═══════════════════════════════════════════════════════════════
+#  Process-wide index
+# ═══════════════════════════════════════════════════════════════
+_index: Optional[InstrumentSearchIndex] = None
+_index_lock = threading.Lock()
+_reloading = threading.Event()
+
+
+def _load_entries(bind) -> List[Entry]:
+    from app.services.market_data import _KNOWN_META
+
+    entries = [_entry(sym, meta) for sym, meta in _KNOWN_META.items()]
+    try:
+        with Session(bind=bind) as db:
+            for inst in db.query(Instrument).all():
+                e = _instrument_entry(inst)
+                if e is not None:
+                    entries.append(e)
+    except Exception as e:
+        logger.warning(f"instrument search: could not load instruments: {e}")
+    return entries
+
+
+def _reload(bind) -> None:
+    try:
+        _index.replace(_load_entries(bind))
+        logger.debug(f"instrument search: reloaded {len(_index)} entries")
+    finally:
+        _reloading.clear()
+
+
+def get_search_index(bind) -> InstrumentSearchIndex:
+    """The shared index; built on first use, reloaded in the background when old."""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                index = InstrumentSearchIndex()
+                index.replace(_load_entries(bind))
+                logger.info(f"instrument search: indexed {len(index)} instruments")
+                _index = index
+    elif time.monotonic() - _index.loaded_at > _RELOAD_INTERVAL and not _reloading.is_set():
+        _reloading.set()
+        threading.Thread(target=_reload, args=(bind,), daemon=True).start()
+    return _index
+
+
+# ────────────── keep the index current on ORM writes ──────────────
+@event.listens_for(Instrument, "after_insert")
+@event.listens_for(Instrument, "after_update")
+def _queue_index_update(mapper, connection, target: Instrument) -> None:
+    session = object_session(target)
+    entry = _instrument_entry(target)
+    if session is not None and entry is not None:
+        session.info.setdefault(_PENDING_KEY, {})[entry["symbol"]] = entry
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_index_updates(session: Session) -> None:
+    pending = session.info.pop(_PENDING_KEY, None)
+    if pending and _index is not None:
+        _index.add_many(pending.values())
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_index_updates(session: Session) -> None:
+    session.info.pop(_PENDING_KEY, None)
+
+
+# ═══════════════════════════════════════════════════════════════
+#  Opt-in remote lookups
+# ═══════════════════════════════════════════════════════════════
+_remote_pool = ThreadPoolExecutor(max_workers=_REMOTE_WORKERS, thread_name_prefix="search-remote")
+_remote_inflight: Dict[str, Future] = {}
+_remote_lock = threading.Lock()
+
+
+def _lookup_remote(bind, query: str) -> int:
+    """Provider search (+ info for ticker-like queries) → index. Returns entries added."""
+    from app.services.market_data import (
+        MarketDataService, _exchange_to_currency, _normalize_asset_class, _normalize_sector,
+    )
+
+    q = query.strip().upper()
+    db = Session(bind=bind)
+    try:
+        md = MarketDataService(db)
+        entries: List[Entry] = []
+        try:
+            for c in md.provider.search(query, max_results=10):
+                sym = (c.get("symbol") or "").upper()
+                name = c.get("longname") or c.get("shortname")
+                if not sym or not name:
+                    continue
+                entries.append(_entry(sym, {
+                    "name": name,
+                    "sector": _normalize_sector(c.get("sector")),
+                    "asset_class": _normalize_asset_class(c.get("quoteType")),
+                    "currency": _exchange_to_currency(c.get("exchange", "")),
+                    "country": "",
+                }))
+        except Exception as e:
+            logger.warning(f"instrument search: remote search failed for '{query}': {e}")
+
+        if " " not in q and not any(e["symbol"] == q for e in entries):
+            info = md.get_instrument_info(q)
+            if info and info.get("name"):
+                entries.append(_entry(q, info))
+    finally:
+        db.close()
+
+    if entries and _index is not None:
+        _index.add_many(entries)
+    # Don't ask the provider about the same query again for a while
+    get_cache().set(f"search:remote:{q}", len(entries))
+    return len(entries)
+
+
+def search_instruments(bind, query: str, limit: int = 15, remote: bool = False,
+                       wait: float = _REMOTE_WAIT) -> List[Entry]:
+    """
+    Ranked matches from the index. With `remote`, a query that has no exact
+    symbol match also starts a background provider lookup (at most one per
+    query at a time, not repeated while its cache marker lives) and waits up
+    to `wait` seconds for it before answering from the index again.
+    """
+    index = get_search_index(bind)
+    results = index.search(query, limit)
+    q = query.strip().upper()
+    if not remote or not q or any(r["symbol"] == q for r in results):
+        return results
+    if get_cache().get(f"search:remote:{q}") is not None:
+        return results
+
+    with _remote_lock:
+        fut = _remote_inflight.get(q)
+        if fut is None:
+            fut = _remote_pool.submit(_lookup_remote, bind, q)
+            _remote_inflight[q] = fut
+            fut.add_done_callback(lambda _f, q=q: _remote_inflight.pop(q, None))
+    try:
+        if fut.result(timeout=wait):
+            return index.search(query, limit)
+    except FutureTimeout:
+        logger.debug(f"instrument search: remote lookup for '{q}' still running")
+    except Exception as e:
+        logger.warning(f"instrument search: remote lookup for '{q}' failed: {e}")
+    return results
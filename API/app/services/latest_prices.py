@@ -0,0 +1,144 @@
+"""
+Latest-price index.
+
+`latest_prices` keeps one row per symbol with its last two priced bars
+(last_date, last_close, prev_date, prev_close), so portfolio enrichment —
+current price and previous close for every position — is a single
+primary-key lookup instead of a GROUP BY max(date) over price_history joined
+back to it, once for the latest bar and once per previous-session date.
+
+Ingestion refreshes the rows of every symbol it wrote bars or corporate
+actions for inside the upsert's own transaction, so the index never disagrees with committed
+history. The refresh re-reads the two newest priced bars per symbol (a short
+backward scan of the primary key), which also covers backfills and
+corrections of older bars. Symbols ingested before the table existed are
+bootstrapped on first read, like price_coverage.
+
+Every refresh also increments the row's data_version: a per-symbol counter
+of price-data changes. The price-matrix cache versions its columns on it
+(matrix_cache.py) and the analytics result cache sums it into its watermark
+(analytics_cache.py).
+"""
+
+import logging
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Row
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.instrument import LatestPrice
+
+logger = logging.getLogger(__name__)
+
+# Both bars split-adjusted (as the as-of engine's default "split" series), so
+# last / prev is the day's change even across a split; zero means "no price".
+_REFRESH_SQL = text("""
+    INSERT INTO latest_prices (symbol, last_date, last_close, prev_date, prev_close, data_version)
+    SELECT i.symbol,
+           (array_agg(b.date ORDER BY b.date DESC))[1],
+           (array_agg(b.px ORDER BY b.date DESC))[1],
+           (array_agg(b.date ORDER BY b.date DESC))[2],
+           (array_agg(b.px ORDER BY b.date DESC))[2],
+           1
+    FROM instruments i
+    CROSS JOIN LATERAL (
+        SELECT p.date, p.close * COALESCE((
+                   SELECT exp(sum(ln(a.factor))) FROM corporate_actions a
+                   WHERE a.symbol = i.symbol AND a.kind = 'split' AND a.ex_date > p.date AND a.factor > 0
+               ), 1) AS px
+        FROM price_history p
+        WHERE p.instrument_id = i.id AND p.close > 0
+        ORDER BY p.date DESC
+        LIMIT 2
+    ) b
+    WHERE i.symbol = ANY(CAST(:symbols AS varchar[]))
+    GROUP BY i.symbol
+    ON CONFLICT (symbol) DO UPDATE SET
+        last_date = excluded.last_date,
+        last_close = excluded.last_close,
+        prev_date = excluded.prev_date,
+        prev_close = excluded.prev_close,
+        data_version = latest_prices.data_version + 1
+    RETURNING symbol, last_date, last_close, prev_date, prev_close, data_version
+""")
+
+
+def price_on_or_before(row: Row, target_date: date) -> Optional[float]:
+    """
+    The price get_prices_at_date_bulk would return for `target_date`, when
+    the row alone can answer it (None → fall back to price_history).
+    Between prev_date and last_date there are no bars, so the bar on or
+    before any date in [prev_date, last_date) is the previous one.
+    """
+    earliest = target_date - timedelta(days=settings.PRICE_ASOF_MAX_STALENESS_DAYS)
+    if row.last_date is None:
+        return None
+    if row.last_date <= target_date:
+        return row.last_close if row.last_date >= earliest else None
+    if row.prev_date is not None and row.prev_date <= target_date:
+        return row.prev_close if row.prev_date >= earliest else None
+    return None
+
+
+class LatestPriceIndex:
+    def __init__(self, db: Session):
+        self.db = db
+
+    def load(self, symbols: List[str]) -> Dict[str, Row]:
+        """
+        Rows (symbol, last_date, last_close, prev_date, prev_close) for
+        `symbols`; symbols without any priced bar are absent. Plain result
+        rows, not ORM instances, so a bootstrap commit cannot expire them.
+        """
+        if not symbols:
+            return {}
+        rows = {
+            r.symbol: r
+            for r in self.db.query(
+                LatestPrice.symbol, LatestPrice.last_date, LatestPrice.last_close,
+                LatestPrice.prev_date, LatestPrice.prev_close,
+            )
+            .filter(LatestPrice.symbol.in_(symbols))
+            .all()
+        }
+        missing = [s for s in symbols if s not in rows]
+        if missing:
+            rows.update(self._bootstrap(missing))
+        return rows
+
+    def versions(self, symbols: List[str]) -> Dict[str, int]:
+        """data_version of each symbol that has a row."""
+        if not symbols:
+            return {}
+        return dict(
+            self.db.query(LatestPrice.symbol, LatestPrice.data_version)
+            .filter(LatestPrice.symbol.in_(symbols))
+            .all()
+        )
+
+    def refresh(self, symbols: List[str]) -> Dict[str, int]:
+        """
+        Recompute the rows of `symbols` from price_history in the caller's
+        transaction (no commit). Called by ingestion before it commits.
+        Returns {symbol: data_version} as this transaction leaves them.
+        """
+        if not symbols:
+            return {}
+        rows = self.db.execute(_REFRESH_SQL, {"symbols": list(symbols)}).fetchall()
+        return {r.symbol: int(r.data_version) for r in rows}
+
+    # ── internals ──
+    def _bootstrap(self, symbols: List[str]) -> Dict[str, Row]:
+        """Seed rows for symbols ingested before the index existed."""
+        try:
+            written = self.db.execute(_REFRESH_SQL, {"symbols": symbols}).fetchall()
+            if written:
+                self.db.commit()
+        except Exception as e:
+            self.db.rollback()
+            logger.warning(f"latest_prices bootstrap failed for {len(symbols)} symbols: {e}")
+            return {}
+        return {r.symbol: r for r in written}
@@ -4,53 +4,65 @@ Market data service — optimised for speed.
 Key improvements over the original:
   • batch_sync_instruments() / batch_download_history() use a single
     yf.download() call for N symbols instead of N sequential calls.
-  • get_latest_prices_bulk() is a single DB query — no yfinance at all.
-  • get_price_at() is DB-only (no yfinance call in the hot path).
-  • Concurrency-safe dedup via INSERT … ON CONFLICT DO NOTHING.
-  • In-process LRU + TTL cache for instrument metadata.
+  • get_latest_prices_bulk() is a single primary-key lookup on the
+    latest_prices index that ingestion maintains — no yfinance at all.
+  • get_price_at() / get_prices_at_date_bulk() are DB-only; dates the
+    latest_prices row cannot answer go through the vectorized as-of engine
+    (price_asof.py) over the cached price arrays.
+  • Vectorized ingestion: one INSERT … ON CONFLICT DO UPDATE per batch of
+    bars, rewriting a bar only when its close changed.
+  • Downloads are screened for bad bars (zero closes, unit glitches, spikes,
+    stale repeats) as one array pass; suspects go to price_quarantine
+    instead of price_history (price_quality.py).
+  • Ingested closes are written through to the memory-mapped price store
+    that history reads are served from (price_store.py).
+  • Bars are stored as traded; splits and dividends go to the sparse
+    corporate_actions table and are applied on read (corporate_actions.py).
+  • Symbol resolutions persisted in symbol_listings; batch misses are
+    resolved concurrently under the shared rate budget.
+  • Two-tier cache (in-process LRU → Redis) for symbol resolution,
+    instrument metadata and FX rates, shared by every worker.
+  • All outbound calls go through a MarketDataProvider (yfinance, or the
+    record/replay provider for offline benchmarks and staging), queued on a
+    fetch scheduler with one token bucket shared by every worker process.
 """
 
-import yfinance as yf
-import time
 import logging
 from datetime import date, timedelta
-from typing import Optional, Dict, Any, List, Set
+from typing import Optional, Callable, Dict, Any, List, Tuple
+import numpy as np
+import pandas as pd
+from sqlalchemy.engine import Row
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy import func, and_
-from app.models.instrument import Instrument, PriceHistory
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from app.models.instrument import Instrument, PriceHistory, PriceCoverage
+from app.services.providers import MarketDataProvider, get_provider
+from app.services.price_coverage import PriceCoverageIndex
+from app.services.latest_prices import LatestPriceIndex, price_on_or_before
+from app.services.corporate_actions import (
+    Actions, extract_actions, later_splits, merge_actions, record_actions, unsplit_frames,
+)
+from app.services.price_quality import held_dates, quarantine_bars, release_bars, screen_frames, touch_bars
+from app.services.cache import get_cache
+from app.services.single_flight import coalesce
+from app.services.fetch_scheduler import is_throttled
+from app.services.negative_cache import get_negative_cache
+from app.services.fx import FxService
+from app.services.symbol_resolver import SymbolResolver
+from app.services.price_store import get_price_store
+from app.services.matrix_cache import get_matrix_cache
 
 logger = logging.getLogger(__name__)
 
-# ────────────── in-process rate-limiter / cache ──────────────
-_last_yf_call: float = 0.0
-_YF_MIN_INTERVAL = 0.35          # seconds between yfinance API calls
-_price_cache: Dict[str, Any] = {}
-_CACHE_TTL = 300                 # 5 min
-
-
-def _rate_limit():
-    global _last_yf_call
-    elapsed = time.time() - _last_yf_call
-    if elapsed < _YF_MIN_INTERVAL:
-        time.sleep(_YF_MIN_INTERVAL - elapsed)
-    _last_yf_call = time.time()
-
-
+# ────────────── two-tier cache (see cache.py) ──────────────
 def _cache_get(key: str) -> Any:
-    entry = _price_cache.get(key)
-    if entry and (time.time() - entry[0]) < _CACHE_TTL:
-        return entry[1]
-    return None
+    return get_cache().get(key)
 
 
 def _cache_set(key: str, value: Any):
-    _price_cache[key] = (time.time(), value)
-    if len(_price_cache) > 500:
-        cutoff = time.time() - _CACHE_TTL
-        expired = [k for k, v in _price_cache.items() if v[0] < cutoff]
-        for k in expired:
-            del _price_cache[k]
+    get_cache().set(key, value)
 
 
 # ────────────── yfinance value normalization ──────────────
@@ -87,6 +99,28 @@ _SECTOR_MAP: Dict[str, str] = {
     "telecommunications": "Telecom",
 }
 
+def _with_retry(call: Callable[[], Any], attempts: int) -> Any:
+    """
+    call(), tried up to `attempts` times while the provider answers 429. The
+    fetch scheduler has already put the shared bucket into back-off, so a
+    retry simply queues behind it. Other errors, and the last 429, raise.
+    """
+    for attempt in range(attempts):
+        try:
+            return call()
+        except Exception as e:
+            if attempt + 1 == attempts or not is_throttled(e):
+                raise
+
+
+def _info_has_data(info: Optional[Dict[str, Any]]) -> bool:
+    """Yahoo answers unknown symbols with a near-empty info dict instead of an error."""
+    if not info:
+        return False
+    return bool(info.get("longName") or info.get("shortName")
+                or info.get("regularMarketPrice") or info.get("currentPrice"))
+
+
 def _normalize_asset_class(raw: str | None) -> str:
     if not raw:
         return "Equity"
@@ -231,12 +265,113 @@ def _exchange_to_currency(exchange_code: str) -> Optional[str]:
     return ccy
 
 
+# ────────────── bulk price ingestion ──────────────
+_UPSERT_CHUNK = 20_000           # bars per statement
+
+_UPSERT_PRICES_SQL = text("""
+    WITH bars AS (
+        SELECT i.id, t.d, t.o, t.h, t.l, t.c, t.v
+        FROM unnest(
+            CAST(:symbols AS varchar[]), CAST(:dates AS date[]),
+            CAST(:opens AS float8[]), CAST(:highs AS float8[]), CAST(:lows AS float8[]),
+            CAST(:closes AS float8[]), CAST(:volumes AS float8[])
+        ) AS t(s, d, o, h, l, c, v)
+        JOIN instruments i ON i.symbol = t.s
+    ), written AS (
+        INSERT INTO price_history
+            (instrument_id, date, open, high, low, close, volume, adjusted_close)
+        SELECT id, d, o, h, l, c, v, NULL FROM bars
+        ON CONFLICT (instrument_id, date) DO UPDATE SET
+            open = excluded.open,
+            high = excluded.high,
+            low = excluded.low,
+            close = excluded.close,
+            volume = excluded.volume,
+            adjusted_close = excluded.adjusted_close
+        WHERE price_history.close IS DISTINCT FROM excluded.close
+           OR price_history.adjusted_close IS NOT NULL
+        RETURNING instrument_id, date
+    )
+    -- The EXISTS sees price_history as it was before this statement (xmax = 0
+    -- would too, but cannot be returned from a partitioned table)
+    SELECT i.symbol, NOT EXISTS (
+        SELECT 1 FROM price_history p WHERE p.instrument_id = w.instrument_id AND p.date = w.date
+    ) AS inserted
+    FROM written w JOIN instruments i ON i.id = w.instrument_id
+""")
+
+
+# Bars still holding the provider's adjustment at their download (ingested
+# before corporate_actions): the span per symbol, to re-download as traded.
+_PROVIDER_ADJUSTED_SQL = text("""
+    SELECT i.symbol, min(p.date) AS lo, max(p.date) AS hi
+    FROM instruments i
+    JOIN price_history p ON p.instrument_id = i.id AND p.adjusted_close IS NOT NULL
+    WHERE i.symbol = ANY(CAST(:symbols AS varchar[]))
+    GROUP BY i.symbol
+""")
+
+# What a rebase download did not replace (no longer served, or quarantined)
+# would stay on the old basis: drop it, coverage refetches the gap.
+_DROP_PROVIDER_ADJUSTED_SQL = text("""
+    DELETE FROM price_history p
+    USING unnest(
+        CAST(:symbols AS varchar[]), CAST(:starts AS date[]), CAST(:ends AS date[])
+    ) AS r(s, lo, hi)
+    JOIN instruments i ON i.symbol = r.s
+    WHERE p.instrument_id = i.id AND p.date BETWEEN r.lo AND r.hi
+      AND p.adjusted_close IS NOT NULL
+    RETURNING i.symbol
+""")
+
+
+def _nullable(values: np.ndarray) -> List[Optional[float]]:
+    """float array → list with NaN replaced by None (bound as SQL NULL)."""
+    return np.where(np.isnan(values), None, values).tolist()
+
+
+def _frames_to_columns(frames: Dict[str, Any]) -> Dict[str, Any]:
+    """Flatten {symbol: OHLCV DataFrame} into parallel column lists for unnest()."""
+    out: Dict[str, Any] = {k: [] for k in ("symbols", "dates", "opens", "highs", "lows", "closes", "volumes")}
+    out["per_symbol"] = {}
+    for sym, df in frames.items():
+        if df is None or df.empty or "Close" not in df.columns:
+            continue
+        closes = pd.to_numeric(df["Close"], errors="coerce").to_numpy(dtype=float)
+        dates = pd.DatetimeIndex(df.index).normalize()
+        # keep bars with a close, one per calendar date (last print wins)
+        keep = ~np.isnan(closes) & ~dates.duplicated(keep="last")
+        n = int(keep.sum())
+        if n == 0:
+            continue
+
+        def col(name: str) -> np.ndarray:
+            if name not in df.columns:
+                return np.full(n, np.nan)
+            return pd.to_numeric(df[name], errors="coerce").to_numpy(dtype=float)[keep]
+
+        out["symbols"].extend([sym] * n)
+        out["dates"].extend(dates[keep].date.tolist())
+        out["opens"].extend(_nullable(col("Open")))
+        out["highs"].extend(_nullable(col("High")))
+        out["lows"].extend(_nullable(col("Low")))
+        out["closes"].extend(closes[keep].tolist())
+        out["volumes"].extend(_nullable(col("Volume")))
+        out["per_symbol"][sym] = n
+    return out
+
+
 # ═══════════════════════════════════════════════════════════════
 #  MarketDataService
 # ═══════════════════════════════════════════════════════════════
 class MarketDataService:
-    def __init__(self, db: Session):
+    def __init__(self, db: Session, provider: Optional[MarketDataProvider] = None):
         self.db = db
+        self.provider = provider or get_provider()
+        self.coverage = PriceCoverageIndex(db)
+        self.latest = LatestPriceIndex(db)
+        self.negative = get_negative_cache(db.get_bind())
+        self.resolver = SymbolResolver(db, self.provider, self.negative)
 
     # ──────────────── RESOLVE SYMBOL FOR CURRENCY ────────────────
 
@@ -248,112 +383,60 @@ class MarketDataService:
         find the Yahoo Finance symbol on the exchange that trades in that
         currency (e.g. 'RACE.MI').
 
-        Strategy:
-          1. Check if the bare symbol already trades in the target currency.
-          2. Use yf.Search() to find all listings → pick by exchange→currency.
-          3. Try common exchange suffixes for that currency.
-          4. Fall back to the original symbol if nothing matches.
+        Strategy (see symbol_resolver.py):
+          1. Keep symbols that already carry an exchange suffix.
+          2. Answer from the cache or the symbol_listings table.
+          3. Search the provider for all listings → pick by exchange→currency.
+          4. Try common exchange suffixes for that currency.
+          5. Fall back to the original symbol if nothing matches.
         """
-        cache_key = f"resolve:{raw_symbol}:{currency_hint}"
-        cached = _cache_get(cache_key)
-        if cached is not None:
-            return cached
-
-        # Normalize
-        sym = raw_symbol.strip().upper()
-        hint = currency_hint.strip().upper()
+        return self.resolver.resolve(raw_symbol, currency_hint)
 
-        # If the raw symbol already has an exchange suffix, keep it
-        if "." in sym and len(sym.split(".")[-1]) <= 3:
-            _cache_set(cache_key, sym)
-            return sym
-
-        # 1) Search Yahoo Finance for candidate listings
-        try:
-            _rate_limit()
-            search_results = yf.Search(sym, max_results=10)
-            candidates = search_results.quotes if search_results.quotes else []
-
-            for candidate in candidates:
-                c_sym = candidate.get("symbol", "")
-                c_exch = candidate.get("exchange", "")
-                c_base = c_sym.split(".")[0].upper()
-
-                # The base ticker must match (ignore exchange suffix)
-                if c_base != sym and not c_base.startswith(sym):
-                    continue
-
-                exch_ccy = _exchange_to_currency(c_exch)
-                if exch_ccy and exch_ccy == hint:
-                    logger.info(
-                        f"resolve_symbol: {raw_symbol}+{currency_hint} → "
-                        f"{c_sym} (via search, exchange={c_exch})"
-                    )
-                    _cache_set(cache_key, c_sym)
-                    return c_sym
-        except Exception as e:
-            logger.warning(f"resolve_symbol: search failed for '{sym}': {e}")
-
-        # 2) Try common exchange suffixes for the hinted currency
-        suffixes = _CURRENCY_SUFFIXES.get(hint, [])
-        for suffix in suffixes:
-            candidate = sym + suffix
-            try:
-                _rate_limit()
-                t = yf.Ticker(candidate)
-                info = t.info
-                if info and info.get("currency", "").upper() == hint:
-                    name = info.get("longName") or info.get("shortName")
-                    if name:
-                        logger.info(
-                            f"resolve_symbol: {raw_symbol}+{currency_hint} → "
-                            f"{candidate} (via suffix probe)"
-                        )
-                        _cache_set(cache_key, candidate)
-                        return candidate
-            except Exception:
-                continue
-
-        # 3) Fall back to original
-        logger.info(
-            f"resolve_symbol: no {currency_hint} listing found for '{sym}', "
-            f"keeping original"
-        )
-        _cache_set(cache_key, sym)
-        return sym
+    def resolve_symbols_for_currency(self, pairs: List[tuple]) -> Dict[tuple, str]:
+        """Batch form: {(raw symbol, currency hint): symbol}, misses resolved concurrently."""
+        return self.resolver.resolve_many(pairs)
 
     # ──────────────────── INSTRUMENT METADATA ────────────────────
 
     def get_instrument_info(self, symbol: str) -> Optional[Dict[str, Any]]:
-        """Fetch instrument metadata from yfinance with caching."""
+        """Fetch instrument metadata from the provider with caching."""
         cache_key = f"info:{symbol}"
         cached = _cache_get(cache_key)
         if cached is not None:
             return cached
+        if self.negative.blocked("info", symbol):
+            return None
+        # Concurrent requests for the same symbol share one provider call
+        return coalesce(cache_key, lambda: self._fetch_instrument_info(symbol), bind=self.db.get_bind())
 
-        for attempt in range(3):
-            try:
-                _rate_limit()
-                ticker = yf.Ticker(symbol)
-                info = ticker.info
-                result = {
-                    "symbol": symbol,
-                    "name": info.get("longName") or info.get("shortName"),
-                    "asset_class": _normalize_asset_class(info.get("quoteType")),
-                    "sector": _normalize_sector(info.get("sector")),
-                    "country": info.get("country"),
-                    "currency": info.get("currency"),
-                    "current_price": info.get("currentPrice") or info.get("regularMarketPrice"),
-                }
-                _cache_set(cache_key, result)
-                return result
-            except Exception as e:
-                err = str(e).lower()
-                if "429" in err or "too many requests" in err:
-                    time.sleep(2 ** (attempt + 1))
-                    continue
-                break
-        return None
+    def _fetch_instrument_info(self, symbol: str) -> Optional[Dict[str, Any]]:
+        cache_key = f"info:{symbol}"
+        cached = _cache_get(cache_key)  # another worker may have filled it while we waited
+        if cached is not None:
+            return cached
+
+        try:
+            info = _with_retry(lambda: self.provider.info(symbol), 3)
+        except Exception as e:
+            err = str(e).lower()
+            if "404" in err or "not found" in err:
+                self.negative.record_failure("info", [symbol], str(e))
+            return None
+        if not _info_has_data(info):
+            self.negative.record_failure("info", [symbol], "empty info")
+            return None
+        self.negative.record_success("info", [symbol])
+        result = {
+            "symbol": symbol,
+            "name": info.get("longName") or info.get("shortName"),
+            "asset_class": _normalize_asset_class(info.get("quoteType")),
+            "sector": _normalize_sector(info.get("sector")),
+            "country": info.get("country"),
+            "currency": info.get("currency"),
+            "current_price": info.get("currentPrice") or info.get("regularMarketPrice"),
+        }
+        _cache_set(cache_key, result)
+        return result
 
     # ── fast DB-only helper: ensure instrument rows exist ──
     def ensure_instruments_exist(self, symbols: List[str]) -> Dict[str, Instrument]:
@@ -384,27 +467,38 @@ class MarketDataService:
                 inst.currency = meta.get("currency") or inst.currency
                 dirty = True
 
-        missing = [s for s in symbols if s not in found]
-        for sym in missing:
-            meta = _KNOWN_META.get(sym, {})
-            inst = Instrument(
-                symbol=sym,
-                name=meta.get("name", sym),
-                asset_class=meta.get("asset_class", "Equity"),
-                sector=meta.get("sector"),
-                country=meta.get("country", "US"),
-                currency=meta.get("currency", "USD"),
-                last_updated=None,
-            )
-            self.db.add(inst)
-            found[sym] = inst
-        if missing or dirty:
+        if dirty:
             try:
                 self.db.commit()
-            except IntegrityError:
+            except Exception:
                 self.db.rollback()
-                existing = self.db.query(Instrument).filter(Instrument.symbol.in_(symbols)).all()
-                found = {i.symbol: i for i in existing}
+
+        missing = list({s for s in symbols if s not in found})
+        if missing:
+            # ON CONFLICT DO NOTHING: concurrent requests creating the same
+            # instrument must not abort each other's inserts.
+            values = []
+            for sym in missing:
+                meta = _KNOWN_META.get(sym, {})
+                values.append({
+                    "symbol": sym,
+                    "name": meta.get("name", sym),
+                    "asset_class": meta.get("asset_class", "Equity"),
+                    "sector": meta.get("sector"),
+                    "country": meta.get("country", "US"),
+                    "currency": meta.get("currency", "USD"),
+                    "last_updated": None,
+                })
+            try:
+                self.db.execute(
+                    pg_insert(Instrument).values(values).on_conflict_do_nothing(index_elements=["symbol"])
+                )
+                self.db.commit()
+            except Exception as e:
+                self.db.rollback()
+                logger.warning(f"ensure_instruments_exist: insert failed for {len(missing)} symbols: {e}")
+            for inst in self.db.query(Instrument).filter(Instrument.symbol.in_(missing)).all():
+                found[inst.symbol] = inst
         return found
 
     def sync_instrument(self, symbol: str) -> Optional[Instrument]:
@@ -424,12 +518,13 @@ class MarketDataService:
             latest_price = None
             last_rec = (
                 self.db.query(PriceHistory)
-                .filter(PriceHistory.instrument_symbol == symbol)
+                .join(PriceHistory.instrument)
+                .filter(Instrument.symbol == symbol)
                 .order_by(PriceHistory.date.desc())
                 .first()
             )
             if last_rec:
-                latest_price = last_rec.adjusted_close or last_rec.close
+                latest_price = last_rec.close
             info = {
                 "symbol": symbol,
                 "name": meta.get("name", symbol),
@@ -467,7 +562,7 @@ class MarketDataService:
         Sync multiple instruments in one shot.
         • Instruments already updated today are skipped.
         • Remaining instruments get metadata from _KNOWN_META (instant)
-          and current_price from a single yf.download() call.
+          and current_price from a single provider quotes() call.
         """
         if not symbols:
             return {}
@@ -482,26 +577,12 @@ class MarketDataService:
         if not stale:
             return inst_map
 
-        # 3) Batch-fetch latest prices with yf.download (ONE call)
+        # 3) Batch-fetch latest prices (ONE provider call)
         try:
-            _rate_limit()
-            df = yf.download(stale, period="5d", progress=False, threads=True)
-            if df is not None and not df.empty:
-                if len(stale) == 1:
-                    last_close = float(df["Close"].dropna().iloc[-1]) if "Close" in df.columns else None
-                    if last_close and last_close > 0:
-                        inst_map[stale[0]].current_price = last_close
-                else:
-                    if "Close" in df.columns:
-                        last_row = df["Close"].dropna().iloc[-1] if len(df["Close"].dropna()) else None
-                        if last_row is not None:
-                            for sym in stale:
-                                try:
-                                    price = float(last_row[sym])
-                                    if price and price > 0:
-                                        inst_map[sym].current_price = price
-                                except (KeyError, TypeError, ValueError):
-                                    pass
+            prices = self.provider.quotes(stale)
+            for sym, price in prices.items():
+                if sym in inst_map and price and price > 0:
+                    inst_map[sym].current_price = price
         except Exception as e:
             logger.warning(f"batch_sync_instruments download error: {e}")
 
@@ -520,9 +601,18 @@ class MarketDataService:
 
     def get_fx_rate(self, from_ccy: str, to_ccy: str) -> float:
         """
-        Get current FX rate from `from_ccy` to `to_ccy` via yfinance.
+        Get current FX rate from `from_ccy` to `to_ccy`.
         Returns 1.0 if same currency or on error.
         """
+        if from_ccy.strip() == to_ccy.strip():
+            return 1.0
+        return self.get_fx_rates_bulk([from_ccy], to_ccy).get(from_ccy.strip(), 1.0)
+
+    def _live_fx_rate(self, from_ccy: str, to_ccy: str) -> float:
+        """
+        Spot rate straight from the provider (direct pair, then inverse).
+        Fallback for currencies the fx_rates store has no series for.
+        """
         from_ccy = from_ccy.upper().strip()
         to_ccy = to_ccy.upper().strip()
         if from_ccy == to_ccy:
@@ -534,30 +624,17 @@ class MarketDataService:
             return cached
 
         # Try direct pair
-        pair = f"{from_ccy}{to_ccy}=X"
-        for attempt in range(2):
-            try:
-                _rate_limit()
-                ticker = yf.Ticker(pair)
-                info = ticker.info
-                rate = info.get("regularMarketPrice") or info.get("previousClose")
-                if rate and rate > 0:
-                    _cache_set(cache_key, float(rate))
-                    return float(rate)
-            except Exception as e:
-                err = str(e).lower()
-                if "429" in err or "too many requests" in err:
-                    time.sleep(2 ** (attempt + 1))
-                    continue
-                break
+        try:
+            rate = _with_retry(lambda: self.provider.fx_rate(from_ccy, to_ccy), 2)
+            if rate and rate > 0:
+                _cache_set(cache_key, float(rate))
+                return float(rate)
+        except Exception:
+            pass
 
         # Try inverse pair as fallback
-        inv_pair = f"{to_ccy}{from_ccy}=X"
         try:
-            _rate_limit()
-            ticker = yf.Ticker(inv_pair)
-            info = ticker.info
-            inv_rate = info.get("regularMarketPrice") or info.get("previousClose")
+            inv_rate = self.provider.fx_rate(to_ccy, from_ccy)
             if inv_rate and inv_rate > 0:
                 rate = 1.0 / float(inv_rate)
                 _cache_set(cache_key, rate)
@@ -570,110 +647,83 @@ class MarketDataService:
 
     def get_fx_rates_bulk(self, currencies: list, target_ccy: str) -> dict:
         """
-        Fetch FX rates for a set of source currencies to one target currency.
-        Returns {source_ccy: rate_to_target}.
+        FX rates for a set of source currencies to one target currency, from
+        the fx_rates store (one query when fresh, one batched download when
+        not; cross rates triangulated through USD).
+        Returns {source_ccy: rate_to_target} keyed by the currencies as given
+        (stripped), so sub-units like "GBp" keep their own 1/100 rate.
         """
-        target_ccy = target_ccy.upper().strip()
-        rates: dict = {}
-        for ccy in set(currencies):
-            ccy = ccy.upper().strip()
-            if ccy == target_ccy:
-                rates[ccy] = 1.0
-            else:
-                rates[ccy] = self.get_fx_rate(ccy, target_ccy)
+        target_ccy = target_ccy.strip()
+        wanted = {c.strip() for c in currencies if c and c.strip()}
+        rates: dict = {c: 1.0 for c in wanted if c == target_ccy}
+        todo = wanted - set(rates)
+        if not todo:
+            return rates
+        try:
+            rates.update(FxService(self.db, self.provider).rates_on(todo, target_ccy))
+        except Exception as e:
+            self.db.rollback()
+            logger.warning(f"fx_rates lookup failed, falling back to live rates: {e}")
+        for ccy in todo - set(rates):
+            rates[ccy] = self._live_fx_rate(ccy, target_ccy)
         return rates
 
     # ──────────────────── PRICE LOOKUPS (DB-only, instant) ────────────────────
 
     def get_latest_prices_bulk(self, symbols: List[str]) -> Dict[str, float]:
         """
-        Single DB query → {symbol: latest_close_price}.
+        One primary-key lookup on latest_prices → {symbol: latest_close_price}.
         No yfinance calls. Used for fast portfolio enrichment.
         """
+        return {
+            sym: row.last_close
+            for sym, row in self.get_latest_quotes(symbols).items()
+            if row.last_close
+        }
+
+    def get_latest_quotes(self, symbols: List[str]) -> Dict[str, Row]:
+        """latest_prices rows (last and previous priced bar) for `symbols`, one lookup."""
         if not symbols:
             return {}
-        sub = (
-            self.db.query(
-                PriceHistory.instrument_symbol,
-                func.max(PriceHistory.date).label("max_date"),
-            )
-            .filter(PriceHistory.instrument_symbol.in_(symbols))
-            .group_by(PriceHistory.instrument_symbol)
-            .subquery()
-        )
-        rows = (
-            self.db.query(PriceHistory)
-            .join(
-                sub,
-                and_(
-                    PriceHistory.instrument_symbol == sub.c.instrument_symbol,
-                    PriceHistory.date == sub.c.max_date,
-                ),
-            )
-            .all()
-        )
-        result: Dict[str, float] = {}
-        for r in rows:
-            p = r.adjusted_close or r.close
-            if p:
-                result[r.instrument_symbol] = float(p)
-        return result
+        return self.latest.load(list(set(symbols)))
 
-    def get_prices_at_date_bulk(self, symbols: List[str], target_date: date) -> Dict[str, float]:
+    def get_prices_at_date_bulk(
+        self, symbols: List[str], target_date: date,
+        latest: Optional[Dict[str, Row]] = None,
+    ) -> Dict[str, float]:
         """
-        Single DB query → closest price on or before target_date for each symbol.
-        Falls back up to 7 days for weekends/holidays. No yfinance.
+        Closest price on or before target_date for each symbol.
+        Falls back up to PRICE_ASOF_MAX_STALENESS_DAYS (7) for weekends/holidays. No yfinance.
+        Answered from latest_prices (pass `latest` from get_latest_quotes()
+        to reuse rows already loaded) whenever target_date falls on or after
+        a symbol's previous bar; older dates go to the as-of engine in one
+        call for all of them.
         """
         if not symbols:
             return {}
-        start = target_date - timedelta(days=7)
-        sub = (
-            self.db.query(
-                PriceHistory.instrument_symbol,
-                func.max(PriceHistory.date).label("max_date"),
-            )
-            .filter(
-                PriceHistory.instrument_symbol.in_(symbols),
-                PriceHistory.date >= start,
-                PriceHistory.date <= target_date,
-            )
-            .group_by(PriceHistory.instrument_symbol)
-            .subquery()
-        )
-        rows = (
-            self.db.query(PriceHistory)
-            .join(
-                sub,
-                and_(
-                    PriceHistory.instrument_symbol == sub.c.instrument_symbol,
-                    PriceHistory.date == sub.c.max_date,
-                ),
-            )
-            .all()
-        )
+        if latest is None:
+            latest = self.get_latest_quotes(symbols)
         result: Dict[str, float] = {}
-        for r in rows:
-            p = r.adjusted_close or r.close
-            if p:
-                result[r.instrument_symbol] = float(p)
+        older: List[str] = []
+        for sym in symbols:
+            row = latest.get(sym)
+            price = price_on_or_before(row, target_date) if row is not None else None
+            if price:
+                result[sym] = float(price)
+            elif row is not None:
+                older.append(sym)
+        if older:
+            result.update(self.as_of().prices_on(older, target_date))
         return result
 
+    def as_of(self):
+        """Vectorized as-of price engine (price_asof.AsOfPrices) sharing this service."""
+        from app.services.price_asof import AsOfPrices   # price_asof imports this module
+        return AsOfPrices(self.db, self)
+
     def get_price_at(self, symbol: str, target_date: date) -> Optional[float]:
         """DB-only price lookup for a single symbol. Kept for backward compat."""
-        start = target_date - timedelta(days=7)
-        rec = (
-            self.db.query(PriceHistory)
-            .filter(
-                PriceHistory.instrument_symbol == symbol,
-                PriceHistory.date >= start,
-                PriceHistory.date <= target_date,
-            )
-            .order_by(PriceHistory.date.desc())
-            .first()
-        )
-        if rec:
-            return rec.adjusted_close or rec.close
-        return None
+        return self.as_of().prices_on([symbol], target_date).get(symbol)
 
     # ──────────────────── PRICE HISTORY ────────────────────
 
@@ -681,8 +731,9 @@ class MarketDataService:
         """Get historical data, fetching from yfinance if DB has gaps."""
         history = (
             self.db.query(PriceHistory)
+            .join(PriceHistory.instrument)
             .filter(
-                PriceHistory.instrument_symbol == symbol,
+                Instrument.symbol == symbol,
                 PriceHistory.date >= start_date,
                 PriceHistory.date <= end_date,
             )
@@ -690,112 +741,53 @@ class MarketDataService:
             .all()
         )
 
-        fetch_start = None
-
+        plan = self.coverage.plan([symbol], start_date, end_date)
+        if symbol not in plan:
+            return history
         if not history:
-            fetch_start = start_date
             self.ensure_instruments_exist([symbol])
-        else:
-            first_db = history[0].date
-            last_db = history[-1].date
-            needs_earlier = first_db > start_date + timedelta(days=5)
-            needs_later = last_db < end_date and last_db < date.today()
-            if needs_earlier:
-                fetch_start = start_date
-            elif needs_later:
-                fetch_start = last_db + timedelta(days=1)
-            else:
-                return history
 
-        # Fetch from yfinance
-        df = self._yf_download_single(symbol, fetch_start, min(end_date, date.today()) + timedelta(days=1))
-        if df is None or df.empty:
-            return history or []
-
-        new_records = self._insert_price_rows(symbol, df, {h.date for h in history} if history else set())
-        full = (history or []) + new_records
-        full.sort(key=lambda x: x.date)
-        return full
+        counts = self._coalesced_fetch([symbol], start_date, end_date)
+        if counts is not None and not any(c["inserted"] or c["updated"] for c in counts.values()):
+            return history
+        return (
+            self.db.query(PriceHistory)
+            .join(PriceHistory.instrument)
+            .filter(
+                Instrument.symbol == symbol,
+                PriceHistory.date >= start_date,
+                PriceHistory.date <= end_date,
+            )
+            .order_by(PriceHistory.date)
+            .all()
+        )
 
     def batch_download_history(
         self, symbols: List[str], start_date: date, end_date: date = date.today()
     ) -> None:
         """
-        Batch-fetch price history for many symbols in ONE yf.download() call.
+        Batch-fetch price history for many symbols in ONE provider call.
         Only fetches symbols that have gaps in the DB for the given range.
         """
         if not symbols:
             return
         unique = list(set(symbols))
         self.ensure_instruments_exist(unique)
+        self.fetch_missing(unique, start_date, end_date)
 
-        # Determine which symbols need a fetch
-        to_fetch: List[str] = []
-        for sym in unique:
-            first_rec = (
-                self.db.query(PriceHistory)
-                .filter(PriceHistory.instrument_symbol == sym, PriceHistory.date >= start_date)
-                .order_by(PriceHistory.date)
-                .first()
-            )
-            last_rec = (
-                self.db.query(PriceHistory)
-                .filter(PriceHistory.instrument_symbol == sym, PriceHistory.date <= end_date)
-                .order_by(PriceHistory.date.desc())
-                .first()
-            )
-            needs_fetch = False
-            if not first_rec or not last_rec:
-                needs_fetch = True
-            else:
-                if first_rec.date > start_date + timedelta(days=5):
-                    needs_fetch = True
-                elif last_rec.date < end_date and last_rec.date < date.today():
-                    needs_fetch = True
-            if needs_fetch:
-                to_fetch.append(sym)
-
-        if not to_fetch:
-            return
-
-        logger.info(f"batch_download_history: fetching {len(to_fetch)} symbols from yfinance")
-        target_end = min(end_date, date.today()) + timedelta(days=1)
-
-        try:
-            _rate_limit()
-            if len(to_fetch) == 1:
-                df = yf.download(to_fetch[0], start=start_date, end=target_end, progress=False)
-                if df is not None and not df.empty:
-                    existing_dates = {
-                        r.date for r in self.db.query(PriceHistory.date)
-                        .filter(PriceHistory.instrument_symbol == to_fetch[0],
-                                PriceHistory.date >= start_date,
-                                PriceHistory.date <= end_date)
-                        .all()
-                    }
-                    self._insert_price_rows(to_fetch[0], df, existing_dates)
-            else:
-                df = yf.download(to_fetch, start=start_date, end=target_end,
-                                 progress=False, threads=True, group_by="ticker")
-                if df is not None and not df.empty:
-                    for sym in to_fetch:
-                        try:
-                            # group_by="ticker" gives df[sym] as a sub-DataFrame
-                            sym_df = df[sym].dropna(how="all") if sym in df.columns else None
-                            if sym_df is None or sym_df.empty:
-                                continue
-                            existing_dates = {
-                                r.date for r in self.db.query(PriceHistory.date)
-                                .filter(PriceHistory.instrument_symbol == sym,
-                                        PriceHistory.date >= start_date,
-                                        PriceHistory.date <= end_date)
-                                .all()
-                            }
-                            self._insert_price_rows(sym, sym_df, existing_dates)
-                        except Exception as e:
-                            logger.warning(f"batch_download_history: error for {sym}: {e}")
-        except Exception as e:
-            logger.error(f"batch_download_history failed: {e}")
+    def fetch_missing(
+        self, symbols: List[str], start_date: date, end_date: date
+    ) -> Optional[Dict[str, Dict[str, int]]]:
+        """
+        Fetch the price gaps of `symbols` in [start_date, end_date]: one
+        coverage lookup decides which symbols need a fetch, then one coalesced
+        provider fetch + bulk upsert for them (instrument rows must exist).
+        Returns upsert counts, or None if nothing needed fetching.
+        """
+        plan = self.coverage.plan(symbols, start_date, end_date)
+        if not plan:
+            return None
+        return self._coalesced_fetch(sorted(plan), start_date, end_date)
 
     # ──────────────────── BACKGROUND REFRESH ────────────────────
 
@@ -811,7 +803,7 @@ class MarketDataService:
         symbols = [i.symbol for i in all_instruments]
         today = date.today()
 
-        # 1) Batch-update instrument.current_price via yf.download
+        # 1) Batch-update instrument.current_price (one provider call)
         self.batch_sync_instruments(symbols)
 
         # 2) Fetch last 7 days of history for all (fills any gap to today)
@@ -822,86 +814,264 @@ class MarketDataService:
 
     # ──────────────────── INTERNAL HELPERS ────────────────────
 
-    def _yf_download_single(self, symbol: str, start: date, end: date):
-        """Download price history for a single symbol with retry."""
-        for attempt in range(3):
+    def _coalesced_fetch(
+        self, symbols: List[str], start_date: date, end_date: date
+    ) -> Optional[Dict[str, Dict[str, int]]]:
+        """
+        Fill price gaps for `symbols` once across concurrent callers.
+        In-process callers with the same (symbols, range) share one fetch;
+        across processes the leader holds one advisory lock per symbol and
+        re-plans once it has them, so a symbol another worker just ingested is
+        not fetched again. Returns upsert counts, or None if nothing was left
+        to fetch (another caller did the work — the caller should re-read).
+        """
+        def fetch() -> Optional[Dict[str, Dict[str, int]]]:
+            plan = self.coverage.plan(symbols, start_date, end_date)
+            if not plan:
+                return None
+            logger.info(f"Fetching history for {len(plan)} symbols from {self.provider.name}")
+            return self._fetch_and_ingest(plan, end_date)
+
+        key = f"history:{','.join(symbols)}:{start_date}:{end_date}"
+        return coalesce(
+            key, fetch,
+            bind=self.db.get_bind(),
+            lock_keys=[f"history:{s}" for s in symbols],
+        )
+
+    def _fetch_and_ingest(self, plan: Dict[str, date], end_date: date) -> Dict[str, Dict[str, int]]:
+        """
+        Execute a coverage fetch plan: one provider call per distinct fetch
+        window, one bulk upsert for everything returned, then update coverage.
+        A symbol that still has bars with the provider's old adjustment gets
+        its window widened over them, so they are rewritten as traded.
+        """
+        fetch_end = min(end_date, date.today())
+        wanted = [s for s in plan if not self.negative.blocked("history", s)]  # known-bad: wait for retry time
+        rebase = self._provider_adjusted_spans(wanted)
+        by_window: Dict[tuple, List[str]] = {}
+        for sym in wanted:
+            window = (plan[sym], fetch_end)
+            if sym in rebase:
+                lo, hi = rebase[sym]
+                window = (min(plan[sym], lo), max(fetch_end, hi))
+                rebase[sym] = window
+            by_window.setdefault(window, []).append(sym)
+
+        frames: Dict[str, Any] = {}
+        requested: Dict[str, tuple] = {}
+        for (fetch_start, window_end), syms in by_window.items():
+            got = self._download(syms, fetch_start, window_end + timedelta(days=1))
+            if got is None:
+                continue  # transport failure: leave coverage untouched so we retry
+            frames.update(got)
+            requested.update({s: (fetch_start, window_end) for s in syms})
+
+        later, failed = later_splits(self.provider, frames)
+        for sym in failed:  # basis unknown: store nothing, retry on the next request
+            frames.pop(sym, None)
+            requested.pop(sym, None)
+        rebase = {s: w for s, w in rebase.items() if frames.get(s) is not None and not frames[s].empty}
+        try:
+            counts, held = self._upsert_price_frames(frames, later, rebase)
+        except Exception:
+            return {}
+        # Quarantined bars are not coverage: their dates stay retryable
+        self.coverage.record(requested, frames, held)
+        touch_bars(self.db, requested)
+        self._remember_history_outcome(requested, frames)
+        return counts
+
+    def _provider_adjusted_spans(self, symbols: List[str]) -> Dict[str, tuple]:
+        """{symbol: (first, last date)} of bars still holding the provider's old adjustment."""
+        if not symbols:
+            return {}
+        try:
+            rows = self.db.execute(_PROVIDER_ADJUSTED_SQL, {"symbols": symbols}).fetchall()
+        except Exception as e:
+            self.db.rollback()
+            logger.warning(f"provider-adjusted bars lookup failed: {e}")
+            return {}
+        return {r.symbol: (r.lo, r.hi) for r in rows}
+
+    def _remember_history_outcome(self, requested: Dict[str, tuple], frames: Dict[str, Any]) -> None:
+        """
+        A symbol that returned nothing and has never had a single bar is
+        unknown/delisted → negative cache. Empty ranges of a symbol with
+        history are ordinary holes and are left to the coverage index.
+        """
+        empty = [s for s in requested if frames.get(s) is None or frames[s].empty]
+        self.negative.record_success("history", [s for s in requested if s not in empty])
+        if not empty:
+            return
+        coverage = self.coverage.load(empty)
+        never_seen = [s for s in empty if coverage.get(s) is None or coverage[s].first_date is None]
+        self.negative.record_failure("history", never_seen, "provider returned no price history")
+
+    # ──────────────────── QUARANTINE RE-VALIDATION ────────────────────
+
+    def revalidate_quarantined(self, limit: int = 50) -> int:
+        """
+        Re-check quarantined symbols whose retry time has passed (background
+        retrier). Symbols that answer again are released and their coverage
+        row is reset so the next request fetches their full history.
+        Returns the number of symbols released.
+        """
+        try:
+            due = self.negative.due(limit)
+        except Exception as e:
+            logger.warning(f"revalidate_quarantined: cannot list due symbols: {e}")
+            return 0
+        released = 0
+
+        history_syms = [sym for kind, sym, _ in due if kind == "history"]
+        if history_syms:
+            today = date.today()
+            frames = self._download(history_syms, today - timedelta(days=10), today + timedelta(days=1))
+            if frames is not None:
+                ok = [s for s in history_syms if s in frames]
+                self.negative.record_success("history", ok)
+                self.negative.record_failure(
+                    "history", [s for s in history_syms if s not in frames], "still no data on re-validation"
+                )
+                if ok:
+                    self.db.query(PriceCoverage).filter(PriceCoverage.symbol.in_(ok)).delete(
+                        synchronize_session=False
+                    )
+                    self.db.commit()
+                released += len(ok)
+
+        for kind, sym, _ in due:
+            if kind != "info":
+                continue
             try:
-                _rate_limit()
-                ticker = yf.Ticker(symbol)
-                df = ticker.history(start=start, end=end)
-                return df
+                info = self.provider.info(sym)
             except Exception as e:
                 err = str(e).lower()
-                if "429" in err or "too many requests" in err:
-                    time.sleep(2 ** (attempt + 1))
-                    continue
-                elif "404" in err or "not found" in err:
-                    logger.warning(f"No price data for {symbol}")
-                    return None
-                else:
-                    logger.error(f"Error fetching history for {symbol}: {e}")
-                    return None
-        return None
+                if "404" in err or "not found" in err:
+                    self.negative.record_failure("info", [sym], str(e))
+                continue
+            if _info_has_data(info):
+                self.negative.record_success("info", [sym])
+                released += 1
+            else:
+                self.negative.record_failure("info", [sym], "still empty on re-validation")
 
-    def _insert_price_rows(
-        self, symbol: str, df, existing_dates: Set[date]
-    ) -> List[PriceHistory]:
-        """Insert new rows and update existing stale rows from a yfinance DataFrame."""
-        new_records: List[PriceHistory] = []
-        for idx, row in df.iterrows():
-            d = idx.date() if hasattr(idx, 'date') else idx
-            try:
-                close_val = row.get("Close")
-                if close_val is None:
-                    continue
-                close_f = float(close_val)
-                open_f = float(row["Open"]) if row.get("Open") is not None else None
-                high_f = float(row["High"]) if row.get("High") is not None else None
-                low_f = float(row["Low"]) if row.get("Low") is not None else None
-                vol_f = float(row["Volume"]) if row.get("Volume") is not None else None
-
-                if d in existing_dates:
-                    # Update existing row if price changed (fixes stale 0-return gaps)
-                    existing = (
-                        self.db.query(PriceHistory)
-                        .filter(PriceHistory.instrument_symbol == symbol, PriceHistory.date == d)
-                        .first()
-                    )
-                    if existing and existing.close != close_f:
-                        existing.open = open_f
-                        existing.high = high_f
-                        existing.low = low_f
-                        existing.close = close_f
-                        existing.adjusted_close = close_f
-                        existing.volume = vol_f
-                    continue
-
-                rec = PriceHistory(
-                    instrument_symbol=symbol,
-                    date=d,
-                    open=open_f,
-                    high=high_f,
-                    low=low_f,
-                    close=close_f,
-                    volume=vol_f,
-                    adjusted_close=close_f,
-                )
-                self.db.add(rec)
-                new_records.append(rec)
-            except (ValueError, TypeError) as e:
-                logger.warning(f"Skipping bad row for {symbol} on {idx}: {e}")
+        if due:
+            logger.info(f"Quarantine re-validation: {released}/{len(due)} symbols released")
+        return released
 
+    def _download(self, symbols: List[str], start: date, end: date) -> Optional[Dict[str, Any]]:
+        """
+        Download price history with retry.
+        Returns {symbol: frame} (possibly empty), or None if the provider failed.
+        """
+        try:
+            return _with_retry(lambda: self.provider.history(symbols, start, end), 3)
+        except Exception as e:
+            err = str(e).lower()
+            if "404" in err or "not found" in err:
+                logger.warning(f"No price data for {symbols}")
+                return {}
+            logger.error(f"Error fetching history for {symbols}: {e}")
+            return None
+
+    def _upsert_price_frames(
+        self, frames: Dict[str, Any], later: Optional[Actions] = None,
+        rebase: Optional[Dict[str, tuple]] = None,
+    ) -> Tuple[Dict[str, Dict[str, int]], Dict[str, List[date]]]:
+        """
+        Vectorized ingestion: every provider frame is flattened into column
+        arrays and written with one INSERT … SELECT FROM unnest(…) per chunk,
+        symbols mapped to instrument ids in the same statement (bars of
+        symbols without an instruments row are skipped). Existing bars are
+        only rewritten when the close actually changed (provider
+        corrections) or the bar still holds the provider's old adjustment.
+        The download is screened first: suspect bars are written to
+        price_quarantine instead, and stored clean bars release their
+        quarantine rows. Bars are then un-split to the stored basis — with
+        `later`, the splits after the frames (later_splits) — and the
+        actions are recorded in corporate_actions after them. Old-basis bars
+        left in a `rebase` window {symbol: (start, end)} are deleted. The
+        latest_prices rows of symbols whose bars or actions changed are
+        refreshed before the commit.
+        Returns ({symbol: {inserted, updated, unchanged, quarantined}},
+        {symbol: [quarantined dates]}); database errors are logged and
+        re-raised after rollback.
+        """
+        actions = merge_actions(extract_actions(frames), later or {})
+        frames, suspects = screen_frames(self.db, frames, actions)
         try:
+            frames, actions = unsplit_frames(self.db, frames, actions)
+        except Exception as e:
+            self.db.rollback()
+            logger.error(f"Price upsert: loading splits failed: {e}")
+            raise
+        cols = _frames_to_columns(frames)
+        total = len(cols["symbols"])
+        counts: Dict[str, Dict[str, int]] = {
+            sym: {"inserted": 0, "updated": 0, "unchanged": n, "quarantined": 0}
+            for sym, n in cols["per_symbol"].items()
+        }
+        for sym, n in suspects["symbol"].value_counts().items():
+            counts.setdefault(sym, {"inserted": 0, "updated": 0, "unchanged": 0, "quarantined": 0})["quarantined"] = int(n)
+        held = held_dates(suspects)
+        dropped: set = set()
+        if total == 0 and not actions and suspects.empty and not rebase:
+            return counts, held
+
+        try:
+            for lo in range(0, total, _UPSERT_CHUNK):
+                hi = lo + _UPSERT_CHUNK
+                rows = self.db.execute(_UPSERT_PRICES_SQL, {
+                    k: cols[k][lo:hi]
+                    for k in ("symbols", "dates", "opens", "highs", "lows", "closes", "volumes")
+                }).fetchall()
+                for sym, inserted in rows:
+                    c = counts[sym]
+                    c["inserted" if inserted else "updated"] += 1
+                    c["unchanged"] -= 1
+            quarantine_bars(self.db, suspects)
+            release_bars(self.db, cols["symbols"], cols["dates"])
+            changed = {s for s, c in counts.items() if c["inserted"] or c["updated"]}
+            if rebase:
+                starts, ends = zip(*rebase.values())
+                dropped = {r[0] for r in self.db.execute(_DROP_PROVIDER_ADJUSTED_SQL, {
+                    "symbols": list(rebase), "starts": list(starts), "ends": list(ends),
+                })}
+                changed |= dropped
+            changed.update(record_actions(self.db, actions))
+            # Same transaction: latest_prices never disagrees with committed history
+            versions = self.latest.refresh(sorted(changed))
             self.db.commit()
-        except IntegrityError:
+        except Exception as e:
             self.db.rollback()
-            logger.warning(f"IntegrityError for {symbol}, retrying one-by-one")
-            # Retry individual inserts to save what we can
-            for rec in new_records:
-                try:
-                    self.db.merge(rec)
-                    self.db.commit()
-                except Exception:
-                    self.db.rollback()
-        return new_records
+            logger.error(f"Price upsert failed for {len(counts)} symbols: {e}")
+            raise
+
+        # Write the committed bars through to the mmap price store and cached matrices
+        store = get_price_store()
+        if store is not None:
+            try:
+                if dropped:
+                    store.invalidate(dropped)
+                store.write_columns(cols["symbols"], cols["dates"], cols["closes"], versions)
+            except Exception as e:
+                logger.warning(f"price store write-through failed: {e}")
+        cache = get_matrix_cache()
+        if cache is not None:
+            try:
+                # Deleted bars cannot be applied: leave those symbols a version behind, so they reload
+                fresh = {s: v for s, v in versions.items() if s not in dropped}
+                cache.apply_bars(cols["symbols"], cols["dates"], cols["closes"], fresh)
+            except Exception as e:
+                logger.warning(f"matrix cache update failed: {e}")
+
+        ins = sum(c["inserted"] for c in counts.values())
+        upd = sum(c["updated"] for c in counts.values())
+        logger.info(
+            f"Price upsert: {len(counts)} symbols, {total} bars → "
+            f"{ins} inserted, {upd} updated, {total - ins - upd} unchanged, {len(suspects)} quarantined"
+        )
+        return counts, held
 
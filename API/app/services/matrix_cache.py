@@ -0,0 +1,320 @@
+"""
+In-process LRU cache of aligned price matrices.
+
+Dashboards ask for the same portfolios' analytics all day; each call used to
+rebuild the dates × symbols matrix from storage. MatrixCache keeps the raw
+(unfilled) matrix per symbol set:
+
+    key      sorted symbol tuple
+    days     int day numbers of the rows (dates on which any symbol traded)
+    values   len(days) × N float64, NaN = no bar
+    lo, hi   calendar-day span the rows are complete for
+    versions latest_prices.data_version per symbol when the rows were read —
+             a counter every write of the symbol's bars or actions bumps
+
+A request inside [lo, hi] with unchanged versions is a slice. A request past
+either end loads only the missing span and grows the entry. When ingestion
+in this process lands new bars (apply_bars), cached matrices are updated
+instead of dropped: bars on new days are appended as rows, revised bars on
+existing rows are patched, and the symbols take the counters the write
+produced — only when the entry was exactly one write behind, otherwise a
+write elsewhere came in between and the column must still reload. A version
+that moved on without passing through this process
+(another worker or host ingested, corrected or released bars anywhere in the
+span) reloads the changed symbols' columns over the whole span.
+
+Arrays are never modified in place — updates build new arrays and swap the
+entry — so a reader holding a slice is never affected. Entries are evicted
+least-recently-used to stay under PRICE_MATRIX_CACHE_MAX_BYTES.
+
+With shared memory enabled (shared_matrix), a new or updated entry is
+published host-wide and the cache keeps read-only views onto the segment; a
+worker missing a symbol set attaches the published matrix before going to
+storage, then applies the same span and version checks to it.
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+from datetime import date
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.core.config import settings
+from app.services.price_store import _date, _day, _group_by_symbol
+from app.services.shared_matrix import get_shared_registry
+
+logger = logging.getLogger(__name__)
+
+Key = Tuple[str, ...]
+Versions = Dict[str, Optional[int]]
+Loader = Callable[[Sequence[str], date, date], pd.DataFrame]
+
+
+class _Entry:
+    __slots__ = ("symbols", "pos", "days", "values", "lo", "hi", "versions", "nbytes", "shared")
+
+    def __init__(self, symbols: Key, days: np.ndarray, values: np.ndarray, lo: int, hi: int, versions: Versions,
+                 shared: bool = False):
+        self.symbols = symbols
+        self.shared = shared                    # arrays are read-only views onto a shared_matrix segment
+        self.pos = {s: j for j, s in enumerate(symbols)}
+        self.days = days
+        self.values = values
+        self.lo, self.hi = lo, hi
+        self.versions = dict(versions)
+        self.nbytes = days.nbytes + values.nbytes
+
+
+def _to_rows(frame: pd.DataFrame, symbols: Key) -> Tuple[np.ndarray, np.ndarray]:
+    """Loader frame → (days, values) with columns in `symbols` order."""
+    if frame.empty:
+        return np.empty(0, dtype=np.int64), np.empty((0, len(symbols)))
+    days = frame.index.values.astype("datetime64[D]").astype(np.int64)
+    values = frame.reindex(columns=list(symbols)).to_numpy(dtype=float)
+    return days, values
+
+
+def _replace_columns(days, values, cols: List[int], new_days, new_values) -> Tuple[np.ndarray, np.ndarray]:
+    """Rows with columns `cols` replaced by (new_days, new_values); new days become rows."""
+    all_days = np.union1d(days, new_days)
+    out = np.full((len(all_days), values.shape[1]), np.nan)
+    out[np.searchsorted(all_days, days)] = values
+    out[:, cols] = np.nan
+    out[np.ix_(np.searchsorted(all_days, new_days), cols)] = new_values
+    return all_days, out
+
+
+def _follows(cached: Optional[int], written: Optional[int]) -> bool:
+    """`written` is the write right after `cached` (None: the symbol had no latest_prices row)."""
+    if written is None:
+        return False
+    return written == (cached or 0) + 1
+
+
+def _merge_rows(days_a, values_a, days_b, values_b) -> Tuple[np.ndarray, np.ndarray]:
+    """Union of two disjoint row sets, sorted by day."""
+    days = np.concatenate([days_a, days_b])
+    order = np.argsort(days, kind="stable")
+    return days[order], np.vstack([values_a, values_b])[order]
+
+
+class MatrixCache:
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Key, _Entry]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "attached": 0, "partial": 0, "misses": 0, "appends": 0, "evictions": 0}
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries), bytes=self._bytes, max_bytes=self.max_bytes)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    # ── reads ──
+    def get(
+        self, symbols: Sequence[str], start: date, end: date, versions: Versions, load: Loader,
+    ) -> pd.DataFrame:
+        """
+        Raw dates × symbols closes for [start, end] (columns in `symbols`
+        order, symbols without data omitted). `load(symbols, lo, hi)` reads a
+        span from storage when the cache cannot answer.
+        """
+        key: Key = tuple(sorted(set(symbols)))
+        lo, hi = _day(start), _day(min(end, date.today()))
+        if not key or lo > hi:
+            return pd.DataFrame()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+
+        attached = False
+        if entry is None:
+            entry = self._attach(key)
+            attached = entry is not None
+
+        if entry is None:
+            days, values = _to_rows(load(list(key), start, end), key)
+            entry = _Entry(key, days, values, lo, hi, versions)
+            self._count("misses")
+        else:
+            fresh = self._extend(entry, lo, hi, versions, load)
+            self._count("partial" if fresh is not entry else "attached" if attached else "hits")
+            entry = fresh
+        entry = self._share(entry)
+        self._put(entry)
+        return self._slice(entry, symbols, lo, hi)
+
+    def _extend(self, entry: _Entry, lo: int, hi: int, versions: Versions, load: Loader) -> _Entry:
+        """Entry covering [lo, hi] with current versions (the same object when nothing changed)."""
+        days, values = entry.days, entry.values
+        e_lo, e_hi = entry.lo, entry.hi
+
+        changed = [s for s in entry.symbols if versions.get(s) != entry.versions.get(s)]
+        if lo >= e_lo and hi <= e_hi and not changed:
+            return entry
+        if changed:
+            # The counter does not say which bars moved: reload those columns over the whole span
+            d, v = _to_rows(load(changed, _date(e_lo), _date(e_hi)), tuple(changed))
+            days, values = _replace_columns(days, values, [entry.pos[s] for s in changed], d, v)
+
+        spans: List[Tuple[int, int]] = []
+        if lo < e_lo:
+            spans.append((lo, e_lo - 1))
+        if hi > e_hi:
+            spans.append((e_hi + 1, hi))
+        for a, b in spans:
+            d, v = _to_rows(load(list(entry.symbols), _date(a), _date(b)), entry.symbols)
+            days, values = _merge_rows(days, values, d, v)
+        return _Entry(entry.symbols, days, values, min(lo, e_lo), max(hi, e_hi), versions)
+
+    @staticmethod
+    def _slice(entry: _Entry, symbols: Sequence[str], lo: int, hi: int) -> pd.DataFrame:
+        a, b = np.searchsorted(entry.days, [lo, hi + 1])
+        block = entry.values[a:b]
+        cols = [s for s in dict.fromkeys(symbols) if s in entry.pos]
+        idx = [entry.pos[s] for s in cols]
+        has_data = ~np.isnan(block).all(axis=0) if len(block) else np.zeros(len(entry.symbols), dtype=bool)
+        cols_idx = [(s, j) for s, j in zip(cols, idx) if has_data[j]]
+        rows = block[:, [j for _, j in cols_idx]]
+        keep = ~np.isnan(rows).all(axis=1) if rows.shape[1] else np.zeros(len(rows), dtype=bool)
+        index = pd.to_datetime(entry.days[a:b][keep], unit="D")
+        return pd.DataFrame(rows[keep], index=index, columns=[s for s, _ in cols_idx])
+
+    # ── writes ──
+    def apply_bars(
+        self, symbols: Sequence[str], dates: Sequence[date], closes: Sequence[Optional[float]],
+        versions: Optional[Versions] = None,
+    ) -> None:
+        """
+        Fold freshly ingested bars (flattened upsert columns) into every cached
+        matrix that contains their symbol: bars on existing rows are patched,
+        bars on new days are appended (or inserted) as rows. `versions` are the
+        symbols' data_version counters as the same write's transaction left
+        them; an entry one write behind takes them over, so the write is not
+        reloaded.
+        """
+        versions = versions or {}
+        if not len(symbols) and not versions:
+            return
+        bars = _group_by_symbol(symbols, dates, closes) if len(symbols) else {}
+        with self._lock:
+            targets = [
+                (k, e) for k, e in self._entries.items()
+                if any(s in e.pos for s in bars) or any(s in e.pos for s in versions)
+            ]
+        for key, entry in targets:
+            updated = self._apply(entry, bars, versions)
+            if updated is entry:
+                continue
+            updated = self._share(updated)
+            with self._lock:
+                if self._entries.get(key) is not entry:
+                    continue                    # replaced concurrently; the newer read wins
+                self._bytes -= entry.nbytes
+                self._entries[key] = updated
+                self._bytes += updated.nbytes
+                self._stats["appends"] += 1
+
+    @staticmethod
+    def _apply(entry: _Entry, bars: Dict[str, Tuple[np.ndarray, np.ndarray]], written: Versions) -> _Entry:
+        """
+        New entry with the bars inside [lo, hi] applied. The span is complete,
+        so a bar day missing from the axis is a day no other symbol traded: it
+        becomes a new row (NaN elsewhere). Bars outside the span are loaded by
+        the read that extends the span to them.
+        """
+        mine = {}
+        for sym, (d, v) in bars.items():
+            j = entry.pos.get(sym)
+            if j is not None:
+                inside = (d >= entry.lo) & (d <= entry.hi)
+                if inside.any():
+                    mine[j] = (sym, d[inside], v[inside])
+        versions = dict(entry.versions)
+        versions.update({s: v for s, v in written.items() if s in entry.pos and _follows(entry.versions.get(s), v)})
+        if not mine:
+            if versions == entry.versions:
+                return entry
+            return _Entry(entry.symbols, entry.days, entry.values, entry.lo, entry.hi, versions, shared=entry.shared)
+
+        days, values = entry.days, entry.values
+        new_days = np.setdiff1d(np.concatenate([d for _, d, _ in mine.values()]), days)
+        if len(new_days):
+            days, values = _merge_rows(days, values, new_days, np.full((len(new_days), len(entry.symbols)), np.nan))
+        else:
+            values = values.copy()
+
+        for j, (sym, d, v) in mine.items():
+            values[np.searchsorted(days, d), j] = v
+        return _Entry(entry.symbols, days, values, entry.lo, entry.hi, versions)
+
+    # ── other workers (shared_matrix) ──
+    @staticmethod
+    def _attach(key: Key) -> Optional[_Entry]:
+        """Entry over the segment another worker published for `key`, if any."""
+        registry = get_shared_registry()
+        if registry is None:
+            return None
+        try:
+            shared = registry.attach(key)
+        except Exception as e:
+            logger.warning(f"matrix cache: attaching shared matrix failed: {e}")
+            return None
+        return _Entry(key, *shared, shared=True) if shared is not None else None
+
+    @staticmethod
+    def _share(entry: _Entry) -> _Entry:
+        """Publish a privately built entry so other workers can attach it; returns the shared twin."""
+        registry = get_shared_registry()
+        if registry is None or entry.shared:
+            return entry
+        try:
+            shared = registry.publish(entry.symbols, entry.days, entry.values, entry.lo, entry.hi, entry.versions)
+        except Exception as e:
+            logger.warning(f"matrix cache: publishing shared matrix failed: {e}")
+            return entry
+        return _Entry(entry.symbols, *shared, shared=True) if shared is not None else entry
+
+    # ── bookkeeping ──
+    def _count(self, field: str) -> None:
+        with self._lock:
+            self._stats[field] += 1
+
+    def _put(self, entry: _Entry) -> None:
+        with self._lock:
+            old = self._entries.pop(entry.symbols, None)
+            if old is not None:
+                self._bytes -= old.nbytes
+            if entry.nbytes > self.max_bytes:
+                return
+            self._entries[entry.symbols] = entry
+            self._bytes += entry.nbytes
+            while self._bytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.nbytes
+                self._stats["evictions"] += 1
+
+
+# ────────────── process-wide cache ──────────────
+_cache: Optional[MatrixCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_matrix_cache() -> Optional[MatrixCache]:
+    """The shared cache (None when PRICE_MATRIX_CACHE_MAX_BYTES is 0)."""
+    global _cache
+    if _cache is None and settings.PRICE_MATRIX_CACHE_MAX_BYTES > 0:
+        with _cache_lock:
+            if _cache is None:
+                _cache = MatrixCache(settings.PRICE_MATRIX_CACHE_MAX_BYTES)
+    return _cache
@@ -0,0 +1,165 @@
+"""
+Negative cache and quarantine for symbols the provider cannot serve.
+
+Unknown or delisted tickers used to be retried on every request. Failures are
+now remembered per (kind, symbol) in `negative_results`:
+
+  • each failure pushes `retry_after` out by an escalating TTL
+    (5 min × 4^(failures-1), capped at 7 days) — until then hot paths skip
+    the symbol without calling the provider;
+  • after _QUARANTINE_AFTER consecutive failures the symbol is quarantined:
+    hot paths skip it unconditionally and only the background retrier
+    (MarketDataService.revalidate_quarantined) may clear it;
+  • any success deletes the row.
+
+Only "the provider has no such data" outcomes are recorded; transport errors
+and rate limiting are not the symbol's fault and never count.
+
+Reads go through an in-process snapshot of the table, refreshed every
+_SNAPSHOT_TTL seconds (the table is small), so checks cost no queries. Writes
+use their own connection so they never interfere with the caller's session.
+"""
+
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Tuple
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+_BASE_TTL = 300                  # seconds after the first failure
+_TTL_GROWTH = 4
+_MAX_TTL = 7 * 24 * 3600
+_QUARANTINE_AFTER = 3
+_SNAPSHOT_TTL = 30.0
+
+_RECORD_FAILURE_SQL = text("""
+    INSERT INTO negative_results
+        (kind, symbol, status, failures, first_failed_at, last_failed_at, retry_after, last_error)
+    SELECT :kind, s, CASE WHEN :quarantine_after <= 1 THEN 'quarantined' ELSE 'failing' END, 1,
+           now() AT TIME ZONE 'utc', now() AT TIME ZONE 'utc',
+           now() AT TIME ZONE 'utc' + make_interval(secs => :base), :error
+    FROM unnest(CAST(:symbols AS text[])) AS s
+    ON CONFLICT (kind, symbol) DO UPDATE SET
+        failures       = negative_results.failures + 1,
+        status         = CASE WHEN negative_results.failures + 1 >= :quarantine_after
+                              THEN 'quarantined' ELSE 'failing' END,
+        last_failed_at = excluded.last_failed_at,
+        retry_after    = excluded.last_failed_at + make_interval(secs => LEAST(
+                             :base * power(:growth, negative_results.failures), :max_ttl)),
+        last_error     = excluded.last_error
+    RETURNING symbol, status, retry_after
+""")
+
+_ALL_SQL = text("SELECT kind, symbol, status, retry_after FROM negative_results")
+
+_DUE_SQL = text("""
+    SELECT kind, symbol, failures FROM negative_results
+    WHERE status = 'quarantined' AND retry_after <= now() AT TIME ZONE 'utc'
+    ORDER BY retry_after
+    LIMIT :limit
+""")
+
+Entry = Tuple[str, datetime]     # (status, retry_after)
+
+
+class NegativeCache:
+    def __init__(self, bind):
+        self.bind = bind
+        self._entries: Dict[Tuple[str, str], Entry] = {}
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    # ── reads ──
+    def _snapshot(self) -> Dict[Tuple[str, str], Entry]:
+        if time.monotonic() - self._loaded_at < _SNAPSHOT_TTL:
+            return self._entries
+        with self._lock:
+            if time.monotonic() - self._loaded_at < _SNAPSHOT_TTL:
+                return self._entries
+            try:
+                with self.bind.connect() as conn:
+                    rows = conn.execute(_ALL_SQL).fetchall()
+                self._entries = {(k, s): (status, until) for k, s, status, until in rows}
+            except Exception as e:
+                logger.warning(f"negative cache refresh failed: {e}")
+            self._loaded_at = time.monotonic()
+        return self._entries
+
+    def blocked(self, kind: str, symbol: str) -> bool:
+        """True if hot paths should not ask the provider for `symbol` right now."""
+        entry = self._snapshot().get((kind, symbol))
+        if entry is None:
+            return False
+        status, retry_after = entry
+        return status == "quarantined" or datetime.utcnow() < retry_after
+
+    def allowed(self, kind: str, symbols: Iterable[str]) -> List[str]:
+        """Subset of `symbols` that are not currently blocked."""
+        return [s for s in symbols if not self.blocked(kind, s)]
+
+    def quarantined(self, kind: str) -> List[str]:
+        return sorted(s for (k, s), (status, _) in self._snapshot().items()
+                      if k == kind and status == "quarantined")
+
+    def due(self, limit: int = 50) -> List[Tuple[str, str, int]]:
+        """Quarantined (kind, symbol, failures) whose retry time has passed."""
+        with self.bind.connect() as conn:
+            return [tuple(r) for r in conn.execute(_DUE_SQL, {"limit": limit}).fetchall()]
+
+    # ── writes ──
+    def record_failure(self, kind: str, symbols: Iterable[str], error: str = "") -> None:
+        symbols = sorted(set(symbols))
+        if not symbols:
+            return
+        try:
+            with self.bind.begin() as conn:
+                rows = conn.execute(_RECORD_FAILURE_SQL, {
+                    "kind": kind, "symbols": symbols, "error": (error or "")[:500],
+                    "base": _BASE_TTL, "growth": _TTL_GROWTH, "max_ttl": _MAX_TTL,
+                    "quarantine_after": _QUARANTINE_AFTER,
+                }).fetchall()
+        except Exception as e:
+            logger.warning(f"negative cache: could not record {kind} failure for {symbols}: {e}")
+            return
+        with self._lock:
+            for sym, status, until in rows:
+                self._entries[(kind, sym)] = (status, until)
+                if status == "quarantined":
+                    logger.info(f"negative cache: {kind} {sym} quarantined until re-validated")
+
+    def record_success(self, kind: str, symbols: Iterable[str]) -> None:
+        """Forget failures for `symbols` (no query unless one is actually known)."""
+        snapshot = self._snapshot()
+        known = sorted({s for s in symbols if (kind, s) in snapshot})
+        if not known:
+            return
+        try:
+            with self.bind.begin() as conn:
+                conn.execute(
+                    text("DELETE FROM negative_results WHERE kind = :kind AND symbol = ANY(:symbols)"),
+                    {"kind": kind, "symbols": known},
+                )
+        except Exception as e:
+            logger.warning(f"negative cache: could not clear {kind} {known}: {e}")
+            return
+        with self._lock:
+            for sym in known:
+                self._entries.pop((kind, sym), None)
+
+
+# ────────────── one cache per engine ──────────────
+_caches: Dict[int, NegativeCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_negative_cache(bind) -> NegativeCache:
+    engine = getattr(bind, "engine", bind)
+    cache = _caches.get(id(engine))
+    if cache is None:
+        with _caches_lock:
+            cache = _caches.setdefault(id(engine), NegativeCache(engine))
+    return cache
@@ -17,8 +17,8 @@ from datetime import date, timedelta
 from typing import List, Dict, Any, Optional
 
 from app.models.portfolio import Portfolio
-from app.models.instrument import PriceHistory
 from app.services.market_data import MarketDataService
+from app.services.price_matrix import PriceMatrixLoader
 
 
 class OptimizationService:
@@ -31,44 +31,10 @@ class OptimizationService:
         end_date = date.today()
         start_date = end_date - timedelta(days=365 * 2)
 
-        # Batch update/fetch
-        try:
-            self.md_service.batch_sync_instruments(symbols)
-            self.md_service.batch_download_history(symbols, start_date, end_date)
-        except Exception as e:
-            logger.error(f"Batch fetch failed: {e}")
-
-        # Single bulk DB query for ALL symbols instead of N individual queries
-        rows = (
-            self.db.query(
-                PriceHistory.instrument_symbol,
-                PriceHistory.date,
-                PriceHistory.adjusted_close,
-                PriceHistory.close,
-            )
-            .filter(
-                PriceHistory.instrument_symbol.in_(symbols),
-                PriceHistory.date >= start_date,
-                PriceHistory.date <= end_date,
-            )
-            .order_by(PriceHistory.date)
-            .all()
-        )
-
-        price_data: Dict[str, pd.Series] = {}
-        # Group rows by symbol
-        from collections import defaultdict
-        by_sym: Dict[str, List] = defaultdict(list)
-        for sym, dt, adj_close, close in rows:
-            by_sym[sym].append((dt, adj_close or close))
-
-        for sym, data in by_sym.items():
-            dates = [d[0] for d in data]
-            prices = [d[1] for d in data]
-            price_data[sym] = pd.Series(data=prices, index=pd.to_datetime(dates))
-
-        df = pd.DataFrame(price_data).ffill().dropna()
-        return df
+        # One instrument sync, one fetch plan, one read (see price_matrix.py)
+        return PriceMatrixLoader(self.db, self.md_service).load(
+            symbols, start_date, end_date, sync_instruments=True
+        )["prices"]
 
     def _current_weights(self, portfolio: Portfolio, df: pd.DataFrame) -> Dict[str, float]:
         values: Dict[str, float] = {}
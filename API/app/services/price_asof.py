@@ -0,0 +1,143 @@
+"""
+Vectorized as-of price lookup: "close on or before date D" for many
+(symbol, date) pairs at once.
+
+Daily change, position entry valuation and transaction pricing all ask the
+same question for a grid of symbols and dates. Answering it one date (or one
+symbol) per SQL query made the cost grow with the grid; here it is one
+matrix read and one np.searchsorted, whatever the number of pairs:
+
+  1. read      — PriceMatrixLoader.read() over [min date − staleness, max date]
+                 for every symbol involved: raw closes from the matrix cache /
+                 mmap price store, NaN on days without a bar;
+  2. keys      — every bar becomes one int64 key  symbol_code × width + day,
+                 taken column-major, so the key array is already sorted;
+  3. join      — each query's key is searchsorted into it (side="right" − 1 →
+                 the last bar at or before the date). A hit is kept when it
+                 belongs to the same symbol and is at most max_staleness_days
+                 older than the requested date.
+
+Staleness defaults to PRICE_ASOF_MAX_STALENESS_DAYS (7 calendar days, the
+window the single-date lookups always used for weekends and holidays).
+Prices default to the "split" adjustment (comparable with today's quote
+across splits, dividends not reinvested); see corporate_actions.py.
+"""
+
+import logging
+from datetime import date, timedelta
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.services.market_data import MarketDataService
+from app.services.price_matrix import PriceMatrixLoader
+
+logger = logging.getLogger(__name__)
+
+_EPOCH = np.datetime64("1970-01-01", "D")
+
+
+def _days(dates: Sequence[date]) -> np.ndarray:
+    """Dates → int64 day numbers (1970-01-01 = 0)."""
+    return (np.asarray(dates, dtype="datetime64[D]") - _EPOCH).astype(np.int64)
+
+
+class AsOfPrices:
+    def __init__(self, db: Session, md_service: Optional[MarketDataService] = None):
+        self.db = db
+        self.loader = PriceMatrixLoader(db, md_service)
+
+    def lookup(
+        self,
+        symbols: Sequence[str],
+        dates: Sequence[date],
+        max_staleness_days: Optional[int] = None,
+        fetch: bool = False,
+        adjust: str = "split",
+    ) -> Dict[str, np.ndarray]:
+        """
+        As-of join of parallel symbol / date vectors. Returns
+        {"price": float64 (NaN = no bar within the staleness limit),
+         "date": datetime64[D] of the bar used (NaT when missing)}, both
+        aligned with the inputs.
+
+        fetch=True first lets the loader fetch missing history from the
+        provider (coverage plan + one coalesced download); the default reads
+        only stored prices. adjust: "split" | "total" | "raw".
+        """
+        if len(symbols) != len(dates):
+            raise ValueError(f"as-of lookup needs parallel vectors ({len(symbols)} symbols, {len(dates)} dates)")
+        n = len(symbols)
+        prices = np.full(n, np.nan)
+        found = np.full(n, np.datetime64("NaT"), dtype="datetime64[D]")
+        if n == 0:
+            return {"price": prices, "date": found}
+
+        staleness = settings.PRICE_ASOF_MAX_STALENESS_DAYS if max_staleness_days is None else max_staleness_days
+        codes, uniques = pd.factorize(np.asarray(symbols, dtype=object), sort=True)
+        qdays = _days(dates)
+        start = date(1970, 1, 1) + timedelta(days=int(qdays.min()) - staleness)
+        end = date(1970, 1, 1) + timedelta(days=int(qdays.max()))
+
+        names = [str(s) for s in uniques]
+        if fetch:
+            frame = self.loader.load(names, start, end, fetch=True, dropna=False, ffill=False, adjust=adjust)["prices"]
+        else:
+            frame = self.loader.read(names, start, end, adjust)
+        if frame.empty:
+            return {"price": prices, "date": found}
+
+        # Column order = symbol codes; symbols the read returned nothing for stay all-NaN
+        values = frame.reindex(columns=names).to_numpy(dtype=np.float64)
+        row_days = _days(frame.index.values)
+        lo = int(row_days[0])
+        row_days -= lo
+        width = int(row_days[-1]) + 1
+
+        bar_code, bar_row = np.nonzero(~np.isnan(values.T))     # column-major → sorted keys
+        bar_day = row_days[bar_row]
+        keys = bar_code.astype(np.int64) * width + bar_day
+        rel = qdays - lo
+        qkeys = codes.astype(np.int64) * width + np.clip(rel, -1, width - 1)
+
+        pos = np.searchsorted(keys, qkeys, side="right") - 1
+        safe = np.maximum(pos, 0)
+        hit = (
+            (pos >= 0) & (rel >= 0)
+            & (bar_code[safe] == codes)
+            & (rel - bar_day[safe] <= staleness)
+        ) if len(keys) else np.zeros(n, dtype=bool)
+
+        prices[hit] = values[bar_row[safe[hit]], codes[hit]]
+        found[hit] = _EPOCH + (bar_day[safe[hit]] + lo)
+        return {"price": prices, "date": found}
+
+    def grid(
+        self,
+        symbols: Sequence[str],
+        dates: Sequence[date],
+        max_staleness_days: Optional[int] = None,
+        fetch: bool = False,
+        adjust: str = "split",
+    ) -> pd.DataFrame:
+        """As-of prices for every symbol on every date → DataFrame (dates × symbols, NaN = missing)."""
+        symbols, dates = list(symbols), list(dates)
+        out = self.lookup(
+            np.tile(np.asarray(symbols, dtype=object), len(dates)),
+            np.repeat(np.asarray(dates, dtype="datetime64[D]"), len(symbols)),
+            max_staleness_days, fetch, adjust,
+        )
+        return pd.DataFrame(
+            out["price"].reshape(len(dates), len(symbols)),
+            index=pd.to_datetime(dates), columns=symbols,
+        )
+
+    def prices_on(
+        self, symbols: Sequence[str], target_date: date, max_staleness_days: Optional[int] = None,
+    ) -> Dict[str, float]:
+        """{symbol: price on or before target_date} for one date (symbols without a price omitted)."""
+        prices = self.lookup(symbols, [target_date] * len(symbols), max_staleness_days)["price"]
+        return {s: float(p) for s, p in zip(symbols, prices) if p == p and p}
@@ -0,0 +1,257 @@
+"""
+Price coverage index.
+
+`price_coverage` keeps one row per symbol (first_date, last_date,
+last_fetched_at, known_holes) so deciding what to fetch for any set of
+symbols is a single primary-key lookup instead of several ORDER BY … LIMIT 1
+probes per symbol. Rows are written by ingestion after every provider fetch.
+
+known_holes are date ranges the provider was asked for and returned no bars
+(pre-IPO history, delisted tails). They stop the same empty range from being
+re-requested on every analytics call. Holes never extend to today, so a bar
+that simply hasn't printed yet is retried (at most once per refresh TTL).
+
+The "is there a gap" check uses the symbol's exchange calendar
+(trading_calendar.py), so weekends and exchange holidays never trigger a fetch.
+
+Bars the quality screen held back (price_quarantine) are neither coverage nor
+holes: record() leaves them out of both. plan() treats a quarantined date as
+settled while its last screening is younger than the refresh TTL, and fetches
+again from the symbol's oldest quarantined date in the range once it is
+older, so a clean re-delivery can release it.
+"""
+
+import logging
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from app.models.instrument import Instrument, PriceCoverage, PriceHistory
+from app.services.price_quality import quarantined_dates
+from app.services.trading_calendar import calendar_for_symbol
+
+logger = logging.getLogger(__name__)
+
+_EARLY_SLACK = timedelta(days=5)        # first bar may lag the requested start (weekends/holidays)
+_REFRESH_TTL = timedelta(minutes=15)    # min gap between provider calls for today's bar
+_MAX_HOLES = 20
+
+Hole = Tuple[date, date]
+
+
+def _parse_holes(raw: Optional[List[Any]]) -> List[Hole]:
+    holes: List[Hole] = []
+    for item in raw or []:
+        try:
+            holes.append((date.fromisoformat(item[0]), date.fromisoformat(item[1])))
+        except (TypeError, ValueError, IndexError):
+            continue
+    return holes
+
+
+def _union(holes: List[Hole]) -> List[Hole]:
+    merged: List[Hole] = []
+    for lo, hi in sorted(h for h in holes if h[0] <= h[1]):
+        if merged and lo <= merged[-1][1] + timedelta(days=1):
+            merged[-1] = (merged[-1][0], max(merged[-1][1], hi))
+        else:
+            merged.append((lo, hi))
+    return merged
+
+
+def _merge_holes(holes: List[Hole]) -> List[Hole]:
+    return _union(holes)[-_MAX_HOLES:]
+
+
+def _without(holes: List[Hole], dates: List[date]) -> List[Hole]:
+    """Holes with `dates` cut out of them."""
+    cuts = sorted(set(dates))
+    out: List[Hole] = []
+    for lo, hi in holes:
+        for d in cuts:
+            if lo <= d <= hi:
+                if lo < d:
+                    out.append((lo, d - timedelta(days=1)))
+                lo = d + timedelta(days=1)
+        if lo <= hi:
+            out.append((lo, hi))
+    return out
+
+
+def _covered(holes: List[Hole], lo: date, hi: date) -> bool:
+    """True if [lo, hi] is empty or lies inside a single known hole."""
+    if lo > hi:
+        return True
+    return any(h_lo <= lo and hi <= h_hi for h_lo, h_hi in holes)
+
+
+class PriceCoverageIndex:
+    def __init__(self, db: Session):
+        self.db = db
+
+    def load(self, symbols: List[str]) -> Dict[str, PriceCoverage]:
+        """Coverage rows for `symbols`, bootstrapping missing ones from price_history."""
+        if not symbols:
+            return {}
+        rows = {
+            r.symbol: r
+            for r in self.db.query(PriceCoverage)
+            .filter(PriceCoverage.symbol.in_(symbols))
+            .execution_options(populate_existing=True)   # rows may have changed under a single-flight wait
+            .all()
+        }
+        missing = [s for s in symbols if s not in rows]
+        if missing:
+            rows.update(self._bootstrap(missing))
+        return rows
+
+    def plan(self, symbols: List[str], start_date: date, end_date: date) -> Dict[str, date]:
+        """
+        Fetch plan for a symbol set and date range → {symbol: fetch_start}.
+        Symbols whose stored history already covers the range are omitted.
+        """
+        today = date.today()
+        needed_through = min(end_date, today)
+        now = datetime.utcnow()
+        coverage = self.load(list(set(symbols)))
+        held = quarantined_dates(self.db, sorted(set(symbols)), start_date, needed_through, _REFRESH_TTL)
+
+        plan: Dict[str, date] = {}
+        for sym in set(symbols):
+            cov = coverage.get(sym)
+            if cov is None or cov.first_date is None or cov.last_date is None:
+                plan[sym] = start_date
+                continue
+            # Recently screened quarantine dates count as settled; due ones are fetched again
+            holes = _union(_parse_holes(cov.known_holes) + [(d, d) for d, due in held.get(sym, ()) if not due])
+
+            if cov.first_date > start_date + _EARLY_SLACK and not _covered(
+                holes, start_date, cov.first_date - timedelta(days=1)
+            ):
+                plan[sym] = start_date
+                continue
+
+            # Only sessions can carry a bar: a weekend or exchange holiday at the
+            # end of the range is not a gap.
+            expected_last = calendar_for_symbol(sym).last_session_on_or_before(needed_through)
+            if cov.last_date >= expected_last:
+                continue
+            gap_start = cov.last_date + timedelta(days=1)
+            past_gap_known = _covered(holes, gap_start, min(expected_last, today - timedelta(days=1)))
+            fresh = cov.last_fetched_at is not None and now - cov.last_fetched_at < _REFRESH_TTL
+            if past_gap_known and (expected_last < today or fresh):
+                continue
+            plan[sym] = gap_start
+
+        for sym, dates in held.items():
+            due = [d for d, is_due in dates if is_due]
+            if due:
+                plan[sym] = min(plan.get(sym, due[0]), due[0])
+        return plan
+
+    def record(
+        self,
+        requested: Dict[str, Tuple[date, date]],
+        frames: Dict[str, Any],
+        held: Optional[Dict[str, List[date]]] = None,
+    ) -> None:
+        """
+        Update coverage after a provider fetch.
+        `requested` maps symbol → (fetch_start, fetch_end inclusive); `frames`
+        holds whatever the provider returned for those symbols; `held` the
+        dates of those bars the quality screen quarantined instead of storing.
+        """
+        held = held or {}
+        if not requested:
+            return
+        today = date.today()
+        last_closed = today - timedelta(days=1)
+        existing = {
+            r.symbol: r
+            for r in self.db.query(PriceCoverage).filter(PriceCoverage.symbol.in_(list(requested))).all()
+        }
+        now = datetime.utcnow()
+        values = []
+        for sym, (fetch_start, fetch_end) in requested.items():
+            cov = existing.get(sym)
+            holes = _parse_holes(cov.known_holes) if cov else []
+            df = frames.get(sym)
+            first = cov.first_date if cov else None
+            last = cov.last_date if cov else None
+            skip = set(held.get(sym, ()))
+            got = [] if df is None else sorted(
+                d for d in (x.date() if hasattr(x, "date") else x for x in df.index) if d not in skip
+            )
+
+            if not got:
+                holes.append((fetch_start, min(fetch_end, last_closed)))
+            else:
+                got_first, got_last = got[0], got[-1]
+                first = min(first, got_first) if first else got_first
+                last = max(last, got_last) if last else got_last
+                # drop holes the new data contradicts, then record the empty edges
+                holes = [h for h in holes if h[1] < got_first or h[0] > got_last]
+                if got_first > fetch_start + _EARLY_SLACK:
+                    holes.append((fetch_start, got_first - timedelta(days=1)))
+                if got_last < fetch_end:
+                    holes.append((got_last + timedelta(days=1), min(fetch_end, last_closed)))
+
+            holes = _without(holes, list(skip))
+            values.append({
+                "symbol": sym,
+                "first_date": first,
+                "last_date": last,
+                "last_fetched_at": now,
+                "known_holes": [[lo.isoformat(), hi.isoformat()] for lo, hi in _merge_holes(holes)],
+            })
+
+        stmt = pg_insert(PriceCoverage).values(values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[PriceCoverage.symbol],
+            set_={
+                "first_date": func.least(PriceCoverage.first_date, stmt.excluded.first_date),
+                "last_date": func.greatest(PriceCoverage.last_date, stmt.excluded.last_date),
+                "last_fetched_at": stmt.excluded.last_fetched_at,
+                "known_holes": stmt.excluded.known_holes,
+            },
+        )
+        try:
+            self.db.execute(stmt)
+            self.db.commit()
+        except Exception as e:
+            self.db.rollback()
+            logger.warning(f"price_coverage update failed for {len(values)} symbols: {e}")
+
+    # ── internals ──
+    def _bootstrap(self, symbols: List[str]) -> Dict[str, PriceCoverage]:
+        """Seed coverage for symbols ingested before the index existed (one GROUP BY)."""
+        agg = (
+            self.db.query(
+                Instrument.symbol,
+                func.min(PriceHistory.date),
+                func.max(PriceHistory.date),
+            )
+            .select_from(PriceHistory)
+            .join(PriceHistory.instrument)
+            .filter(Instrument.symbol.in_(symbols))
+            .group_by(Instrument.symbol)
+            .all()
+        )
+        if not agg:
+            return {}
+        values = [
+            {"symbol": sym, "first_date": lo, "last_date": hi, "last_fetched_at": None, "known_holes": []}
+            for sym, lo, hi in agg
+        ]
+        try:
+            self.db.execute(
+                pg_insert(PriceCoverage).values(values).on_conflict_do_nothing(index_elements=[PriceCoverage.symbol])
+            )
+            self.db.commit()
+        except Exception as e:
+            self.db.rollback()
+            logger.warning(f"price_coverage bootstrap failed: {e}")
+        return {v["symbol"]: PriceCoverage(**v) for v in values}
@@ -0,0 +1,111 @@
+"""
+Bulk price-matrix loader shared by analytics, backtesting and optimization.
+
+Every service needs the same thing: an aligned dates × symbols matrix of
+adjusted closes for a symbol set and a date range. PriceMatrixLoader.load()
+does it in a fixed number of round trips regardless of the symbol count:
+
+  1. instrument rows  — ensure_instruments_exist (or batch_sync_instruments,
+     which adds one provider quotes() call for stale current prices);
+  2. one fetch plan   — a single price_coverage lookup, then at most one
+     coalesced provider fetch + bulk upsert for the symbols with gaps;
+  3. one read         — the in-process matrix cache (matrix_cache), which
+     only goes to storage for spans it does not hold: the mmap price store,
+     or one SQL query whose Core row tuples go straight into NumPy
+     (price_store.load_price_frame); every layer holds closes as traded,
+     and the split / dividend factors are applied last (corporate_actions,
+     one small query);
+  4. alignment        — forward-fill, then drop the leading rows where some
+     symbol has not started trading yet (dropna=True).
+
+read() is step 3 alone: closes with NaN where a symbol has no bar (the
+as-of engine in price_asof.py needs to know which days actually printed).
+adjust picks the series: "total" (splits and dividends, the default — a
+total-return series), "split" or "raw".
+"""
+
+import logging
+from datetime import date
+from typing import Any, Dict, Optional, Sequence
+
+import pandas as pd
+from sqlalchemy.orm import Session
+
+from app.services.corporate_actions import adjusted
+from app.services.market_data import MarketDataService
+from app.services.matrix_cache import get_matrix_cache
+from app.services.price_store import load_price_frame
+
+logger = logging.getLogger(__name__)
+
+
+class PriceMatrixLoader:
+    def __init__(self, db: Session, md_service: Optional[MarketDataService] = None):
+        self.db = db
+        self.md = md_service or MarketDataService(db)
+
+    def load(
+        self,
+        symbols: Sequence[str],
+        start: date,
+        end: date,
+        fetch: bool = True,
+        sync_instruments: bool = False,
+        dropna: bool = True,
+        ffill: bool = True,
+        adjust: str = "total",
+    ) -> Dict[str, Any]:
+        """
+        Returns {"prices": forward-filled DataFrame (dates × symbols, symbols
+        without data omitted), "instruments": {symbol: Instrument}}.
+
+        fetch=False reads only what the database already holds;
+        sync_instruments=True also refreshes stale current prices in one
+        provider call; dropna=False keeps rows before a symbol's first bar (NaN);
+        ffill=False leaves days without a bar as NaN; adjust as in read().
+        """
+        symbols = list(dict.fromkeys(s for s in symbols if s))
+        if not symbols:
+            return {"prices": pd.DataFrame(), "instruments": {}}
+
+        if sync_instruments:
+            try:
+                instruments = self.md.batch_sync_instruments(symbols)
+            except Exception as e:
+                logger.warning(f"PriceMatrixLoader: instrument sync failed: {e}")
+                instruments = self.md.ensure_instruments_exist(symbols)
+        else:
+            instruments = self.md.ensure_instruments_exist(symbols)
+
+        if fetch:
+            try:
+                self.md.fetch_missing(symbols, start, end)
+            except Exception as e:
+                logger.warning(f"PriceMatrixLoader: history fetch failed, using stored prices: {e}")
+
+        prices = self.read(symbols, start, end, adjust)
+        if ffill:
+            prices = prices.ffill()
+        if dropna:
+            prices = prices.dropna()
+        return {"prices": prices, "instruments": instruments}
+
+    def read(self, symbols: Sequence[str], start: date, end: date, adjust: str = "total") -> pd.DataFrame:
+        """Unfilled closes, adjusted for corporate actions (`adjust`): the stored matrix, then the factors."""
+        return adjusted(self.db, self._read_stored(symbols, start, end), adjust)
+
+    def _read_stored(self, symbols: Sequence[str], start: date, end: date) -> pd.DataFrame:
+        """Stored closes through the matrix cache, versioned by each symbol's data_version."""
+        cache = get_matrix_cache()
+        if cache is None:
+            return load_price_frame(self.db, symbols, start, end)
+        try:
+            versions = self.md.latest.versions(list(symbols))
+            return cache.get(
+                symbols, start, end, versions,
+                lambda syms, lo, hi: load_price_frame(self.db, syms, lo, hi),
+            )
+        except Exception as e:
+            logger.warning(f"PriceMatrixLoader: matrix cache read failed: {e}")
+            self.db.rollback()
+            return load_price_frame(self.db, symbols, start, end)
@@ -0,0 +1,378 @@
+"""
+Data-quality screen for provider bars, run over a whole download before
+anything reaches price_history.
+
+Yahoo occasionally serves bars that are wrong rather than missing: zero or
+negative closes, prints in the wrong unit (pence for pounds, ×100), and the
+previous close repeated on a day nothing traded. Stored, they turn into
+±100% returns in every pct_change downstream. screen_frames() checks every
+bar of every frame at once — one long (symbol, date) array with up to
+_CONTEXT_BARS stored closes in front of each symbol for context, no
+per-symbol loop over the checks:
+
+    non_positive    close ≤ 0 / missing, or a negative open, high, low or volume
+    unit_glitch     close ≥ _UNIT_RATIO × off the median of its ±2 neighbours
+    return_spike    return beyond PRICE_QUALITY_RETURN_Z robust z-scores
+                    (median / MAD of the symbol's returns), reverted by the
+                    next bar
+    no_volume_move  such a return on a zero-volume bar of a symbol that
+                    otherwise reports volume
+    stale_repeat    the previous close again, with zero volume on a symbol
+                    that reports volume, or as the PRICE_QUALITY_STALE_RUN-th
+                    identical close in a row
+
+The checks run on the provider's basis (every split applied), with the
+stored context converted to it, so a split is not a jump. Suspect bars are
+written to price_quarantine with their reasons, in the upsert's transaction,
+instead of price_history; a later download that delivers the same bar clean
+releases it. Quarantined dates do not count as covered (price_coverage), and
+the fetch planner asks for them again once their last screening is older
+than its refresh TTL; every fetch over a quarantined date re-stamps
+detected_at, so a bar the provider keeps serving wrong (or stops serving) is
+retried at that pace, not on every request. PRICE_QUALITY_RETURN_Z = 0 turns
+the screen off.
+"""
+
+import logging
+from datetime import timedelta
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.services.corporate_actions import Actions, _suffix_product, split_factors
+from app.services.price_store import _day
+
+logger = logging.getLogger(__name__)
+
+_CONTEXT_BARS = 20      # stored closes read in front of each symbol's first new bar
+_UNIT_RATIO = 20.0      # factor off the neighbours' median that can only be a unit error
+_MIN_SCALE = 0.002      # floor of the robust return scale (flat or very short series)
+_REVERT = 0.25          # a spike is reverted when less than this share of it remains
+
+NON_POSITIVE, UNIT_GLITCH, RETURN_SPIKE, NO_VOLUME_MOVE, STALE_REPEAT = 1, 2, 4, 8, 16
+REASONS = {
+    NON_POSITIVE: "non_positive",
+    UNIT_GLITCH: "unit_glitch",
+    RETURN_SPIKE: "return_spike",
+    NO_VOLUME_MOVE: "no_volume_move",
+    STALE_REPEAT: "stale_repeat",
+}
+_FIELDS = ("Open", "High", "Low", "Close", "Volume")
+
+_CONTEXT_SQL = text("""
+    SELECT f.s, c.date, c.close, c.volume
+    FROM unnest(CAST(:symbols AS varchar[]), CAST(:firsts AS date[])) AS f(s, d)
+    JOIN instruments i ON i.symbol = f.s
+    CROSS JOIN LATERAL (
+        SELECT p.date, p.close, p.volume FROM price_history p
+        WHERE p.instrument_id = i.id AND p.date < f.d AND p.close > 0
+        ORDER BY p.date DESC
+        LIMIT :n
+    ) c
+""")
+
+_QUARANTINE_SQL = text("""
+    INSERT INTO price_quarantine (symbol, date, open, high, low, close, volume, reasons, zscore, detected_at)
+    SELECT t.s, t.d, t.o, t.h, t.l, t.c, t.v, t.r, t.z, now()
+    FROM unnest(
+        CAST(:symbols AS varchar[]), CAST(:dates AS date[]),
+        CAST(:opens AS float8[]), CAST(:highs AS float8[]), CAST(:lows AS float8[]),
+        CAST(:closes AS float8[]), CAST(:volumes AS float8[]),
+        CAST(:reasons AS varchar[]), CAST(:zscores AS float8[])
+    ) AS t(s, d, o, h, l, c, v, r, z)
+    JOIN instruments i ON i.symbol = t.s
+    ON CONFLICT (symbol, date) DO UPDATE SET
+        open = excluded.open, high = excluded.high, low = excluded.low,
+        close = excluded.close, volume = excluded.volume,
+        reasons = excluded.reasons, zscore = excluded.zscore, detected_at = excluded.detected_at
+""")
+
+_HELD_DATES_SQL = text("""
+    SELECT symbol, date, detected_at < now() - make_interval(secs => :ttl)
+    FROM price_quarantine
+    WHERE symbol = ANY(CAST(:symbols AS varchar[])) AND date BETWEEN :lo AND :hi
+    ORDER BY symbol, date
+""")
+
+_TOUCH_SQL = text("""
+    UPDATE price_quarantine q SET detected_at = now()
+    FROM unnest(CAST(:symbols AS varchar[]), CAST(:los AS date[]), CAST(:his AS date[])) AS t(s, lo, hi)
+    WHERE q.symbol = t.s AND q.date BETWEEN t.lo AND t.hi
+""")
+
+_HELD_SQL = text("SELECT DISTINCT symbol FROM price_quarantine WHERE symbol = ANY(CAST(:symbols AS varchar[]))")
+
+_RELEASE_SQL = text("""
+    DELETE FROM price_quarantine q
+    USING unnest(CAST(:symbols AS varchar[]), CAST(:dates AS date[])) AS t(s, d)
+    WHERE q.symbol = t.s AND q.date = t.d
+""")
+
+
+def _nullable(values: np.ndarray) -> List[Any]:
+    return np.where(np.isnan(values), None, values).tolist()
+
+
+def _by_symbol(values: np.ndarray, codes: np.ndarray, how: str) -> np.ndarray:
+    """Per-symbol aggregate of `values`, broadcast back to every row."""
+    return pd.Series(values).groupby(codes).transform(how).to_numpy(dtype=np.float64)
+
+
+# ────────────── checks ──────────────
+def screen_bars(
+    codes: np.ndarray,
+    opens: np.ndarray, highs: np.ndarray, lows: np.ndarray,
+    closes: np.ndarray, volumes: np.ndarray,
+    z_limit: float, stale_run: int,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Bars sorted by (symbol code, date) → (reason bit flags, return z-scores),
+    one entry per bar. Pure array code: context rows go in like any other
+    bar and the caller ignores their flags.
+    """
+    n = len(closes)
+    flags = np.zeros(n, dtype=np.int64)
+    zscores = np.full(n, np.nan)
+    with np.errstate(invalid="ignore"):
+        bad = ~(closes > 0) | (opens < 0) | (highs < 0) | (lows < 0) | (volumes < 0)
+    flags[bad] |= NON_POSITIVE
+
+    # Everything else on the valid bars only, so a zero close cannot distort its neighbours
+    idx = np.flatnonzero(~bad)
+    m = len(idx)
+    if m == 0:
+        return flags, zscores
+    g, c, v = codes[idx], closes[idx], volumes[idx]
+    pos = np.arange(m)
+    first = np.r_[True, g[1:] != g[:-1]]
+
+    lc = np.log(c)
+    r = np.r_[np.nan, np.diff(lc)]
+    r[first] = np.nan
+    med = _by_symbol(r, g, "median")
+    mad = _by_symbol(np.abs(r - med), g, "median")
+    z = (r - med) / np.fmax(1.4826 * mad, _MIN_SCALE)
+    r_next, z_next = np.r_[r[1:], np.nan], np.r_[z[1:], np.nan]      # NaN across symbols (r[first])
+
+    with np.errstate(invalid="ignore"):
+        outlier = np.abs(z) >= z_limit
+        spike = (
+            outlier & (np.abs(z_next) >= z_limit)
+            & (np.sign(r) != np.sign(r_next))
+            & (np.abs(r + r_next) < _REVERT * np.abs(r))
+        )
+
+        # Level against the median of the ±2 neighbours of the same symbol
+        window = np.full((5, m), np.nan)
+        for k, off in enumerate(range(-2, 3)):
+            j = np.clip(pos + off, 0, m - 1)
+            same = (pos + off >= 0) & (pos + off < m) & (g[j] == g)
+            window[k] = np.where(same, lc[j], np.nan)
+        glitch = np.abs(lc - np.nanmedian(window, axis=0)) >= np.log(_UNIT_RATIO)
+
+        trades = _by_symbol((v > 0).astype(np.float64), g, "max") > 0
+        silent = (v == 0) & trades
+        after_spike = np.r_[False, spike[:-1]] & ~first
+        no_volume = outlier & silent & ~after_spike
+
+        repeat = np.r_[False, c[1:] == c[:-1]] & ~first
+        run_start = np.maximum.accumulate(np.where(repeat, 0, pos))
+        stale = repeat & (silent | (pos - run_start + 1 >= stale_run))
+
+    sub = np.zeros(m, dtype=np.int64)
+    sub[glitch] |= UNIT_GLITCH
+    sub[spike] |= RETURN_SPIKE
+    sub[no_volume] |= NO_VOLUME_MOVE
+    sub[stale] |= STALE_REPEAT
+    flags[idx] |= sub
+    zscores[idx] = z
+    return flags, zscores
+
+
+def reason_names(flags: int) -> str:
+    return ",".join(name for bit, name in REASONS.items() if flags & bit)
+
+
+# ────────────── ingestion stage ──────────────
+def screen_frames(db: Session, frames: Dict[str, Any], actions: Actions) -> Tuple[Dict[str, Any], pd.DataFrame]:
+    """
+    Provider frames (provider basis, before unsplit_frames) → (frames without
+    the suspect bars, suspects). Suspects: one row per held-back bar with
+    symbol, date, open, high, low, close, volume, reasons, zscore. Bars
+    without a close and duplicate dates are dropped as ingestion always did.
+    """
+    empty = pd.DataFrame(columns=["symbol", "date", "open", "high", "low", "close", "volume", "reasons", "zscore"])
+    if settings.PRICE_QUALITY_RETURN_Z <= 0:
+        return frames, empty
+
+    kept: Dict[str, pd.DataFrame] = {}
+    for sym, df in frames.items():
+        if df is None or df.empty or "Close" not in df.columns:
+            continue
+        dates = pd.DatetimeIndex(df.index).normalize()
+        closes = pd.to_numeric(df["Close"], errors="coerce").to_numpy(dtype=float)
+        keep = ~np.isnan(closes) & ~dates.duplicated(keep="last")
+        if keep.any():
+            kept[sym] = df[keep]
+    if not kept:
+        return frames, empty
+
+    symbols = sorted(kept)
+    new = {
+        name: np.concatenate([
+            pd.to_numeric(kept[s][name], errors="coerce").to_numpy(dtype=float) if name in kept[s].columns
+            else np.full(len(kept[s]), np.nan)
+            for s in symbols
+        ])
+        for name in _FIELDS
+    }
+    new_days = np.concatenate([
+        pd.DatetimeIndex(kept[s].index).normalize().values.astype("datetime64[D]").astype(np.int64) for s in symbols
+    ])
+    lengths = np.asarray([len(kept[s]) for s in symbols])
+    new_codes = np.repeat(np.arange(len(symbols)), lengths)
+
+    # Stored context on the provider's basis: raw close × later split factors
+    ctx_codes = ctx_days = np.zeros(0, dtype=np.int64)
+    ctx_closes = ctx_volumes = np.zeros(0)
+    try:
+        code_of = {s: i for i, s in enumerate(symbols)}
+        firsts = [pd.Timestamp(kept[s].index.min()).date() for s in symbols]
+        rows = db.execute(_CONTEXT_SQL, {"symbols": symbols, "firsts": firsts, "n": _CONTEXT_BARS}).fetchall()
+        if rows:
+            ctx_codes = np.asarray([code_of[r[0]] for r in rows], dtype=np.int64)
+            ctx_days = np.asarray([_day(r[1]) for r in rows], dtype=np.int64)
+            ctx_closes = np.asarray([r[2] for r in rows], dtype=float)
+            ctx_volumes = np.asarray([np.nan if r[3] is None else r[3] for r in rows], dtype=float)
+            for sym, (ex_days, factors) in split_factors(db, symbols, actions).items():
+                at = ctx_codes == code_of[sym]
+                ctx_closes[at] *= _suffix_product(ex_days, factors, ctx_days[at])
+    except Exception as e:
+        db.rollback()
+        logger.warning(f"Price screen: stored context unavailable, screening the download alone: {e}")
+        ctx_codes = ctx_days = np.zeros(0, dtype=np.int64)
+        ctx_closes = ctx_volumes = np.zeros(0)
+
+    nc = len(ctx_codes)
+    codes = np.r_[ctx_codes, new_codes]
+    days = np.r_[ctx_days, new_days]
+    is_new = np.r_[np.zeros(nc, dtype=bool), np.ones(len(new_codes), dtype=bool)]
+    blank = np.full(nc, np.nan)
+    cols = {
+        "Open": np.r_[blank, new["Open"]], "High": np.r_[blank, new["High"]], "Low": np.r_[blank, new["Low"]],
+        "Close": np.r_[ctx_closes, new["Close"]],
+        "Volume": np.r_[ctx_volumes, new["Volume"]],
+    }
+    order = np.lexsort((days, codes))
+    flags, zscores = screen_bars(
+        codes[order], cols["Open"][order], cols["High"][order], cols["Low"][order],
+        cols["Close"][order], cols["Volume"][order],
+        settings.PRICE_QUALITY_RETURN_Z, settings.PRICE_QUALITY_STALE_RUN,
+    )
+    # Back to download order, new bars only
+    new_flags = np.empty_like(flags)
+    new_flags[order] = flags
+    new_z = np.empty_like(zscores)
+    new_z[order] = zscores
+    new_flags, new_z = new_flags[is_new], new_z[is_new]
+
+    suspect = new_flags != 0
+    if not suspect.any():
+        return frames, empty
+
+    out = dict(frames)
+    bounds = np.r_[0, np.cumsum(lengths)]
+    for i, sym in enumerate(symbols):
+        held = suspect[bounds[i]:bounds[i + 1]]
+        if held.any():
+            out[sym] = kept[sym][~held]
+    suspects = pd.DataFrame({
+        "symbol": np.asarray(symbols, dtype=object)[new_codes[suspect]],
+        "date": (new_days[suspect].astype("datetime64[D]")).astype(object),
+        "open": new["Open"][suspect], "high": new["High"][suspect], "low": new["Low"][suspect],
+        "close": new["Close"][suspect], "volume": new["Volume"][suspect],
+        "reasons": [reason_names(int(f)) for f in new_flags[suspect]],
+        "zscore": new_z[suspect],
+    })
+    return out, suspects
+
+
+def quarantine_bars(db: Session, suspects: pd.DataFrame) -> int:
+    """Write suspect bars to price_quarantine in the caller's transaction (no commit)."""
+    if suspects.empty:
+        return 0
+    db.execute(_QUARANTINE_SQL, {
+        "symbols": suspects["symbol"].tolist(),
+        "dates": suspects["date"].tolist(),
+        "opens": _nullable(suspects["open"].to_numpy(dtype=float)),
+        "highs": _nullable(suspects["high"].to_numpy(dtype=float)),
+        "lows": _nullable(suspects["low"].to_numpy(dtype=float)),
+        "closes": _nullable(suspects["close"].to_numpy(dtype=float)),
+        "volumes": _nullable(suspects["volume"].to_numpy(dtype=float)),
+        "reasons": suspects["reasons"].tolist(),
+        "zscores": _nullable(suspects["zscore"].to_numpy(dtype=float)),
+    })
+    counts = suspects["reasons"].str.split(",").explode().value_counts().to_dict()
+    logger.warning(
+        f"Price screen: {len(suspects)} bars of {suspects['symbol'].nunique()} symbols quarantined "
+        f"({', '.join(f'{k} {v}' for k, v in counts.items())})"
+    )
+    return len(suspects)
+
+
+def release_bars(db: Session, symbols: List[str], dates: List[Any]) -> None:
+    """Drop quarantine rows for bars that were just stored clean (caller's transaction)."""
+    if not symbols:
+        return
+    held = {r[0] for r in db.execute(_HELD_SQL, {"symbols": sorted(set(symbols))})}
+    if not held:
+        return
+    pairs = [(s, d) for s, d in zip(symbols, dates) if s in held]
+    db.execute(_RELEASE_SQL, {"symbols": [s for s, _ in pairs], "dates": [d for _, d in pairs]})
+
+
+def held_dates(suspects: pd.DataFrame) -> Dict[str, List[Any]]:
+    """Quarantined bars of a screen → {symbol: [date, …]}."""
+    if suspects.empty:
+        return {}
+    return {sym: list(group["date"]) for sym, group in suspects.groupby("symbol")}
+
+
+def quarantined_dates(db: Session, symbols: List[str], lo: Any, hi: Any, ttl: timedelta) -> Dict[str, List[Tuple[Any, bool]]]:
+    """
+    Quarantined dates in [lo, hi] → {symbol: [(date, due), …]}; due when the
+    bar was last screened more than `ttl` ago.
+    """
+    if not symbols:
+        return {}
+    try:
+        rows = db.execute(_HELD_DATES_SQL, {"symbols": symbols, "lo": lo, "hi": hi, "ttl": ttl.total_seconds()})
+        out: Dict[str, List[Tuple[Any, bool]]] = {}
+        for sym, d, due in rows:
+            out.setdefault(sym, []).append((d, bool(due)))
+        return out
+    except Exception as e:
+        db.rollback()
+        logger.warning(f"Price screen: quarantine retry lookup failed: {e}")
+        return {}
+
+
+def touch_bars(db: Session, requested: Dict[str, Tuple[Any, Any]]) -> None:
+    """Re-stamp detected_at of quarantine rows inside the windows just fetched (commits)."""
+    if not requested:
+        return
+    syms = list(requested)
+    try:
+        db.execute(_TOUCH_SQL, {
+            "symbols": syms,
+            "los": [requested[s][0] for s in syms],
+            "his": [requested[s][1] for s in syms],
+        })
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.warning(f"Price screen: re-stamping quarantine rows failed: {e}")
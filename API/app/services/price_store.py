@@ -0,0 +1,438 @@
+"""
+Memory-mapped columnar price store.
+
+Analytics, backtests and optimization used to rebuild pd.Series objects from
+ORM PriceHistory rows on every call — one Python object per bar, per symbol,
+per request. This store keeps a host-local mirror of stored closes (as
+traded; corporate actions are applied above it, see corporate_actions.py):
+
+    <PRICE_STORE_DIR>/<symbol>.f64
+        header  4 × int64   base day, synced_lo, synced_hi, data_version
+        data    n × float64 close for day (base + i), NaN = no bar
+
+Days are counted from 1970-01-01, so every file shares one calendar-day axis
+and a date range is a plain slice. Files are opened with np.memmap in
+read-only mode; column() hands out those views without copying, matrix()
+copies each symbol's slice once into a dates × symbols array.
+
+[synced_lo, synced_hi] is the span known to mirror price_history exactly as
+of the symbol's latest_prices.data_version kept beside it. Reads extend it
+from the database on demand (one query for all symbols, Core tuples straight
+into NumPy), bounded by price_coverage so bars ingested on another host are
+picked up; a data_version that moved on without this host (a correction,
+quarantine release or deletion elsewhere) re-reads the requested span and
+drops the rest of the synced span. Ingestion on this host writes new bars
+through (write_columns) right after its commit, taking over the write's
+version only when the file was exactly one write behind.
+
+Writers serialise on a flock'd lock file, grow files in place (appending NaN
+pages) or, when history extends backwards, rewrite them and atomically
+replace the old file. Readers notice both through the file's (inode, size)
+and re-map. An empty PRICE_STORE_DIR disables the store; load_price_frame()
+then reads the same matrix straight from the database.
+"""
+
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from urllib.parse import quote
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows dev boxes: in-process lock only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+_EPOCH = date(1970, 1, 1).toordinal()
+_HEADER_SLOTS = 4
+_HEADER_BYTES = _HEADER_SLOTS * 8
+_GROW_DAYS = 366                 # slack appended when a file grows forwards
+_UNSYNCED = (1, 0)               # synced_lo > synced_hi = nothing mirrored yet
+
+_RANGES_SQL = text("""
+    SELECT r.s, p.date, p.close
+    FROM (
+        SELECT r.s, i.id, r.lo, r.hi
+        FROM unnest(CAST(:symbols AS varchar[]), CAST(:los AS date[]), CAST(:his AS date[])) AS r(s, lo, hi)
+        JOIN instruments i ON i.symbol = r.s
+        OFFSET 0    -- keeps (id, lo, hi) one row source so the date range reaches the pkey index condition
+    ) r
+    JOIN price_history p ON p.instrument_id = r.id AND p.date BETWEEN r.lo AND r.hi
+""")
+
+
+def _day(d: date) -> int:
+    return d.toordinal() - _EPOCH
+
+
+def _date(day: int) -> date:
+    return date.fromordinal(int(day) + _EPOCH)
+
+
+def query_closes(
+    db: Session, ranges: Dict[str, Tuple[date, date]]
+) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+    """
+    {symbol: (days, closes)} for per-symbol date ranges in ONE query; days
+    are int day numbers (sorted), closes float64. Symbols without rows are absent.
+    """
+    if not ranges:
+        return {}
+    syms = list(ranges)
+    rows = db.execute(_RANGES_SQL, {
+        "symbols": syms,
+        "los": [ranges[s][0] for s in syms],
+        "his": [ranges[s][1] for s in syms],
+    }).fetchall()
+    if not rows:
+        return {}
+    symbols, dates, closes = zip(*rows)
+    return _group_by_symbol(symbols, dates, closes)
+
+
+def _group_by_symbol(
+    symbols: Sequence[str], dates: Sequence[date], closes: Sequence[Optional[float]]
+) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+    """Parallel columns → {symbol: (sorted days, closes)} without a Python loop over rows."""
+    sym_arr = np.asarray(symbols, dtype=str)
+    day_arr = np.fromiter((d.toordinal() - _EPOCH for d in dates), dtype=np.int64, count=len(dates))
+    close_arr = np.asarray(closes, dtype=np.float64)   # None → NaN
+    order = np.lexsort((day_arr, sym_arr))
+    sym_arr, day_arr, close_arr = sym_arr[order], day_arr[order], close_arr[order]
+    cuts = np.flatnonzero(sym_arr[1:] != sym_arr[:-1]) + 1
+    bounds = np.concatenate(([0], cuts, [len(sym_arr)]))
+    return {
+        str(sym_arr[lo]): (day_arr[lo:hi], close_arr[lo:hi])
+        for lo, hi in zip(bounds[:-1], bounds[1:])
+    }
+
+
+def _frame_from_columns(
+    columns: Dict[str, Tuple[int, np.ndarray]], symbols: Sequence[str], start: date, end: date
+) -> pd.DataFrame:
+    """Dates × symbols frame from {symbol: (first day, values)}; rows where no symbol has a bar are dropped."""
+    lo, hi = _day(start), _day(end)
+    out = np.full((hi - lo + 1, len(symbols)), np.nan)
+    for j, sym in enumerate(symbols):
+        col = columns.get(sym)
+        if col is None:
+            continue
+        first, values = col
+        a, b = max(lo, first), min(hi, first + len(values) - 1)
+        if a <= b:
+            out[a - lo:b - lo + 1, j] = values[a - first:b - first + 1]
+    keep = ~np.isnan(out).all(axis=1)
+    index = pd.to_datetime(np.flatnonzero(keep) + lo, unit="D")
+    present = [j for j, s in enumerate(symbols) if s in columns]
+    return pd.DataFrame(out[keep][:, present], index=index, columns=[symbols[j] for j in present])
+
+
+# ═══════════════════════════════════════════════════════════════
+#  Store
+# ═══════════════════════════════════════════════════════════════
+class PriceStore:
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self._maps: Dict[str, Tuple[Tuple[int, int], np.ndarray, np.ndarray]] = {}
+        self._maps_lock = threading.Lock()
+        self._local = threading.Lock()  # flock is per-process; serialise our own threads first
+
+    def _path(self, symbol: str) -> str:
+        return os.path.join(self.root, quote(symbol, safe="") + ".f64")
+
+    @contextmanager
+    def _write_lock(self):
+        with self._local:
+            if fcntl is None:
+                yield
+                return
+            fd = os.open(os.path.join(self.root, ".lock"), os.O_RDWR | os.O_CREAT, 0o666)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                yield
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+                os.close(fd)
+
+    # ── reads ──
+    def _open(self, symbol: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """(header, data) read-only maps of the current file, re-mapped if it grew or was replaced."""
+        path = self._path(symbol)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        key = (st.st_ino, st.st_size)
+        with self._maps_lock:
+            cached = self._maps.get(symbol)
+            if cached is not None and cached[0] == key:
+                return cached[1], cached[2]
+            n = (st.st_size - _HEADER_BYTES) // 8
+            if n <= 0:
+                return None
+            header = np.memmap(path, dtype=np.int64, mode="r", shape=(_HEADER_SLOTS,))
+            data = np.memmap(path, dtype=np.float64, mode="r", offset=_HEADER_BYTES, shape=(n,))
+            self._maps[symbol] = (key, header, data)
+            return header, data
+
+    def synced(self, symbol: str) -> Optional[Tuple[date, date]]:
+        """Date span mirrored from price_history, or None."""
+        opened = self._open(symbol)
+        if opened is None:
+            return None
+        _, lo, hi = (int(x) for x in opened[0][:3])
+        return (_date(lo), _date(hi)) if lo <= hi else None
+
+    def column(self, symbol: str, start: date, end: date) -> Optional[Tuple[date, np.ndarray]]:
+        """(first date, read-only zero-copy view) of the stored closes within [start, end]."""
+        opened = self._open(symbol)
+        if opened is None:
+            return None
+        header, data = opened
+        base = int(header[0])
+        a, b = max(_day(start), base), min(_day(end), base + len(data) - 1)
+        if a > b:
+            return None
+        return _date(a), data[a - base:b - base + 1]
+
+    def matrix(self, symbols: Sequence[str], start: date, end: date) -> pd.DataFrame:
+        """Dates × symbols closes from the store alone (unfilled; callers ffill)."""
+        columns: Dict[str, Tuple[int, np.ndarray]] = {}
+        for sym in symbols:
+            col = self.column(sym, start, end)
+            if col is not None:
+                columns[sym] = (_day(col[0]), col[1])
+        return _frame_from_columns(columns, list(symbols), start, end)
+
+    # ── sync from the database ──
+    def version(self, symbol: str) -> Optional[int]:
+        """data_version the synced span mirrors, or None without a file."""
+        opened = self._open(symbol)
+        return int(opened[0][3]) if opened is not None else None
+
+    def sync(self, db: Session, symbols: Iterable[str], start: date, end: date) -> int:
+        """
+        Make sure every symbol mirrors price_history over [start, end] (bounded
+        by what price_coverage says the database holds) at its current
+        data_version. Returns the number of symbols that needed a database read.
+        """
+        from app.services.latest_prices import LatestPriceIndex
+        from app.services.price_coverage import PriceCoverageIndex
+
+        symbols = list(dict.fromkeys(symbols))
+        end = min(end, date.today())
+        if not symbols or start > end:
+            return 0
+        # Versions before bars: a write in between leaves the file a version behind, never ahead
+        versions = LatestPriceIndex(db).versions(symbols)
+        coverage = PriceCoverageIndex(db).load(symbols)
+
+        gaps: Dict[str, List[Tuple[date, date]]] = {}
+        for sym in symbols:
+            cov = coverage.get(sym)
+            if cov is None or cov.first_date is None:
+                continue
+            lo, hi = max(start, cov.first_date), min(end, cov.last_date or end)
+            if lo > hi:
+                continue
+            have = self.synced(sym)
+            if have is not None and self.version(sym) != versions.get(sym, 0):
+                have = None                                # changed elsewhere: the mirror is stale
+            if have is None or have[1] < lo - timedelta(days=1) or have[0] > hi + timedelta(days=1):
+                gaps[sym] = [(lo, hi)]                     # nothing usable: read the whole span
+                continue
+            pieces = []
+            if lo < have[0]:
+                pieces.append((lo, have[0] - timedelta(days=1)))
+            if hi > have[1]:
+                pieces.append((have[1] + timedelta(days=1), hi))
+            if pieces:
+                gaps[sym] = pieces
+
+
+        if not gaps:
+            return 0
+        # One query: each symbol's hull of missing pieces (at most two, around the synced span)
+        ranges = {s: (p[0][0], p[-1][1]) for s, p in gaps.items()}
+        found = query_closes(db, ranges)
+        empty = (np.empty(0, dtype=np.int64), np.empty(0))
+        for sym, (lo, hi) in ranges.items():
+            days, closes = found.get(sym, empty)
+            self._write(sym, days, closes, clear=(_day(lo), _day(hi)), sync=(_day(lo), _day(hi)),
+                        version=versions.get(sym, 0))
+        logger.debug(f"price store: synced {len(ranges)} symbols from price_history")
+        return len(ranges)
+
+    def frame(self, db: Session, symbols: Sequence[str], start: date, end: date) -> pd.DataFrame:
+        self.sync(db, symbols, start, end)
+        return self.matrix(symbols, start, end)
+
+    # ── writes ──
+    def write_columns(
+        self, symbols: Sequence[str], dates: Sequence[date], closes: Sequence[Optional[float]],
+        versions: Optional[Dict[str, int]] = None,
+    ) -> None:
+        """
+        Write-through from ingestion (flattened upsert columns). Bars that
+        touch a symbol's synced span extend it; others wait for a sync().
+        `versions` are the data_version counters the write left.
+        """
+        if not len(symbols):
+            return
+        versions = versions or {}
+        for sym, (days, values) in _group_by_symbol(symbols, dates, closes).items():
+            ok = ~np.isnan(values)
+            if ok.any():
+                self._write(sym, days[ok], values[ok], clear=None, sync=None, version=versions.get(sym))
+
+    def invalidate(self, symbols: Iterable[str]) -> None:
+        """Forget what is mirrored for `symbols` (e.g. after rows were deleted)."""
+        with self._write_lock():
+            for sym in symbols:
+                # Remove the file rather than resetting its header: write-through
+                # bars outside the synced span would otherwise survive the next sync.
+                # Readers holding the old mapping keep it until they reopen.
+                try:
+                    os.remove(self._path(sym))
+                except FileNotFoundError:
+                    pass
+
+    def _write(
+        self, symbol: str, days: np.ndarray, values: np.ndarray,
+        clear: Optional[Tuple[int, int]], sync: Optional[Tuple[int, int]],
+        version: Optional[int] = None,
+    ) -> None:
+        """
+        Store `values` at `days`. `clear` NaN-fills a span first (database
+        reads are authoritative); `sync` is a span now known to mirror the
+        database at `version` and is merged into the header — or replaces
+        the synced span when the file mirrored another version. Without
+        `sync`, written days extend the synced span only if they touch it,
+        and `version` is taken over only when it is the file's next one.
+        """
+        span = [int(days.min()), int(days.max())] if len(days) else []
+        if clear is not None:
+            span += list(clear)
+        if not span:
+            return
+        need_lo, need_hi = min(span), max(span)
+        path = self._path(symbol)
+
+        with self._write_lock():
+            header = data = None
+            try:
+                if os.path.exists(path):
+                    header = np.fromfile(path, dtype=np.int64, count=_HEADER_SLOTS)
+                    base, lo, hi, stored = (int(x) for x in header)
+                    n = (os.path.getsize(path) - _HEADER_BYTES) // 8
+                else:
+                    base, (lo, hi), n, stored = need_lo, _UNSYNCED, 0, 0
+
+                if n == 0 or need_lo < base:
+                    # new file, or history extends backwards: rewrite and swap atomically
+                    new_base = need_lo if n == 0 else min(need_lo, base)
+                    new_n = max(need_hi, base + n - 1) - new_base + 1 + _GROW_DAYS
+                    arr = np.full(new_n, np.nan)
+                    if n:
+                        arr[base - new_base:base - new_base + n] = np.fromfile(
+                            path, dtype=np.float64, offset=_HEADER_BYTES, count=n)
+                    tmp = f"{path}.{os.getpid()}.tmp"
+                    with open(tmp, "wb") as f:
+                        f.write(np.array([new_base, lo, hi, stored], dtype=np.int64).tobytes())
+                        f.write(arr.tobytes())
+                    os.replace(tmp, path)
+                    base, n = new_base, new_n
+                elif need_hi >= base + n:
+                    grow = need_hi - (base + n) + 1 + _GROW_DAYS
+                    with open(path, "ab") as f:
+                        f.write(np.full(grow, np.nan).tobytes())
+                    n += grow
+
+                data = np.memmap(path, dtype=np.float64, mode="r+", offset=_HEADER_BYTES, shape=(n,))
+                if clear is not None:
+                    data[clear[0] - base:clear[1] - base + 1] = np.nan
+                if len(days):
+                    data[days - base] = values
+                data.flush()
+
+                if sync is not None and version is not None and version != stored:
+                    lo, hi = _UNSYNCED     # the old span mirrored another version
+                    stored = version
+                elif sync is None and version is not None and version == stored + 1:
+                    stored = version
+                touch = sync or ((int(days.min()), int(days.max())) if len(days) else None)
+                if touch is not None and lo <= hi and touch[0] <= hi + 1 and touch[1] >= lo - 1:
+                    lo, hi = min(lo, touch[0]), max(hi, touch[1])
+                elif sync is not None:
+                    lo, hi = sync          # disjoint from the old span: only the new one is known
+                header = np.memmap(path, dtype=np.int64, mode="r+", shape=(_HEADER_SLOTS,))
+                header[:] = (base, lo, hi, stored)
+                header.flush()
+            finally:
+                del header, data
+        with self._maps_lock:
+            self._maps.pop(symbol, None)
+
+
+# ────────────── process-wide store ──────────────
+_store: Optional[PriceStore] = None
+_store_lock = threading.Lock()
+_store_failed = False
+
+
+def get_price_store() -> Optional[PriceStore]:
+    """The store configured by settings.PRICE_STORE_DIR (None when disabled or unusable)."""
+    global _store, _store_failed
+    if _store is None and not _store_failed and settings.PRICE_STORE_DIR:
+        with _store_lock:
+            if _store is None and not _store_failed:
+                try:
+                    _store = PriceStore(settings.PRICE_STORE_DIR)
+                except OSError as e:
+                    logger.warning(f"price store disabled: cannot use {settings.PRICE_STORE_DIR}: {e}")
+                    _store_failed = True
+    return _store
+
+
+def set_price_store(store: Optional[PriceStore]) -> None:
+    """Swap the process-wide store (tests / benchmarks)."""
+    global _store
+    with _store_lock:
+        _store = store
+
+
+def load_price_frame(db: Session, symbols: Sequence[str], start: date, end: date) -> pd.DataFrame:
+    """
+    Dates × symbols stored closes for [start, end] (unfilled: NaN where a
+    symbol has no bar on a date some other symbol traded). Served from the
+    mmap store when enabled, otherwise straight from one database query.
+    """
+    symbols = list(dict.fromkeys(symbols))
+    if not symbols or start > end:
+        return pd.DataFrame()
+    store = get_price_store()
+    if store is not None:
+        try:
+            return store.frame(db, symbols, start, end)
+        except Exception as e:
+            logger.warning(f"price store read failed, using the database: {e}")
+            db.rollback()
+    found = query_closes(db, {s: (start, end) for s in symbols})
+    columns: Dict[str, Tuple[int, np.ndarray]] = {}
+    for sym, (days, closes) in found.items():
+        dense = np.full(int(days[-1] - days[0]) + 1, np.nan)
+        dense[days - days[0]] = closes
+        columns[sym] = (int(days[0]), dense)
+    return _frame_from_columns(columns, symbols, start, end)
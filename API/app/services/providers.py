@@ -0,0 +1,408 @@
+"""
+Market data providers.
+
+MarketDataService never talks to Yahoo directly — every outbound call goes
+through a MarketDataProvider:
+
+  • YFinanceProvider   — the live implementation (yf.download / Ticker / Search).
+  • ReplayProvider     — file-backed record/replay. In record mode it wraps an
+                         upstream provider and stores every response on disk;
+                         in replay mode it serves those responses (with an
+                         optional simulated latency) and never touches the
+                         network. Used for benchmarks, load tests and staging.
+
+The active provider is chosen by settings.MARKET_DATA_PROVIDER
+("yfinance" | "record" | "replay") and shared process-wide via get_provider().
+Network-bound providers are wrapped in the fetch scheduler, which owns rate
+limiting (see fetch_scheduler.py); replay runs unthrottled.
+"""
+
+import hashlib
+import io
+import json
+import logging
+import os
+import threading
+import time
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+import yfinance as yf
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+def _normalize_frame(df: Optional[pd.DataFrame]) -> Optional[pd.DataFrame]:
+    """Drop empty rows and strip the timezone so every provider returns the same shape."""
+    if df is None or df.empty:
+        return None
+    df = df.dropna(how="all")
+    if df.empty:
+        return None
+    if isinstance(df.index, pd.DatetimeIndex) and df.index.tz is not None:
+        df = df.copy()
+        df.index = df.index.tz_localize(None)
+    return df
+
+
+def _split_download(df: Optional[pd.DataFrame], symbols: List[str]) -> Dict[str, pd.DataFrame]:
+    """Split a yf.download(group_by="ticker") frame into {symbol: OHLCV frame}."""
+    frames: Dict[str, pd.DataFrame] = {}
+    if df is None or df.empty:
+        return frames
+    if not isinstance(df.columns, pd.MultiIndex):
+        # Older yfinance returns flat columns for a single ticker
+        sym_df = _normalize_frame(df)
+        if sym_df is not None and len(symbols) == 1:
+            frames[symbols[0]] = sym_df
+        return frames
+    available = set(df.columns.get_level_values(0))
+    for sym in symbols:
+        if sym not in available:
+            continue
+        sym_df = _normalize_frame(df[sym])
+        if sym_df is not None:
+            frames[sym] = sym_df
+    return frames
+
+
+# ═══════════════════════════════════════════════════════════════
+#  Provider interface
+# ═══════════════════════════════════════════════════════════════
+class MarketDataProvider:
+    """
+    Interface for every market-data backend.
+
+    Implementations raise on transport errors (so callers can retry on 429)
+    and return empty results when the upstream simply has no data.
+    """
+
+    name = "base"
+    # False when a multi-symbol history() swallows transport errors, so the
+    # fetch scheduler must not merge single-symbol requests into one
+    batch_history_raises = True
+
+    def history(self, symbols: List[str], start: date, end: date) -> Dict[str, pd.DataFrame]:
+        """
+        Daily OHLCV bars in [start, end) → {symbol: DataFrame indexed by date}.
+        Prices are adjusted for splits (not dividends); "Stock Splits" and
+        "Dividends" columns, when present, carry the corporate actions.
+        """
+        raise NotImplementedError
+
+    def splits(self, symbol: str, start: date) -> List[Tuple[date, float]]:
+        """
+        Splits with ex_date on or after `start`, through today → [(ex_date,
+        ratio)], oldest first. The splits history() prices are already
+        adjusted for, including those after the window it was asked for.
+        """
+        raise NotImplementedError
+
+    def quotes(self, symbols: List[str]) -> Dict[str, float]:
+        """Latest close for each symbol → {symbol: price}."""
+        raise NotImplementedError
+
+    def info(self, symbol: str) -> Dict[str, Any]:
+        """Raw instrument metadata (Yahoo `Ticker.info` shape)."""
+        raise NotImplementedError
+
+    def search(self, query: str, max_results: int = 10) -> List[Dict[str, Any]]:
+        """Candidate listings for a free-text query (Yahoo `Search.quotes` shape)."""
+        raise NotImplementedError
+
+    def fx_rate(self, from_ccy: str, to_ccy: str) -> Optional[float]:
+        """Spot rate for the direct pair from_ccy→to_ccy, or None if unquoted."""
+        raise NotImplementedError
+
+
+# ═══════════════════════════════════════════════════════════════
+#  yfinance
+# ═══════════════════════════════════════════════════════════════
+class YFinanceProvider(MarketDataProvider):
+    name = "yfinance"
+    batch_history_raises = False
+
+    def history(self, symbols: List[str], start: date, end: date) -> Dict[str, pd.DataFrame]:
+        if not symbols:
+            return {}
+        if len(symbols) == 1:
+            # Ticker.history raises on HTTP errors (yf.download swallows them),
+            # which keeps the caller's 429 retry logic working.
+            df = _normalize_frame(yf.Ticker(symbols[0]).history(
+                start=start, end=end, auto_adjust=False, actions=True,
+            ))
+            return {symbols[0]: df} if df is not None else {}
+        # Unadjusted for dividends, with the actions: adjustment happens on read (corporate_actions.py)
+        df = yf.download(symbols, start=start, end=end, auto_adjust=False, actions=True,
+                         progress=False, threads=True, group_by="ticker")
+        return _split_download(df, symbols)
+
+    def splits(self, symbol: str, start: date) -> List[Tuple[date, float]]:
+        # Ticker.history again, so a 429 raises instead of reading as "no splits"
+        df = _normalize_frame(yf.Ticker(symbol).history(
+            start=start, end=date.today() + timedelta(days=1), auto_adjust=False, actions=True,
+        ))
+        if df is None or "Stock Splits" not in df.columns:
+            return []
+        ratios = pd.to_numeric(df["Stock Splits"], errors="coerce")
+        return [(ts.date(), float(r)) for ts, r in ratios[ratios > 0].items()]
+
+    def quotes(self, symbols: List[str]) -> Dict[str, float]:
+        if not symbols:
+            return {}
+        df = yf.download(symbols, period="5d", progress=False, threads=True, group_by="ticker")
+        prices: Dict[str, float] = {}
+        for sym, sym_df in _split_download(df, symbols).items():
+            if "Close" not in sym_df.columns:
+                continue
+            closes = sym_df["Close"].dropna()
+            if len(closes):
+                price = float(closes.iloc[-1])
+                if price > 0:
+                    prices[sym] = price
+        return prices
+
+    def info(self, symbol: str) -> Dict[str, Any]:
+        return yf.Ticker(symbol).info or {}
+
+    def search(self, query: str, max_results: int = 10) -> List[Dict[str, Any]]:
+        results = yf.Search(query, max_results=max_results)
+        return list(results.quotes) if results.quotes else []
+
+    def fx_rate(self, from_ccy: str, to_ccy: str) -> Optional[float]:
+        info = yf.Ticker(f"{from_ccy}{to_ccy}=X").info or {}
+        rate = info.get("regularMarketPrice") or info.get("previousClose")
+        return float(rate) if rate and rate > 0 else None
+
+
+# ═══════════════════════════════════════════════════════════════
+#  Record / replay
+# ═══════════════════════════════════════════════════════════════
+class ReplayMiss(LookupError):
+    """Raised in replay mode when no recording exists for a request."""
+
+
+class ReplayProvider(MarketDataProvider):
+    """
+    File-backed provider.
+
+    Recordings live under `directory/<method>/<sha1>.json`, one file per
+    (method, symbol, arguments). Multi-symbol calls are stored per symbol so
+    replay does not depend on how callers happened to batch their requests.
+    History is keyed by symbol alone: every recorded window is merged into
+    one frame per symbol and replay slices it to the requested [start, end),
+    so windows derived from date.today() or covering a sub-range still hit.
+
+    record=True  → forward to `upstream` and persist every response.
+    record=False → serve recordings only; `latency_ms` is slept per call to
+                   emulate a network round trip (0 = full speed).
+    """
+
+    name = "replay"
+
+    def __init__(
+        self,
+        directory: str,
+        upstream: Optional[MarketDataProvider] = None,
+        record: bool = False,
+        latency_ms: float = 0.0,
+    ):
+        if record and upstream is None:
+            raise ValueError("ReplayProvider in record mode needs an upstream provider")
+        self.directory = directory
+        self.upstream = upstream
+        self.record = record
+        self.latency_ms = latency_ms
+        self._lock = threading.Lock()
+        self._merge_lock = threading.Lock()
+
+    @property
+    def batch_history_raises(self) -> bool:
+        return self.upstream is None or getattr(self.upstream, "batch_history_raises", True)
+
+    # ── storage ──
+    def _path(self, method: str, key: Dict[str, Any]) -> str:
+        raw = json.dumps(key, sort_keys=True, default=str)
+        digest = hashlib.sha1(raw.encode()).hexdigest()
+        return os.path.join(self.directory, method, f"{digest}.json")
+
+    def _load(self, method: str, key: Dict[str, Any]) -> Any:
+        path = self._path(method, key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)["payload"]
+        except FileNotFoundError:
+            raise ReplayMiss(f"No recording for {method} {key}")
+
+    def _save(self, method: str, key: Dict[str, Any], payload: Any) -> None:
+        path = self._path(method, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with self._lock:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"method": method, "key": key, "payload": payload}, f, default=str)
+            os.replace(tmp, path)
+
+    def _delay(self):
+        if self.latency_ms > 0:
+            time.sleep(self.latency_ms / 1000.0)
+
+    @staticmethod
+    def _encode_frame(df: Optional[pd.DataFrame]) -> Optional[str]:
+        if df is None or df.empty:
+            return None
+        return df.to_json(orient="split", date_format="iso")
+
+    @staticmethod
+    def _decode_frame(raw: Optional[str]) -> Optional[pd.DataFrame]:
+        if not raw:
+            return None
+        df = pd.read_json(io.StringIO(raw), orient="split")
+        df.index = pd.to_datetime(df.index)
+        return df
+
+    # ── provider API ──
+    def _recorded_history(self, symbol: str) -> Optional[pd.DataFrame]:
+        try:
+            return self._decode_frame(self._load("history", {"symbol": symbol}))
+        except ReplayMiss:
+            return None
+
+    def history(self, symbols: List[str], start: date, end: date) -> Dict[str, pd.DataFrame]:
+        if self.record:
+            frames = self.upstream.history(symbols, start, end)
+            for sym, df in frames.items():
+                if df is None or df.empty:
+                    continue
+                with self._merge_lock:
+                    stored = self._recorded_history(sym)
+                    if stored is not None:
+                        df = pd.concat([stored, df])
+                        df = df[~df.index.duplicated(keep="last")].sort_index()
+                    self._save("history", {"symbol": sym}, self._encode_frame(df))
+            return frames
+
+        self._delay()
+        lo, hi = pd.Timestamp(start), pd.Timestamp(end)
+        frames: Dict[str, pd.DataFrame] = {}
+        for sym in symbols:
+            df = self._recorded_history(sym)
+            if df is None:
+                continue
+            df = df[(df.index >= lo) & (df.index < hi)]
+            if not df.empty:
+                frames[sym] = df
+        return frames
+
+    def splits(self, symbol: str, start: date) -> List[Tuple[date, float]]:
+        key = {"symbol": symbol}
+        if self.record:
+            found = self.upstream.splits(symbol, start)
+            with self._merge_lock:
+                try:
+                    known = dict(self._load("splits", key) or [])
+                except ReplayMiss:
+                    known = {}
+                known.update({d.isoformat(): r for d, r in found})
+                self._save("splits", key, sorted(known.items()))
+            return found
+        self._delay()
+        try:
+            recorded = self._load("splits", key) or []
+        except ReplayMiss:
+            return []
+        return [(date.fromisoformat(d), float(r)) for d, r in recorded if date.fromisoformat(d) >= start]
+
+    def quotes(self, symbols: List[str]) -> Dict[str, float]:
+        if self.record:
+            prices = self.upstream.quotes(symbols)
+            for sym in symbols:
+                self._save("quotes", {"symbol": sym}, prices.get(sym))
+            return prices
+
+        self._delay()
+        prices: Dict[str, float] = {}
+        for sym in symbols:
+            try:
+                price = self._load("quotes", {"symbol": sym})
+            except ReplayMiss:
+                continue
+            if price is not None:
+                prices[sym] = float(price)
+        return prices
+
+    def info(self, symbol: str) -> Dict[str, Any]:
+        key = {"symbol": symbol}
+        if self.record:
+            info = self.upstream.info(symbol)
+            self._save("info", key, info)
+            return info
+        self._delay()
+        return self._load("info", key) or {}
+
+    def search(self, query: str, max_results: int = 10) -> List[Dict[str, Any]]:
+        key = {"query": query, "max_results": max_results}
+        if self.record:
+            quotes = self.upstream.search(query, max_results)
+            self._save("search", key, quotes)
+            return quotes
+        self._delay()
+        return self._load("search", key) or []
+
+    def fx_rate(self, from_ccy: str, to_ccy: str) -> Optional[float]:
+        key = {"pair": f"{from_ccy}{to_ccy}"}
+        if self.record:
+            rate = self.upstream.fx_rate(from_ccy, to_ccy)
+            self._save("fx_rate", key, rate)
+            return rate
+        self._delay()
+        try:
+            rate = self._load("fx_rate", key)
+        except ReplayMiss:
+            return None
+        return float(rate) if rate else None
+
+
+# ────────────── process-wide provider ──────────────
+_provider: Optional[MarketDataProvider] = None
+_provider_lock = threading.Lock()
+
+
+def build_provider(kind: str) -> MarketDataProvider:
+    """Build a provider from its settings name ("yfinance" | "record" | "replay")."""
+    from app.services.fetch_scheduler import schedule
+
+    kind = (kind or "yfinance").lower().strip()
+    if kind == "yfinance":
+        return schedule(YFinanceProvider())
+    if kind == "record":
+        return schedule(
+            ReplayProvider(settings.MARKET_DATA_REPLAY_DIR, upstream=YFinanceProvider(), record=True)
+        )
+    if kind == "replay":
+        return ReplayProvider(
+            settings.MARKET_DATA_REPLAY_DIR,
+            latency_ms=settings.MARKET_DATA_REPLAY_LATENCY_MS,
+        )
+    raise ValueError(f"Unknown market data provider '{kind}'")
+
+
+def get_provider() -> MarketDataProvider:
+    """Return the shared provider configured by settings.MARKET_DATA_PROVIDER."""
+    global _provider
+    if _provider is None:
+        with _provider_lock:
+            if _provider is None:
+                _provider = build_provider(settings.MARKET_DATA_PROVIDER)
+                logger.info(f"Market data provider: {_provider.name}"
+                            f"{' (recording)' if getattr(_provider, 'record', False) else ''}")
+    return _provider
+
+
+def set_provider(provider: Optional[MarketDataProvider]) -> None:
+    """Swap the process-wide provider (benchmarks / staging bootstrap)."""
+    global _provider
+    with _provider_lock:
+        _provider = provider
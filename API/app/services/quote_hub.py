@@ -0,0 +1,191 @@
+"""
+Live quote hub: one provider poll per interval for every symbol anybody is
+watching, fanned out to Server-Sent Event streams as price deltas.
+
+Refreshing a portfolio view by re-polling GET /portfolios/{id} costs
+viewers × refresh rate full enrichments (instruments, latest prices, FX,
+collaborators) plus a quote per position. Here each open stream subscribes
+to its portfolio's symbols and the hub:
+
+  1. keeps a reference count per symbol — the union of all open streams;
+  2. polls provider.quotes(union) once every QUOTE_HUB_INTERVAL seconds on a
+     single daemon thread (one batched call through the fetch scheduler);
+  3. diffs against the last price it saw and hands each subscriber only the
+     changed symbols it holds, via loop.call_soon_threadsafe.
+
+Provider load therefore grows with distinct symbols, never with viewers.
+Deliveries coalesce — a subscriber that has not drained its last delta gets
+the newer prices merged into it — so a slow client costs one dict, not a
+growing queue. The thread starts with the first subscription and idles while
+nobody is subscribed; a symbol's last price is forgotten when its last
+subscriber leaves.
+"""
+
+import asyncio
+import itertools
+import logging
+import threading
+import time
+from typing import Dict, Iterable, Optional
+
+from app.core.config import settings
+from app.services.providers import MarketDataProvider, get_provider
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    """One stream's view of the hub: its symbols and the prices not yet sent."""
+
+    def __init__(self, hub: "QuoteHub", sub_id: int, symbols: frozenset, loop: asyncio.AbstractEventLoop):
+        self.hub = hub
+        self.id = sub_id
+        self.symbols = symbols
+        self.loop = loop
+        self._pending: Dict[str, float] = {}
+        self._ready = asyncio.Event()
+
+    def _deliver(self, delta: Dict[str, float]) -> None:
+        # Runs on the subscriber's event loop (call_soon_threadsafe)
+        self._pending.update(delta)
+        self._ready.set()
+
+    async def next_delta(self, timeout: float) -> Dict[str, float]:
+        """Prices changed since the last call; {} after `timeout` seconds without any."""
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return {}
+        self._ready.clear()
+        delta, self._pending = self._pending, {}
+        return delta
+
+    def close(self) -> None:
+        self.hub.unsubscribe(self)
+
+
+class QuoteHub:
+    def __init__(self, interval: float, provider: Optional[MarketDataProvider] = None):
+        self.interval = interval
+        self._provider = provider
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._ids = itertools.count(1)
+        self._subs: Dict[int, Subscription] = {}
+        self._refs: Dict[str, int] = {}
+        self._last: Dict[str, float] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._stats = {"polls": 0, "symbols_polled": 0, "deliveries": 0, "errors": 0}
+
+    @property
+    def provider(self) -> MarketDataProvider:
+        return self._provider or get_provider()
+
+    # ────────────── subscriptions ──────────────
+    def subscribe(self, symbols: Iterable[str]) -> Subscription:
+        """Register a stream for `symbols`; call from the stream's event loop."""
+        sub = Subscription(self, next(self._ids), frozenset(symbols), asyncio.get_running_loop())
+        with self._lock:
+            self._subs[sub.id] = sub
+            for sym in sub.symbols:
+                self._refs[sym] = self._refs.get(sym, 0) + 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="quote-hub", daemon=True)
+                self._thread.start()
+        self._wake.set()
+        return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        with self._lock:
+            if self._subs.pop(sub.id, None) is None:
+                return
+            for sym in sub.symbols:
+                left = self._refs.get(sym, 0) - 1
+                if left > 0:
+                    self._refs[sym] = left
+                else:
+                    self._refs.pop(sym, None)
+                    self._last.pop(sym, None)
+
+    def last_prices(self, symbols: Iterable[str]) -> Dict[str, float]:
+        """Latest polled price of each watched symbol (symbols not polled yet omitted)."""
+        with self._lock:
+            return {s: self._last[s] for s in symbols if s in self._last}
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._stats, "subscribers": len(self._subs), "symbols": len(self._refs)}
+
+    # ────────────── polling ──────────────
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                symbols = sorted(self._refs)
+            if not symbols:
+                self._wake.wait()
+                self._wake.clear()
+                continue
+            started = time.monotonic()
+            self.poll(symbols)
+            time.sleep(max(0.0, self.interval - (time.monotonic() - started)))
+
+    def poll(self, symbols: Iterable[str]) -> Dict[str, float]:
+        """One provider call for `symbols`; publishes and returns the changed prices."""
+        symbols = list(symbols)
+        try:
+            prices = self.provider.quotes(symbols)
+        except Exception as e:
+            with self._lock:
+                self._stats["errors"] += 1
+            logger.warning(f"Quote hub poll failed for {len(symbols)} symbols: {e}")
+            return {}
+        return self.publish(prices)
+
+    def publish(self, prices: Dict[str, float]) -> Dict[str, float]:
+        """Diff `prices` against the last ones seen and push each subscriber its share."""
+        with self._lock:
+            self._stats["polls"] += 1
+            self._stats["symbols_polled"] += len(prices)
+            changed = {
+                s: float(p) for s, p in prices.items()
+                if s in self._refs and p and p > 0 and self._last.get(s) != float(p)
+            }
+            if not changed:
+                return {}
+            self._last.update(changed)
+            subs = list(self._subs.values())
+
+        dead = []
+        delivered = 0
+        for sub in subs:
+            if len(sub.symbols) < len(changed):
+                delta = {s: changed[s] for s in sub.symbols if s in changed}
+            else:
+                delta = {s: p for s, p in changed.items() if s in sub.symbols}
+            if not delta:
+                continue
+            try:
+                sub.loop.call_soon_threadsafe(sub._deliver, delta)
+                delivered += 1
+            except RuntimeError:                      # the stream's loop is gone
+                dead.append(sub)
+        for sub in dead:
+            self.unsubscribe(sub)
+        with self._lock:
+            self._stats["deliveries"] += delivered
+        return changed
+
+
+# ────────────── process-wide hub ──────────────
+_hub: Optional[QuoteHub] = None
+_hub_lock = threading.Lock()
+
+
+def get_quote_hub() -> Optional[QuoteHub]:
+    """The shared hub (None when QUOTE_HUB_INTERVAL is 0)."""
+    global _hub
+    if _hub is None and settings.QUOTE_HUB_INTERVAL > 0:
+        with _hub_lock:
+            if _hub is None:
+                _hub = QuoteHub(settings.QUOTE_HUB_INTERVAL)
+    return _hub
@@ -0,0 +1,271 @@
+"""
+Price matrices shared between worker processes through POSIX shared memory.
+
+Every uvicorn worker used to build private copies of the same hot matrices
+(benchmarks, the seeded portfolios' constituents), multiplying RAM by the
+worker count. SharedMatrixRegistry publishes a MatrixCache entry once, in a
+multiprocessing.shared_memory segment, and other workers attach read-only
+NumPy views onto it instead of loading their own copy.
+
+Segment layout (one per symbol set and version):
+
+    int64[4]            magic, rows, cols, reserved
+    int64[rows]         day numbers (1970-01-01 = 0)
+    float64[rows*cols]  closes, C order, columns = sorted symbols
+
+The registry is a small JSON file next to the segments' namespace, guarded by
+an flock, mapping the symbol-set digest → {name, lo, hi, versions, version,
+nbytes, used_at}. `versions` is the per-symbol latest_prices.data_version the
+rows reflect: when ingestion bumps it, the worker that notices reloads the
+changed columns and publishes a new segment under a new name, then unlinks the
+old one. Workers still holding the old mapping keep reading it until their
+own version check moves them on (POSIX keeps unlinked segments alive while
+mapped). The registry evicts least-recently-used segments to stay under
+PRICE_MATRIX_SHARED_MAX_BYTES.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from multiprocessing import resource_tracker, shared_memory
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows dev boxes: in-process lock only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+_MAGIC = 0x504D4154          # "PMAT"
+_HEADER_SLOTS = 4
+_HEADER_BYTES = _HEADER_SLOTS * 8
+
+Versions = Dict[str, Optional[int]]
+Shared = Tuple[np.ndarray, np.ndarray, int, int, Versions]   # days, values, lo, hi, versions
+
+
+def _digest(symbols: Sequence[str]) -> str:
+    return hashlib.sha1("\x1f".join(symbols).encode()).hexdigest()[:16]
+
+
+def _open_segment(name: str, create: bool = False, size: int = 0) -> shared_memory.SharedMemory:
+    """
+    SharedMemory that outlives this process: the registry, not the resource
+    tracker, decides when a segment is unlinked (Python < 3.13 would unlink
+    every segment a worker ever attached when that worker exits).
+    """
+    shm = shared_memory.SharedMemory(name=name, create=create, size=size)
+    try:
+        resource_tracker.unregister(shm._name, "shared_memory")
+    except Exception:
+        pass
+    return shm
+
+
+def _unlink(name: str) -> None:
+    try:
+        shm = shared_memory.SharedMemory(name=name)
+    except FileNotFoundError:
+        return
+    try:
+        shm.unlink()            # also unregisters from the resource tracker
+    finally:
+        shm.close()
+
+
+def _views(shm: shared_memory.SharedMemory) -> Tuple[np.ndarray, np.ndarray]:
+    header = np.frombuffer(shm.buf, dtype=np.int64, count=_HEADER_SLOTS)
+    if int(header[0]) != _MAGIC:
+        raise ValueError(f"{shm.name} is not a price matrix segment")
+    rows, cols = int(header[1]), int(header[2])
+    days = np.frombuffer(shm.buf, dtype=np.int64, count=rows, offset=_HEADER_BYTES)
+    values = np.frombuffer(
+        shm.buf, dtype=np.float64, count=rows * cols, offset=_HEADER_BYTES + rows * 8,
+    ).reshape(rows, cols)
+    days.flags.writeable = False
+    values.flags.writeable = False
+    return days, values
+
+
+class SharedMatrixRegistry:
+    def __init__(self, path: str, prefix: str, max_bytes: int):
+        self.path = path
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        self._local = threading.Lock()
+        self._segments: Dict[str, shared_memory.SharedMemory] = {}   # mapped by this process
+
+    @contextmanager
+    def _locked(self):
+        """The registry document under an exclusive lock; changes to it are written back."""
+        with self._local:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o666)
+            try:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                raw = b""
+                while True:
+                    chunk = os.read(fd, 1 << 16)
+                    if not chunk:
+                        break
+                    raw += chunk
+                try:
+                    doc = json.loads(raw) if raw else {}
+                except ValueError:
+                    logger.warning(f"shared matrices: unreadable registry {self.path}, starting over")
+                    doc = {}
+                before = json.dumps(doc, sort_keys=True)
+                yield doc
+                after = json.dumps(doc, sort_keys=True)
+                if after != before:
+                    os.lseek(fd, 0, os.SEEK_SET)
+                    os.ftruncate(fd, 0)
+                    os.write(fd, after.encode())
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+                os.close(fd)
+
+    def _map(self, name: str) -> Tuple[np.ndarray, np.ndarray]:
+        shm = self._segments.get(name)
+        if shm is None:
+            shm = _open_segment(name)
+            self._segments[name] = shm
+        return _views(shm)
+
+    def _release(self, doc: Dict[str, Any]) -> None:
+        """Close superseded segments this process mapped once no cached view uses them."""
+        current = {m["name"] for m in doc.values()}
+        for name in [n for n in self._segments if n not in current]:
+            try:
+                self._segments[name].close()
+            except BufferError:
+                continue                    # a cache entry still points into it
+            del self._segments[name]
+
+    # ── reads ──
+    def attach(self, symbols: Sequence[str]) -> Optional[Shared]:
+        """Read-only (days, values, lo, hi, versions) published for `symbols` (sorted), or None."""
+        key = _digest(symbols)
+        with self._locked() as doc:
+            meta = doc.get(key)
+            if meta is None or meta["symbols"] != list(symbols):
+                return None
+            try:
+                days, values = self._map(meta["name"])
+            except FileNotFoundError:
+                del doc[key]                    # host restarted or segment evicted underneath us
+                return None
+            meta["used_at"] = time.time()
+        return _shared(meta, days, values)
+
+    # ── writes ──
+    def publish(
+        self, symbols: Sequence[str], days: np.ndarray, values: np.ndarray,
+        lo: int, hi: int, versions: Versions,
+    ) -> Optional[Shared]:
+        """
+        Publish a matrix for `symbols` unless the registry already holds one at
+        least as new and as wide. Returns the segment now registered (ours or
+        the existing one) as in attach(), or None when it does not fit.
+        """
+        nbytes = _HEADER_BYTES + days.nbytes + values.nbytes
+        if nbytes > self.max_bytes:
+            return None
+        key = _digest(symbols)
+        encoded = {s: (int(v) if v is not None else None) for s, v in versions.items()}
+
+        with self._locked() as doc:
+            meta = doc.get(key)
+            if meta is not None and meta["symbols"] == list(symbols) and _covers(meta, lo, hi, encoded):
+                try:
+                    days, values = self._map(meta["name"])
+                    meta["used_at"] = time.time()
+                    return _shared(meta, days, values)
+                except FileNotFoundError:
+                    pass
+
+            name = f"{self.prefix}_{key[:10]}_{uuid.uuid4().hex[:8]}"
+            shm = _open_segment(name, create=True, size=nbytes)
+            header = np.frombuffer(shm.buf, dtype=np.int64, count=_HEADER_SLOTS)
+            header[:] = (_MAGIC, len(days), values.shape[1], 0)
+            np.frombuffer(shm.buf, dtype=np.int64, count=len(days), offset=_HEADER_BYTES)[:] = days
+            np.frombuffer(
+                shm.buf, dtype=np.float64, count=values.size, offset=_HEADER_BYTES + days.nbytes,
+            )[:] = values.ravel()
+            del header
+            self._segments[name] = shm
+
+            if meta is not None:
+                _unlink(meta["name"])
+            meta = doc[key] = {
+                "name": name, "symbols": list(symbols), "lo": int(lo), "hi": int(hi),
+                "versions": encoded, "version": (meta or {}).get("version", 0) + 1,
+                "nbytes": nbytes, "used_at": time.time(),
+            }
+            self._evict(doc, keep=key)
+            self._release(doc)
+            logger.debug(f"shared matrices: published {len(symbols)} symbols × {len(days)} rows as {name}")
+            return _shared(meta, *_views(shm))
+
+    def _evict(self, doc: Dict[str, Any], keep: str) -> None:
+        total = sum(m["nbytes"] for m in doc.values())
+        for key in sorted(doc, key=lambda k: doc[k]["used_at"]):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            total -= doc[key]["nbytes"]
+            _unlink(doc.pop(key)["name"])
+
+    def clear(self) -> None:
+        """Unlink every registered segment (tests / maintenance)."""
+        with self._locked() as doc:
+            for meta in doc.values():
+                _unlink(meta["name"])
+            doc.clear()
+            self._release(doc)
+
+
+def _shared(meta: Dict[str, Any], days: np.ndarray, values: np.ndarray) -> Shared:
+    versions = {s: (v if isinstance(v, int) else None) for s, v in meta["versions"].items()}
+    return days, values, meta["lo"], meta["hi"], versions
+
+
+def _covers(meta: Dict[str, Any], lo: int, hi: int, versions: Dict[str, Optional[int]]) -> bool:
+    """True when a registered segment is at least as wide and as new as (lo, hi, versions)."""
+    if meta["lo"] > lo or meta["hi"] < hi:
+        return False
+    theirs = meta["versions"]
+    return all(
+        v is None or (isinstance(theirs.get(s), int) and theirs[s] >= v)
+        for s, v in versions.items()
+    )
+
+
+# ────────────── process-wide registry ──────────────
+_registry: Optional[SharedMatrixRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_shared_registry() -> Optional[SharedMatrixRegistry]:
+    """The host-wide registry (None when PRICE_MATRIX_SHARED_MAX_BYTES is 0)."""
+    global _registry
+    if _registry is None and settings.PRICE_MATRIX_SHARED_MAX_BYTES > 0:
+        with _registry_lock:
+            if _registry is None:
+                prefix = settings.PRICE_MATRIX_SHARED_PREFIX
+                path = os.path.join(tempfile.gettempdir(), f"{prefix}_registry.json")
+                _registry = SharedMatrixRegistry(path, prefix, settings.PRICE_MATRIX_SHARED_MAX_BYTES)
+    return _registry
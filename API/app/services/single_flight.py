@@ -0,0 +1,145 @@
+"""
+Single-flight request coalescing.
+
+Concurrent requests that need the same upstream fetch (the same symbol's
+history, the same ticker.info) should cause one provider call, not one per
+request. coalesce(key, fn) runs `fn` once per key at a time:
+
+  • within a process, the first caller (the leader) runs `fn` and every
+    concurrent caller with the same key waits on the leader's Future and
+    receives its result (or exception);
+  • across processes, the leader additionally holds a Postgres advisory lock
+    derived from the key (session-level, on a dedicated connection), so a
+    leader in another worker waits until the first one has committed.
+
+Callers must re-check their own state once `fn` starts (e.g. re-plan price
+coverage or re-read the cache): a leader that waited on the advisory lock
+usually finds the work already done. Results handed to followers must not be
+ORM objects bound to the leader's session.
+"""
+
+import hashlib
+import logging
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Optional, TypeVar
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+_WAIT_TIMEOUT = 180.0            # max seconds a follower waits before fetching itself
+_LOCK_TIMEOUT = 120.0            # max seconds to wait for another process's advisory lock
+_LOCK_POLL = 0.05
+
+
+def _lock_id(key: str) -> int:
+    """Stable signed 64-bit advisory lock id for a key."""
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big", signed=True)
+
+
+class SingleFlight:
+    """In-process deduplication of concurrent calls by key."""
+
+    def __init__(self):
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, fn: Callable[[], T], timeout: float = _WAIT_TIMEOUT) -> T:
+        with self._lock:
+            fut = self._inflight.get(key)
+            leader = fut is None
+            if leader:
+                fut = Future()
+                self._inflight[key] = fut
+
+        if not leader:
+            try:
+                return fut.result(timeout=timeout)
+            except FutureTimeout:
+                logger.warning(f"single-flight: waited {timeout:.0f}s on '{key}', fetching directly")
+                return fn()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            fut.set_exception(e)
+            raise
+        else:
+            fut.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._inflight)
+
+
+@contextmanager
+def advisory_locks(bind: Any, keys: Iterable[str], timeout: float = _LOCK_TIMEOUT):
+    """
+    Hold session-level Postgres advisory locks for `keys` on a dedicated
+    connection. Locks are taken in id order so overlapping key sets cannot
+    deadlock. On other databases, or if the locks cannot be obtained within
+    `timeout`, the block runs unlocked (the work is idempotent, just wasteful).
+    """
+    ids = sorted({_lock_id(k) for k in keys})
+    if bind is None or not ids or getattr(bind.dialect, "name", "") != "postgresql":
+        yield
+        return
+
+    conn = None
+    try:
+        conn = bind.connect()
+        deadline = time.monotonic() + timeout
+        for lock_id in ids:
+            while not conn.execute(text("SELECT pg_try_advisory_lock(:k)"), {"k": lock_id}).scalar():
+                if time.monotonic() >= deadline:
+                    raise TimeoutError(f"advisory lock {lock_id} busy for {timeout:.0f}s")
+                time.sleep(_LOCK_POLL)
+        conn.commit()
+    except Exception as e:
+        logger.warning(f"single-flight: advisory lock unavailable, continuing unlocked: {e}")
+        if conn is not None:
+            _release(conn)
+            conn = None
+
+    try:
+        yield
+    finally:
+        if conn is not None:
+            _release(conn)
+
+
+def _release(conn) -> None:
+    try:
+        conn.execute(text("SELECT pg_advisory_unlock_all()"))
+        conn.commit()
+    except Exception as e:
+        logger.warning(f"single-flight: advisory unlock failed, dropping connection: {e}")
+        conn.invalidate()
+    finally:
+        conn.close()
+
+
+# ────────────── process-wide group ──────────────
+_flights = SingleFlight()
+
+
+def coalesce(key: str, fn: Callable[[], T], bind: Any = None, lock_keys: Optional[Iterable[str]] = None) -> T:
+    """
+    Run `fn` once for all concurrent callers sharing `key`. With `bind` (an
+    Engine/Connection), the leader also holds advisory locks on `lock_keys`
+    (default: [key]) so other processes coalesce behind it.
+    """
+    def run() -> T:
+        with advisory_locks(bind, lock_keys if lock_keys is not None else [key]):
+            return fn()
+
+    return _flights.do(key, run)
@@ -0,0 +1,239 @@
+"""
+Persisted symbol resolution.
+
+Importing a broker export means turning bare tickers plus a currency
+("RACE", "EUR") into the listing that trades in that currency ("RACE.MI").
+Each answer costs a provider search and up to a handful of suffix probes, so
+answers are persisted in `symbol_listings`, keyed by (base ticker, currency):
+
+  • resolve_many() answers every pair it can from the cache, then from ONE
+    query on symbol_listings; a repeat import makes no provider calls;
+  • the remaining misses are resolved concurrently — the worker threads only
+    talk to the provider (whose calls are queued on the shared fetch
+    scheduler, so the rate budget is respected) — and the results are
+    written back in one upsert from the calling thread.
+
+Rows carry a confidence (1.0 exact search match … 0.0 no listing found, the
+original ticker was kept). Found listings are re-checked after
+_LISTING_MAX_AGE, "not found" answers after the shorter _FALLBACK_MAX_AGE.
+"""
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.symbol_listing import SymbolListing
+from app.services.cache import get_cache
+from app.services.negative_cache import NegativeCache
+from app.services.providers import MarketDataProvider
+
+logger = logging.getLogger(__name__)
+
+_LISTING_MAX_AGE = timedelta(days=30)
+_FALLBACK_MAX_AGE = timedelta(days=3)
+
+# confidence of each resolution path
+_EXACT_SEARCH = 1.0
+_PREFIX_SEARCH = 0.9
+_SUFFIX_PROBE = 0.8
+_FALLBACK = 0.0
+
+_LOOKUP_SQL = text("""
+    SELECT l.base_ticker, l.currency, l.resolved_symbol, l.confidence, l.checked_at
+    FROM symbol_listings l
+    JOIN unnest(CAST(:tickers AS varchar[]), CAST(:currencies AS varchar[])) AS t(b, c)
+      ON l.base_ticker = t.b AND l.currency = t.c
+""")
+
+Pair = Tuple[str, str]           # (raw symbol, currency hint)
+Listing = Dict[str, Any]         # {"resolved_symbol", "exchange", "confidence"}
+
+
+def _normalize(raw_symbol: str, currency_hint: str) -> Pair:
+    return raw_symbol.strip().upper(), currency_hint.strip().upper()
+
+
+def _has_suffix(sym: str) -> bool:
+    return "." in sym and len(sym.split(".")[-1]) <= 3
+
+
+def _cache_key(sym: str, hint: str) -> str:
+    return f"resolve:{sym}:{hint}"
+
+
+class SymbolResolver:
+    def __init__(self, db: Session, provider: MarketDataProvider, negative: NegativeCache):
+        self.db = db
+        self.provider = provider
+        self.negative = negative
+
+    # ──────────────────── PUBLIC ────────────────────
+
+    def resolve(self, raw_symbol: str, currency_hint: str) -> str:
+        return self.resolve_many([(raw_symbol, currency_hint)])[(raw_symbol, currency_hint)]
+
+    def resolve_many(self, pairs: Iterable[Pair]) -> Dict[Pair, str]:
+        """{(raw symbol, currency hint): provider symbol} for every input pair."""
+        pairs = list(dict.fromkeys(pairs))
+        answers, misses = self.resolve_stored(pairs)
+        if misses:
+            found = self._resolve_remote(misses)
+            self.remember(found)
+            for pair, listing in found.items():
+                answers[pair] = listing["resolved_symbol"] if listing is not None else pair[0]
+        return {p: answers[_normalize(*p)] for p in pairs}
+
+    def resolve_stored(self, pairs: Iterable[Pair]) -> Tuple[Dict[Pair, str], List[Pair]]:
+        """
+        Answer what needs no provider call (suffixed symbols, cache, symbol_listings).
+        Returns ({normalized pair: symbol}, [normalized pairs still to look up]).
+        """
+        answers: Dict[Pair, str] = {}
+        pending: List[Pair] = []
+        for pair in dict.fromkeys(_normalize(*p) for p in pairs):
+            sym, hint = pair
+            if _has_suffix(sym):
+                answers[pair] = sym                    # already a listing symbol
+                continue
+            cached = get_cache().get(_cache_key(sym, hint))
+            if cached is not None:
+                answers[pair] = cached
+            else:
+                pending.append(pair)
+        if not pending:
+            return answers, []
+
+        stored = self._load(pending)
+        for pair, symbol in stored.items():
+            answers[pair] = symbol
+            get_cache().set(_cache_key(*pair), symbol)
+        misses = [p for p in pending if p not in stored]
+        logger.info(f"resolve_symbols: {len(pending)} lookups, {len(stored)} from symbol_listings, "
+                    f"{len(misses)} left for the provider")
+        return answers, misses
+
+    def remember(self, found: Dict[Pair, Optional[Listing]]) -> None:
+        """Persist and cache provider answers (None = undecided, not stored)."""
+        found = {p: listing for p, listing in found.items() if listing is not None}
+        self._store(found)
+        for pair, listing in found.items():
+            get_cache().set(_cache_key(*pair), listing["resolved_symbol"])
+
+    # ──────────────────── STORE ────────────────────
+
+    def _load(self, pairs: List[Pair]) -> Dict[Pair, str]:
+        """Fresh rows from symbol_listings for `pairs` (one query)."""
+        try:
+            rows = self.db.execute(_LOOKUP_SQL, {
+                "tickers": [p[0] for p in pairs], "currencies": [p[1] for p in pairs],
+            }).fetchall()
+        except Exception as e:
+            self.db.rollback()
+            logger.warning(f"symbol_listings lookup failed: {e}")
+            return {}
+        now = datetime.utcnow()
+        out: Dict[Pair, str] = {}
+        for base, ccy, resolved, confidence, checked_at in rows:
+            max_age = _LISTING_MAX_AGE if confidence > _FALLBACK else _FALLBACK_MAX_AGE
+            if checked_at and now - checked_at < max_age:
+                out[(base, ccy)] = resolved
+        return out
+
+    def _store(self, found: Dict[Pair, Listing]) -> None:
+        if not found:
+            return
+        now = datetime.utcnow()
+        rows = [
+            {"base_ticker": sym, "currency": hint, "checked_at": now, **listing}
+            for (sym, hint), listing in found.items()
+        ]
+        stmt = pg_insert(SymbolListing).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[SymbolListing.base_ticker, SymbolListing.currency],
+            set_={
+                "resolved_symbol": stmt.excluded.resolved_symbol,
+                "exchange": stmt.excluded.exchange,
+                "confidence": stmt.excluded.confidence,
+                "checked_at": stmt.excluded.checked_at,
+            },
+        )
+        try:
+            self.db.execute(stmt)
+            self.db.commit()
+        except Exception as e:
+            self.db.rollback()
+            logger.warning(f"symbol_listings upsert failed: {e}")
+
+    # ──────────────────── PROVIDER ────────────────────
+
+    def _resolve_remote(self, pairs: List[Pair]) -> Dict[Pair, Optional[Listing]]:
+        """Resolve `pairs` concurrently; workers touch the provider only, never the session."""
+        if len(pairs) == 1:
+            return {pairs[0]: self.lookup(*pairs[0])}
+        workers = max(1, min(settings.MARKET_DATA_FETCH_WORKERS, len(pairs)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="resolve") as pool:
+            results = list(pool.map(lambda p: self.lookup(*p), pairs))
+        return dict(zip(pairs, results))
+
+    def lookup(self, sym: str, hint: str) -> Optional[Listing]:
+        """
+        Best listing for a normalized (sym, hint) from the provider alone —
+        safe to call from worker threads; persist the answer with remember().
+        None if the provider errored before an answer was found.
+        """
+        from app.services.market_data import _CURRENCY_SUFFIXES, _exchange_to_currency, _info_has_data
+
+        errored = False
+
+        # 1) Search the provider for candidate listings
+        try:
+            candidates = self.provider.search(sym, max_results=10)
+            for candidate in candidates:
+                c_sym = candidate.get("symbol", "")
+                c_exch = candidate.get("exchange", "")
+                c_base = c_sym.split(".")[0].upper()
+
+                # The base ticker must match (ignore exchange suffix)
+                if c_base != sym and not c_base.startswith(sym):
+                    continue
+
+                exch_ccy = _exchange_to_currency(c_exch)
+                if exch_ccy and exch_ccy == hint:
+                    logger.info(f"resolve_symbol: {sym}+{hint} → {c_sym} (via search, exchange={c_exch})")
+                    return {
+                        "resolved_symbol": c_sym, "exchange": c_exch,
+                        "confidence": _EXACT_SEARCH if c_base == sym else _PREFIX_SEARCH,
+                    }
+        except Exception as e:
+            errored = True
+            logger.warning(f"resolve_symbol: search failed for '{sym}': {e}")
+
+        # 2) Try common exchange suffixes for the hinted currency
+        for suffix in _CURRENCY_SUFFIXES.get(hint, []):
+            candidate = sym + suffix
+            if self.negative.blocked("info", candidate):
+                continue
+            try:
+                info = self.provider.info(candidate)
+                if not _info_has_data(info):
+                    self.negative.record_failure("info", [candidate], "empty info")
+                    continue
+                if (info.get("currency") or "").upper() == hint and (info.get("longName") or info.get("shortName")):
+                    logger.info(f"resolve_symbol: {sym}+{hint} → {candidate} (via suffix probe)")
+                    return {"resolved_symbol": candidate, "exchange": info.get("exchange"), "confidence": _SUFFIX_PROBE}
+            except Exception:
+                errored = True
+                continue
+
+        # 3) Fall back to original (not persisted if the provider was failing)
+        if errored:
+            logger.info(f"resolve_symbol: provider errors resolving '{sym}'+{hint}, keeping original for now")
+            return None
+        logger.info(f"resolve_symbol: no {hint} listing found for '{sym}', keeping original")
+        return {"resolved_symbol": sym, "exchange": None, "confidence": _FALLBACK}
@@ -0,0 +1,210 @@
+"""
+Pipelined ticker validation for broker imports.
+
+validate-tickers used to walk the symbols one by one, each step possibly a
+throttled provider call, so exports with thousands of rows timed out. The
+pipeline here:
+
+  1. dedupes (symbol, currency hint) pairs;
+  2. answers everything it can without the provider, in bulk and at once:
+     listing resolution from symbol_listings, metadata from _KNOWN_META, the
+     instruments table and the info cache; negative-cached symbols are
+     reported unresolved immediately;
+  3. fans the rest out in batches of _BATCH_SIZE on at most
+     MARKET_DATA_FETCH_WORKERS threads (provider calls still share the fetch
+     scheduler's rate budget) and reports each batch as it completes.
+
+TickerValidator.stream() yields one event dict per line of the NDJSON
+response ("start", one "result" per unique pair, "end"); validate() collects
+the same events into the original {valid, unresolved} payload.
+"""
+
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.instrument import Instrument
+from app.services.cache import get_cache
+from app.services.market_data import MarketDataService, _KNOWN_META
+from app.services.providers import MarketDataProvider
+
+logger = logging.getLogger(__name__)
+
+_BATCH_SIZE = 10
+
+Pair = Tuple[str, Optional[str]]          # (symbol, currency hint or None)
+
+
+def _instrument_item(symbol: str, source: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "symbol": symbol,
+        "name": source.get("name") or symbol,
+        "sector": source.get("sector") or "",
+        "country": source.get("country") or "",
+        "asset_class": source.get("asset_class") or "Equity",
+        "currency": source.get("currency") or "USD",
+    }
+
+
+def _needs_resolution(hint: Optional[str]) -> bool:
+    return bool(hint) and hint != "USD"
+
+
+class TickerValidator:
+    def __init__(self, db: Session, provider: Optional[MarketDataProvider] = None,
+                 batch_size: int = _BATCH_SIZE, workers: Optional[int] = None):
+        self.db = db
+        self.md = MarketDataService(db, provider)
+        self.batch_size = max(1, batch_size)
+        self.workers = max(1, workers or settings.MARKET_DATA_FETCH_WORKERS)
+
+    # ──────────────────── PUBLIC ────────────────────
+
+    @staticmethod
+    def parse(symbols: Sequence[str], hints: Optional[Sequence[Optional[str]]] = None) -> List[Pair]:
+        """Normalized (symbol, hint) pairs in input order (blank symbols dropped)."""
+        hints = hints or []
+        pairs: List[Pair] = []
+        for idx, sym in enumerate(symbols):
+            sym = (sym or "").strip().upper()
+            if not sym:
+                continue
+            hint = hints[idx].strip().upper() if idx < len(hints) and hints[idx] else None
+            pairs.append((sym, hint))
+        return pairs
+
+    def validate(self, symbols: Sequence[str], hints: Optional[Sequence[Optional[str]]] = None) -> Dict[str, List]:
+        """{valid: [instrument], unresolved: [symbol]} in input order."""
+        requests = self.parse(symbols, hints)
+        outcome: Dict[Pair, Optional[Dict[str, Any]]] = {}
+        for event in self.stream(symbols, hints):
+            if event["type"] == "result":
+                outcome[(event["symbol"], event["currency_hint"])] = event["instrument"]
+        valid, unresolved = [], []
+        for pair in requests:
+            item = outcome.get(pair)
+            if item is not None:
+                valid.append(item)
+            else:
+                unresolved.append(pair[0])
+        return {"valid": valid, "unresolved": unresolved}
+
+    def stream(self, symbols: Sequence[str], hints: Optional[Sequence[Optional[str]]] = None) -> Iterator[Dict[str, Any]]:
+        started = time.monotonic()
+        unique = list(dict.fromkeys(self.parse(symbols, hints)))
+        total = len(unique)
+        counts = {"done": 0, "valid": 0, "unresolved": 0}
+        yield {"type": "start", "total": total}
+
+        def result(pair: Pair, item: Optional[Dict[str, Any]], source: str) -> Dict[str, Any]:
+            counts["done"] += 1
+            counts["valid" if item is not None else "unresolved"] += 1
+            return {
+                "type": "result", "symbol": pair[0], "currency_hint": pair[1],
+                "status": "valid" if item is not None else "unresolved",
+                "instrument": item, "source": source,
+                "done": counts["done"], "total": total,
+            }
+
+        # 1) Listing resolution that needs no provider call
+        resolved, misses = self.md.resolver.resolve_stored([p for p in unique if _needs_resolution(p[1])])
+        unresolved_listing = set(misses)
+        targets = {
+            p: (p[0] if not _needs_resolution(p[1]) else resolved[p])
+            for p in unique if p not in unresolved_listing
+        }
+
+        # 2) Metadata that needs no provider call
+        instant = self._instant(targets)
+        for pair, (item, source) in instant.items():
+            yield result(pair, item, source)
+
+        # 3) Everything else: bounded concurrent batches
+        remaining = [p for p in unique if p not in instant]
+        if remaining:
+            batches = [remaining[i:i + self.batch_size] for i in range(0, len(remaining), self.batch_size)]
+            pool = ThreadPoolExecutor(max_workers=min(self.workers, len(batches)), thread_name_prefix="validate")
+            try:
+                futures = [pool.submit(self._validate_batch, batch, targets) for batch in batches]
+                for fut in as_completed(futures):
+                    outcomes, listings = fut.result()
+                    self.md.resolver.remember(listings)
+                    for pair, item, source in outcomes:
+                        yield result(pair, item, source)
+            finally:
+                # The client may have disconnected: drop batches that have not started
+                pool.shutdown(wait=False, cancel_futures=True)
+
+        elapsed = (time.monotonic() - started) * 1000
+        logger.info(f"validate_tickers: {total} unique symbols, {len(instant)} answered locally, "
+                    f"{counts['valid']} valid in {elapsed:.0f} ms")
+        yield {"type": "end", "total": total, "valid": counts["valid"],
+               "unresolved": counts["unresolved"], "elapsed_ms": round(elapsed)}
+
+    # ──────────────────── STAGES ────────────────────
+
+    def _instant(self, targets: Dict[Pair, str]) -> Dict[Pair, Tuple[Optional[Dict[str, Any]], str]]:
+        """Pairs answerable from _KNOWN_META, the instruments table, the info cache or the negative cache."""
+        out: Dict[Pair, Tuple[Optional[Dict[str, Any]], str]] = {}
+        rest: Dict[Pair, str] = {}
+        for pair, sym in targets.items():
+            meta = _KNOWN_META.get(sym) or _KNOWN_META.get(pair[0])
+            if meta and meta.get("name"):
+                out[pair] = (_instrument_item(sym, meta), "known")
+            else:
+                rest[pair] = sym
+        if not rest:
+            return out
+
+        # name == symbol is the placeholder ensure_instruments_exist writes for unknown tickers
+        rows = self.db.query(Instrument).filter(
+            Instrument.symbol.in_(set(rest.values())),
+            Instrument.name.isnot(None), Instrument.name != Instrument.symbol,
+        ).all()
+        stored = {r.symbol: r for r in rows}
+        for pair, sym in rest.items():
+            inst = stored.get(sym)
+            if inst is not None:
+                out[pair] = (_instrument_item(sym, {
+                    "name": inst.name, "sector": inst.sector, "country": inst.country,
+                    "asset_class": inst.asset_class, "currency": inst.currency,
+                }), "db")
+                continue
+            info = get_cache().get(f"info:{sym}")
+            if info and info.get("name"):
+                out[pair] = (_instrument_item(sym, info), "cache")
+            elif self.md.negative.blocked("info", sym):
+                out[pair] = (None, "negative")
+        return out
+
+    def _validate_batch(self, batch: List[Pair], targets: Dict[Pair, str]):
+        """
+        Worker: resolve listings and fetch metadata from the provider only.
+        Returns ([(pair, item or None, source)], {pair: listing to remember}).
+        """
+        outcomes: List[Tuple[Pair, Optional[Dict[str, Any]], str]] = []
+        listings: Dict[Pair, Any] = {}
+        for pair in batch:
+            sym, hint = pair
+            try:
+                target = targets.get(pair)
+                if target is None:
+                    listing = self.md.resolver.lookup(sym, hint)
+                    listings[pair] = listing
+                    target = listing["resolved_symbol"] if listing is not None else sym
+                    meta = _KNOWN_META.get(target) or _KNOWN_META.get(sym)
+                    if meta and meta.get("name"):
+                        outcomes.append((pair, _instrument_item(target, meta), "known"))
+                        continue
+                info = self.md.get_instrument_info(target)
+                if info and info.get("name"):
+                    outcomes.append((pair, _instrument_item(target, info), "provider"))
+                    continue
+            except Exception as e:
+                logger.warning(f"validate_tickers: lookup failed for '{sym}': {e}")
+            outcomes.append((pair, None, "provider"))
+        return outcomes, listings
@@ -0,0 +1,469 @@
+"""
+Exchange trading calendars.
+
+Each calendar is a precomputed session bitmap (one bool per calendar day from
+1990 to two years ahead) plus a cumulative session count, so "is this a
+session", "last session on or before D" and "sessions between A and B" are
+O(1) array lookups. Bitmaps are built lazily on first use per exchange.
+
+Holiday rules cover the recurring closures of the exchanges we map from
+Yahoo suffixes / exchange codes (fixed dates, Easter-relative days, nth-weekday
+rules and weekend substitution). Lunar-calendar holidays in Asia and one-off
+closures not listed in _SPECIAL_CLOSURES are not modelled; on those days the
+price gap check behaves as it did before (one provider call that returns no bar).
+"""
+
+import re
+import threading
+from datetime import date, timedelta
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+import numpy as np
+
+_BASE = date(1990, 1, 1)
+_HORIZON_YEARS = 2
+
+
+# ────────────── date rule helpers ──────────────
+def _easter(year: int) -> date:
+    """Gregorian Easter Sunday (anonymous Gregorian algorithm)."""
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+
+def _nth_weekday(year: int, month: int, weekday: int, n: int) -> date:
+    """n-th `weekday` (Mon=0) of the month; n=-1 for the last one."""
+    if n > 0:
+        first = date(year, month, 1)
+        return first + timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+    nxt = date(year + (month == 12), month % 12 + 1, 1)
+    last = nxt - timedelta(days=1)
+    return last - timedelta(days=(last.weekday() - weekday) % 7)
+
+
+def _us_observed(d: date) -> date:
+    """Saturday → Friday, Sunday → Monday."""
+    if d.weekday() == 5:
+        return d - timedelta(days=1)
+    if d.weekday() == 6:
+        return d + timedelta(days=1)
+    return d
+
+
+def _monday_if_weekend(d: date) -> date:
+    if d.weekday() >= 5:
+        return d + timedelta(days=7 - d.weekday())
+    return d
+
+
+def _christmas_boxing_substituted(year: int) -> List[date]:
+    """Commonwealth rule: Christmas and Boxing Day roll to the next free weekdays."""
+    xmas, boxing = date(year, 12, 25), date(year, 12, 26)
+    if xmas.weekday() == 5:
+        return [date(year, 12, 27), date(year, 12, 28)]
+    if xmas.weekday() == 6:
+        return [date(year, 12, 26), date(year, 12, 27)]
+    if boxing.weekday() == 5:
+        return [xmas, date(year, 12, 28)]
+    return [xmas, boxing]
+
+
+def _fixed(year: int, *month_days) -> List[date]:
+    return [date(year, m, d) for m, d in month_days]
+
+
+def _easter_offsets(year: int, *offsets: int) -> List[date]:
+    e = _easter(year)
+    return [e + timedelta(days=o) for o in offsets]
+
+
+_GOOD_FRIDAY, _EASTER_MONDAY = -2, 1
+_MAUNDY_THURSDAY, _ASCENSION, _WHIT_MONDAY = -3, 39, 50
+
+
+# ────────────── per-exchange rules (year → holidays) ──────────────
+def _xnys(y: int) -> List[date]:
+    days = []
+    ny = date(y, 1, 1)
+    if ny.weekday() != 5:               # NYSE does not observe a Saturday New Year on Dec 31
+        days.append(_us_observed(ny))
+    if y >= 1998:
+        days.append(_nth_weekday(y, 1, 0, 3))      # Martin Luther King Jr. Day
+    days.append(_nth_weekday(y, 2, 0, 3))          # Washington's Birthday
+    days += _easter_offsets(y, _GOOD_FRIDAY)
+    days.append(_nth_weekday(y, 5, 0, -1))         # Memorial Day
+    if y >= 2022:
+        days.append(_us_observed(date(y, 6, 19)))  # Juneteenth
+    days.append(_us_observed(date(y, 7, 4)))
+    days.append(_nth_weekday(y, 9, 0, 1))          # Labor Day
+    days.append(_nth_weekday(y, 11, 3, 4))         # Thanksgiving
+    days.append(_us_observed(date(y, 12, 25)))
+    return days
+
+
+def _xlon(y: int) -> List[date]:
+    days = [_monday_if_weekend(date(y, 1, 1))]
+    days += _easter_offsets(y, _GOOD_FRIDAY, _EASTER_MONDAY)
+    early_may = {1995: date(1995, 5, 8), 2020: date(2020, 5, 8)}.get(y, _nth_weekday(y, 5, 0, 1))
+    spring = {2002: date(2002, 6, 4), 2012: date(2012, 6, 4), 2022: date(2022, 6, 2)}.get(
+        y, _nth_weekday(y, 5, 0, -1))
+    days += [early_may, spring, _nth_weekday(y, 8, 0, -1)]
+    days += _christmas_boxing_substituted(y)
+    return days
+
+
+def _xetr(y: int) -> List[date]:
+    return (_fixed(y, (1, 1), (5, 1), (12, 24), (12, 25), (12, 26), (12, 31))
+            + _easter_offsets(y, _GOOD_FRIDAY, _EASTER_MONDAY))
+
+
+def _euronext(y: int) -> List[date]:
+    return (_fixed(y, (1, 1), (5, 1), (12, 25), (12, 26))
+            + _easter_offsets(y, _GOOD_FRIDAY, _EASTER_MONDAY))
+
+
+def _xmil(y: int) -> List[date]:
+    return (_fixed(y, (1, 1), (5, 1), (8, 15), (12, 24), (12, 25), (12, 26), (12, 31))
+            + _easter_offsets(y, _GOOD_FRIDAY, _EASTER_MONDAY))
+
+
+def _xwbo(y: int) -> List[date]:
+    return (_fixed(y, (1, 1), (5, 1), (12, 24), (12, 25), (12, 26), (12, 31))
+            + _easter_offsets(y, _GOOD_FRIDAY, _EASTER_MONDAY, _WHIT_MONDAY))
+
+
+def _xswx(y: int) -> List[date]:
+    return (_fixed(y, (1, 1), (1, 2), (5, 1), (8, 1), (12, 24), (12, 25), (12, 26), (12, 31))
+            + _easter_offsets(y, _GOOD_FRIDAY, _EASTER_MONDAY, _ASCENSION, _WHIT_MONDAY))
+
+
+def _xcse(y: int) -> List[date]:
+    offsets = [_MAUNDY_THURSDAY, _GOOD_FRIDAY, _EASTER_MONDAY, _ASCENSION, _WHIT_MONDAY]
+    if y < 2024:
+        offsets.append(26)              # Great Prayer Day (abolished 2024)
+    if y >= 2009:
+        offsets.append(_ASCENSION + 1)
+    return _fixed(y, (1, 1), (6, 5), (12, 24), (12, 25), (12, 26), (12, 31)) + _easter_offsets(y, *offsets)
+
+
+def _xosl(y: int) -> List[date]:
+    return (_fixed(y, (1, 1), (5, 1), (5, 17), (12, 24), (12, 25), (12, 26), (12, 31))
+            + _easter_offsets(y, _MAUNDY_THURSDAY, _GOOD_FRIDAY, _EASTER_MONDAY, _ASCENSION, _WHIT_MONDAY))
+
+
+def _midsummer_eve(y: int) -> date:
+    d = date(y, 6, 19)
+    return d + timedelta(days=(4 - d.weekday()) % 7)
+
+
+def _xsto(y: int) -> List[date]:
+    return (_fixed(y, (1, 1), (1, 6), (5, 1), (6, 6), (12, 24), (12, 25), (12, 26), (12, 31))
+            + _easter_offsets(y, _GOOD_FRIDAY, _EASTER_MONDAY, _ASCENSION) + [_midsummer_eve(y)])
+
+
+def _xhel(y: int) -> List[date]:
+    return (_fixed(y, (1, 1), (1, 6), (5, 1), (12, 6), (12, 24), (12, 25), (12, 26), (12, 31))
+            + _easter_offsets(y, _GOOD_FRIDAY, _EASTER_MONDAY, _ASCENSION) + [_midsummer_eve(y)])
+
+
+def _xmad(y: int) -> List[date]:
+    return _euronext(y)
+
+
+def _xtse(y: int) -> List[date]:
+    days = [_monday_if_weekend(date(y, 1, 1))]
+    if y >= 2008:
+        days.append(_nth_weekday(y, 2, 0, 3))      # Family Day
+    days += _easter_offsets(y, _GOOD_FRIDAY)
+    may25 = date(y, 5, 25)
+    days.append(may25 - timedelta(days=may25.weekday() or 7))   # Victoria Day
+    days.append(_monday_if_weekend(date(y, 7, 1)))
+    days += [_nth_weekday(y, 8, 0, 1), _nth_weekday(y, 9, 0, 1), _nth_weekday(y, 10, 0, 2)]
+    days += _christmas_boxing_substituted(y)
+    return days
+
+
+def _xasx(y: int) -> List[date]:
+    days = [_monday_if_weekend(date(y, 1, 1)), _monday_if_weekend(date(y, 1, 26)), date(y, 4, 25)]
+    days += _easter_offsets(y, _GOOD_FRIDAY, _EASTER_MONDAY)
+    days.append(_nth_weekday(y, 6, 0, 2))          # King's/Queen's Birthday
+    days += _christmas_boxing_substituted(y)
+    return days
+
+
+def _xtks(y: int) -> List[date]:
+    base = _fixed(y, (1, 1), (1, 2), (1, 3), (2, 11), (4, 29), (5, 3), (5, 4), (5, 5),
+                  (11, 3), (11, 23), (12, 31))
+    if y >= 2020:
+        base.append(date(y, 2, 23))
+    elif 1989 <= y <= 2018:
+        base.append(date(y, 12, 23))
+    shift = 0.242194 * (y - 1980) - int((y - 1980) / 4)
+    base += [date(y, 3, int(20.8431 + shift)), date(y, 9, int(23.2488 + shift))]
+    base += [_nth_weekday(y, 1, 0, 2), _nth_weekday(y, 9, 0, 3)]
+    if y not in (2020, 2021):           # Olympic years moved these (see _SPECIAL_CLOSURES)
+        base += [_nth_weekday(y, 7, 0, 3), _nth_weekday(y, 10, 0, 2)]
+        if y >= 2016:
+            base.append(date(y, 8, 11))
+    national = set(base) - set(_fixed(y, (1, 2), (1, 3), (12, 31)))   # exchange-only closures
+    for d in sorted(national):          # citizens' holiday: a day sandwiched between two holidays
+        if d + timedelta(days=2) in national and d.weekday() != 5:
+            base.append(d + timedelta(days=1))
+    days: Set[date] = set(base)
+    for d in sorted(national):          # substitute holiday: a Sunday holiday moves to the next free day
+        if d.weekday() == 6:
+            sub = d + timedelta(days=1)
+            while sub in national:
+                sub += timedelta(days=1)
+            days.add(sub)
+    return list(days)
+
+
+def _xhkg(y: int) -> List[date]:
+    return (_fixed(y, (1, 1), (5, 1), (7, 1), (10, 1), (12, 25), (12, 26))
+            + _easter_offsets(y, _GOOD_FRIDAY, _EASTER_MONDAY))
+
+
+def _xkrx(y: int) -> List[date]:
+    return _fixed(y, (1, 1), (3, 1), (5, 5), (6, 6), (8, 15), (10, 3), (10, 9), (12, 25), (12, 31))
+
+
+def _xbom(y: int) -> List[date]:
+    return _fixed(y, (1, 26), (5, 1), (8, 15), (10, 2), (12, 25))
+
+
+def _xses(y: int) -> List[date]:
+    return _fixed(y, (1, 1), (5, 1), (8, 9), (12, 25)) + _easter_offsets(y, _GOOD_FRIDAY)
+
+
+def _bvmf(y: int) -> List[date]:
+    return (_fixed(y, (1, 1), (4, 21), (5, 1), (9, 7), (10, 12), (11, 2), (11, 15), (12, 25))
+            + _easter_offsets(y, -48, -47, _GOOD_FRIDAY, 60))
+
+
+def _xmex(y: int) -> List[date]:
+    return (_fixed(y, (1, 1), (5, 1), (9, 16), (12, 12), (12, 25))
+            + [_nth_weekday(y, 2, 0, 1), _nth_weekday(y, 3, 0, 3), _nth_weekday(y, 11, 0, 3)]
+            + _easter_offsets(y, _MAUNDY_THURSDAY, _GOOD_FRIDAY))
+
+
+def _none(y: int) -> List[date]:
+    return []
+
+
+_SPECIAL_CLOSURES: Dict[str, List[date]] = {
+    "XNYS": [
+        date(1994, 4, 27), date(2001, 9, 11), date(2001, 9, 12), date(2001, 9, 13),
+        date(2001, 9, 14), date(2004, 6, 11), date(2007, 1, 2), date(2012, 10, 29),
+        date(2012, 10, 30), date(2018, 12, 5), date(2025, 1, 9),
+    ],
+    "XLON": [
+        date(1999, 12, 31), date(2002, 6, 3), date(2011, 4, 29), date(2012, 6, 5),
+        date(2022, 6, 3), date(2022, 9, 19), date(2023, 5, 8),
+    ],
+    "XASX": [date(2022, 9, 22)],
+    "XTKS": [
+        date(2019, 4, 30), date(2019, 5, 1), date(2019, 5, 2), date(2019, 10, 22),
+        date(2020, 7, 23), date(2020, 7, 24), date(2020, 8, 10),
+        date(2021, 7, 22), date(2021, 7, 23), date(2021, 8, 9),
+    ],
+}
+
+
+# ═══════════════════════════════════════════════════════════════
+#  Calendar
+# ═══════════════════════════════════════════════════════════════
+class TradingCalendar:
+    """Session bitmap for one exchange. Dates outside the bitmap fall back to weekday rules."""
+
+    def __init__(self, code: str, rule: Callable[[int], Iterable[date]], weekend: bool = False):
+        self.code = code
+        self._rule = rule
+        self._weekend = weekend          # True = trades 7 days a week (crypto)
+        self._lock = threading.Lock()
+        self._end: Optional[date] = None
+        self._bitmap: Optional[np.ndarray] = None   # bool per day since _BASE
+        self._cum: Optional[np.ndarray] = None      # sessions in [_BASE, day]
+        self._positions: Optional[np.ndarray] = None  # day offsets of every session
+
+    def _ensure(self) -> None:
+        horizon = date(date.today().year + _HORIZON_YEARS, 12, 31)
+        if self._end is not None and self._end >= horizon:
+            return
+        with self._lock:
+            if self._end is not None and self._end >= horizon:
+                return
+            n = (horizon - _BASE).days + 1
+            offsets = np.arange(n)
+            if self._weekend:
+                bitmap = np.ones(n, dtype=bool)
+            else:
+                # _BASE is a Monday, so offset % 7 is the weekday
+                bitmap = (offsets % 7) < 5
+            closed = set(_SPECIAL_CLOSURES.get(self.code, []))
+            for year in range(_BASE.year, horizon.year + 1):
+                closed.update(self._rule(year))
+            idx = [(d - _BASE).days for d in closed if _BASE <= d <= horizon]
+            if idx:
+                bitmap[np.array(idx)] = False
+            self._bitmap = bitmap
+            self._cum = np.cumsum(bitmap, dtype=np.int64)
+            self._positions = np.flatnonzero(bitmap)
+            self._end = horizon
+
+    def _offset(self, d: date) -> int:
+        self._ensure()
+        return (d - _BASE).days
+
+    def _in_range(self, off: int) -> bool:
+        return 0 <= off < len(self._bitmap)
+
+    # ── queries ──
+    def is_session(self, d: date) -> bool:
+        off = self._offset(d)
+        if not self._in_range(off):
+            return self._weekend or d.weekday() < 5
+        return bool(self._bitmap[off])
+
+    def last_session_on_or_before(self, d: date) -> date:
+        off = self._offset(d)
+        if off >= len(self._bitmap):
+            off = len(self._bitmap) - 1
+        if off < 0:
+            while not (self._weekend or d.weekday() < 5):
+                d -= timedelta(days=1)
+            return d
+        count = int(self._cum[off])
+        if count == 0:
+            return d
+        return _BASE + timedelta(days=int(self._positions[count - 1]))
+
+    def previous_session(self, d: date) -> date:
+        """Last session strictly before d."""
+        return self.last_session_on_or_before(d - timedelta(days=1))
+
+    def next_session_on_or_after(self, d: date) -> date:
+        off = self._offset(d)
+        if off < 0 or off >= len(self._bitmap):
+            while not (self._weekend or d.weekday() < 5):
+                d += timedelta(days=1)
+            return d
+        pos = int(self._cum[off]) - (1 if self._bitmap[off] else 0)
+        if pos >= len(self._positions):
+            return d
+        return _BASE + timedelta(days=int(self._positions[pos]))
+
+    def sessions_between(self, start: date, end: date) -> int:
+        """Number of sessions in [start, end]."""
+        if end < start:
+            return 0
+        lo, hi = self._offset(start), self._offset(end)
+        lo = min(max(lo, 0), len(self._cum) - 1)
+        hi = min(max(hi, 0), len(self._cum) - 1)
+        return int(self._cum[hi]) - (int(self._cum[lo - 1]) if lo > 0 else 0)
+
+    def __repr__(self) -> str:
+        return f"TradingCalendar({self.code})"
+
+
+_RULES: Dict[str, Callable[[int], Iterable[date]]] = {
+    "XNYS": _xnys, "XLON": _xlon, "XETR": _xetr, "XPAR": _euronext, "XMIL": _xmil,
+    "XMAD": _xmad, "XWBO": _xwbo, "XSWX": _xswx, "XCSE": _xcse, "XOSL": _xosl,
+    "XSTO": _xsto, "XHEL": _xhel, "XTSE": _xtse, "XASX": _xasx, "XTKS": _xtks,
+    "XHKG": _xhkg, "XKRX": _xkrx, "XBOM": _xbom, "XSES": _xses, "BVMF": _bvmf,
+    "XMEX": _xmex, "WEEKDAYS": _none,
+}
+
+_calendars: Dict[str, TradingCalendar] = {}
+_calendars_lock = threading.Lock()
+
+
+def get_calendar(code: str) -> TradingCalendar:
+    cal = _calendars.get(code)
+    if cal is None:
+        with _calendars_lock:
+            cal = _calendars.get(code)
+            if cal is None:
+                if code == "ALWAYS":
+                    cal = TradingCalendar(code, _none, weekend=True)
+                else:
+                    cal = TradingCalendar(code, _RULES.get(code, _none))
+                _calendars[code] = cal
+    return cal
+
+
+# ────────────── symbol / exchange → calendar ──────────────
+# Yahoo suffixes (see _CURRENCY_SUFFIXES in market_data.py)
+_SUFFIX_CALENDAR: Dict[str, str] = {
+    "PA": "XPAR", "AS": "XPAR", "BR": "XPAR", "LS": "XPAR",
+    "DE": "XETR", "F": "XETR",
+    "MI": "XMIL", "MC": "XMAD", "VI": "XWBO", "HE": "XHEL",
+    "SW": "XSWX", "L": "XLON", "IL": "XLON",
+    "CO": "XCSE", "OL": "XOSL", "ST": "XSTO",
+    "T": "XTKS", "HK": "XHKG", "KS": "XKRX", "KQ": "XKRX",
+    "BO": "XBOM", "NS": "XBOM", "SI": "XSES",
+    "TO": "XTSE", "V": "XTSE", "AX": "XASX",
+    "SA": "BVMF", "MX": "XMEX",
+}
+
+# Yahoo exchange codes (see _EXCHANGE_CURRENCY in market_data.py)
+_EXCHANGE_CALENDAR: Dict[str, str] = {
+    **{code: "XNYS" for code in ("NYQ", "NMS", "NGM", "NCM", "PCX", "BTS", "ASE",
+                                 "OQX", "PNK", "OPR", "NAS")},
+    "CCC": "ALWAYS",
+    "MIL": "XMIL", "PAR": "XPAR", "AMS": "XPAR", "LIS": "XPAR", "BRU": "XPAR",
+    **{code: "XETR" for code in ("GER", "FRA", "MUN", "BER", "DUS", "HAM", "STU")},
+    "MCE": "XMAD", "VIE": "XWBO", "HEL": "XHEL",
+    "DXE": "XPAR", "CXE": "XPAR", "IOB": "XLON", "ATH": "WEEKDAYS",
+    "EBS": "XSWX", "ZRH": "XSWX", "LSE": "XLON", "LON": "XLON",
+    "CPH": "XCSE", "OSL": "XOSL", "STO": "XSTO",
+    "JPX": "XTKS", "TYO": "XTKS", "HKG": "XHKG", "KSC": "XKRX", "KOE": "XKRX",
+    "BSE": "XBOM", "NSI": "XBOM", "SET": "WEEKDAYS", "KLS": "WEEKDAYS", "SGX": "XSES",
+    "TSE": "XTSE", "VAN": "XTSE", "NEO": "XTSE",
+    "SAO": "BVMF", "MEX": "XMEX", "ASX": "XASX", "CXA": "XASX",
+}
+
+_INDEX_CALENDAR: Dict[str, str] = {
+    "^FTSE": "XLON", "^GDAXI": "XETR", "^FCHI": "XPAR", "^STOXX50E": "XETR",
+    "^AEX": "XPAR", "^IBEX": "XMAD", "^SSMI": "XSWX", "FTSEMIB.MI": "XMIL",
+    "^N225": "XTKS", "^HSI": "XHKG", "^KS11": "XKRX", "^BSESN": "XBOM",
+    "^GSPTSE": "XTSE", "^AXJO": "XASX", "^BVSP": "BVMF", "^MXX": "XMEX",
+}
+
+_CRYPTO_RE = re.compile(r"^[A-Z0-9]{2,10}-(USD|USDT|EUR|GBP|BTC|ETH)$")
+
+
+def calendar_code_for_symbol(symbol: Optional[str]) -> str:
+    sym = (symbol or "").strip().upper()
+    if not sym:
+        return "XNYS"
+    if sym in _INDEX_CALENDAR:
+        return _INDEX_CALENDAR[sym]
+    if sym.endswith("=X") or sym.endswith("=F"):
+        return "WEEKDAYS"
+    if _CRYPTO_RE.match(sym):
+        return "ALWAYS"
+    if "." in sym:
+        suffix = sym.rsplit(".", 1)[-1]
+        if suffix in _SUFFIX_CALENDAR:
+            return _SUFFIX_CALENDAR[suffix]
+    return "XNYS"
+
+
+def calendar_for_symbol(symbol: Optional[str]) -> TradingCalendar:
+    """Trading calendar of the exchange a Yahoo symbol is listed on (US by default)."""
+    return get_calendar(calendar_code_for_symbol(symbol))
+
+
+def calendar_for_exchange(exchange_code: str) -> TradingCalendar:
+    """Trading calendar for a Yahoo exchange code (e.g. 'MIL', 'NMS')."""
+    return get_calendar(_EXCHANGE_CALENDAR.get((exchange_code or "").upper(), "XNYS"))
@@ -0,0 +1,161 @@
+"""
+Regression benchmark: row-by-row vs columnar analytics series.
+
+Builds synthetic daily portfolio / benchmark returns for 1, 5 and 20 years
+and times each chart section of get_portfolio_analytics with the original
+per-date loops (kept below) and with analytics_series. Both outputs must be
+equal — values may differ by one unit in the last decimal where np.round and
+round() break a tie differently — or the script exits non-zero.
+
+    python bench_analytics.py [--years 1 5 20] [--repeat 3]
+
+No database needed: the settings the app imports require are given
+placeholder defaults below (real values in the environment take precedence).
+"""
+
+import argparse
+import os
+import sys
+import time
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+import pandas as pd
+
+# Settings validate these at import time; the benchmark never connects to them
+for _name, _value in {
+    "POSTGRES_USER": "bench", "POSTGRES_PASSWORD": "bench", "POSTGRES_SERVER": "localhost",
+    "POSTGRES_PORT": "5432", "POSTGRES_DB": "bench", "SECRET_KEY": "bench", "REDIS_URL": "memory://",
+}.items():
+    os.environ.setdefault(_name, _value)
+
+from app.services import analytics_series as series
+from app.services.analytics import _safe_float
+
+
+# ────────────── the loops analytics.py used before ──────────────
+def legacy_performance(pf_returns: pd.Series, bench_returns: pd.Series) -> List[Dict[str, Any]]:
+    pf_cum_ret = ((1 + pf_returns).cumprod() - 1) * 100
+    bench_cum_ret = ((1 + bench_returns).cumprod() - 1) * 100
+    out = []
+    for dt in pf_cum_ret.index:
+        pf_val = _safe_float((1 + pf_returns.loc[:dt]).prod() * 100, 100.0)
+        bench_val = _safe_float((1 + bench_returns.loc[:dt]).prod() * 100, 100.0)
+        out.append({
+            "date": dt.strftime('%Y-%m-%d'),
+            "portfolio": round(pf_val, 2),
+            "benchmark": round(bench_val, 2),
+            "portfolioReturn": round(_safe_float(pf_cum_ret.loc[dt]), 2),
+            "benchmarkReturn": round(_safe_float(bench_cum_ret.loc[dt]), 2),
+        })
+    return out
+
+
+def legacy_drawdown(pf_returns: pd.Series) -> List[Dict[str, Any]]:
+    cum = (1 + pf_returns).cumprod()
+    rolling_max = cum.cummax()
+    drawdown = ((cum - rolling_max) / rolling_max) * 100
+    cum_ret = (cum / cum.iloc[0] - 1) * 100
+    return [{
+        "date": dt.strftime('%Y-%m-%d'),
+        "drawdown": round(_safe_float(drawdown.loc[dt]), 2),
+        "cumReturn": round(_safe_float(cum_ret.loc[dt]), 2),
+    } for dt in pf_returns.index]
+
+
+def legacy_rolling_volatility(pf_returns: pd.Series, bench_returns: pd.Series, window: int = 60) -> List[Dict[str, Any]]:
+    pf_vol = pf_returns.rolling(window).std() * np.sqrt(252) * 100
+    bench_vol = bench_returns.rolling(window).std() * np.sqrt(252) * 100
+    return [{
+        "date": dt.strftime('%Y-%m-%d'),
+        "portfolio": round(_safe_float(pf_vol.loc[dt]), 2),
+        "benchmark": round(_safe_float(bench_vol.get(dt, 0)), 2),
+    } for dt in pf_vol.dropna().iloc[::5].index]
+
+
+def legacy_rolling_correlation(pf_returns: pd.Series, bench_returns: pd.Series, window: int = 60) -> List[Dict[str, Any]]:
+    rolling_corr = pf_returns.rolling(window).corr(bench_returns)
+    return [{
+        "date": dt.strftime('%Y-%m-%d'),
+        "correlation": round(_safe_float(rolling_corr.loc[dt]), 3),
+    } for dt in rolling_corr.dropna().iloc[::5].index]
+
+
+def legacy_monthly(pf_returns: pd.Series, bench_returns: pd.Series) -> List[Dict[str, Any]]:
+    pf_monthly = pf_returns.resample('ME').apply(lambda x: (1 + x).prod() - 1).fillna(0)
+    bench_monthly = bench_returns.resample('ME').apply(lambda x: (1 + x).prod() - 1).fillna(0)
+    return [{
+        "month": dt.strftime('%b %y'),
+        "portfolio": round(_safe_float(pf_monthly.loc[dt]) * 100, 2),
+        "benchmark": round(_safe_float(bench_monthly.get(dt, 0)) * 100, 2),
+    } for dt in pf_monthly.index]
+
+
+SECTIONS = {
+    "performance": (lambda p, b: legacy_performance(p, b), lambda p, b: series.performance_rows(p, b)),
+    "drawdown": (lambda p, b: legacy_drawdown(p), lambda p, b: series.drawdown_rows(p)),
+    "rolling volatility": (legacy_rolling_volatility, series.rolling_volatility_rows),
+    "rolling correlation": (legacy_rolling_correlation, series.rolling_correlation_rows),
+    "monthly": (legacy_monthly, series.monthly_rows),
+}
+
+
+def _returns(years: int) -> Dict[str, pd.Series]:
+    index = pd.bdate_range(end=pd.Timestamp.today().normalize(), periods=int(years * 252))
+    rng = np.random.default_rng(years)
+    bench = rng.standard_t(4, len(index)) * 0.009
+    pf = 0.8 * bench + rng.standard_t(4, len(index)) * 0.006
+    return {"pf": pd.Series(pf, index=index), "bench": pd.Series(bench, index=index)}
+
+
+def _best(fn: Callable[[], Any], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t)
+    return best
+
+
+def _mismatches(old: List[Dict[str, Any]], new: List[Dict[str, Any]]) -> int:
+    """Rows that differ by more than one unit in the last decimal (or in shape / labels)."""
+    if len(old) != len(new):
+        return max(len(old), len(new))
+    bad = 0
+    for a, b in zip(old, new):
+        if a.keys() != b.keys():
+            bad += 1
+            continue
+        for k, va in a.items():
+            vb = b[k]
+            if isinstance(va, str) or isinstance(vb, str):
+                bad += va != vb
+            elif abs(va - vb) > 0.0011:
+                bad += 1
+    return bad
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--years", type=int, nargs="+", default=[1, 5, 20])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    failed = False
+    print(f"{'':22}{'years':>6}{'days':>7}{'rows':>7}{'loop (ms)':>12}{'columnar (ms)':>15}{'speed-up':>10}")
+    for years in args.years:
+        r = _returns(years)
+        for name, (legacy, columnar) in SECTIONS.items():
+            old, new = legacy(r["pf"], r["bench"]), columnar(r["pf"], r["bench"])
+            bad = _mismatches(old, new)
+            failed |= bad > 0
+            t_old = _best(lambda: legacy(r["pf"], r["bench"]), args.repeat) * 1000
+            t_new = _best(lambda: columnar(r["pf"], r["bench"]), args.repeat) * 1000
+            flag = f"  {bad} rows differ" if bad else ""
+            print(f"{name:22}{years:>6}{len(r['pf']):>7}{len(new):>7}{t_old:>12.1f}{t_new:>15.2f}"
+                  f"{t_old / max(t_new, 1e-6):>9.0f}x{flag}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""
+Insert and range-scan benchmark: original vs lean price_history layout.
+
+Builds both layouts side by side in scratch schemas (bench_legacy,
+bench_lean) on the configured database, loads the same synthetic bars into
+each with the production upsert statements and times:
+
+  • initial load    — every bar, _UPSERT_CHUNK bars per statement
+  • daily appends   — one statement per trading day for all symbols
+  • re-upsert       — the last 30 days again, unchanged (conflict path)
+  • point ranges    — 1-year window of one symbol, --queries times
+  • full matrix     — every symbol over the whole span in one query
+  • both scans again after CLUSTER on the (symbol, date) key, with --cluster
+
+then drops the schemas. The live price_history is not touched.
+
+    python bench_price_history.py --symbols 200 --years 10 [--partitioned] [--cluster]
+"""
+
+import argparse
+import random
+import time
+from datetime import date, timedelta
+from typing import Dict, List
+
+import numpy as np
+from sqlalchemy import text
+
+from app.db import price_history_layout as layout
+from app.db.session import engine
+from app.services.market_data import _UPSERT_CHUNK, _UPSERT_PRICES_SQL
+from app.services.price_store import _RANGES_SQL
+
+# The statements price_history used before the lean layout
+_LEGACY_DDL = """
+    CREATE TABLE price_history (
+        id serial PRIMARY KEY,
+        instrument_symbol varchar REFERENCES instruments (symbol),
+        date date NOT NULL,
+        open double precision, high double precision, low double precision,
+        close double precision, volume double precision, adjusted_close double precision
+    );
+    CREATE INDEX ix_price_history_id ON price_history (id);
+    CREATE INDEX ix_price_history_instrument_symbol ON price_history (instrument_symbol);
+    CREATE INDEX ix_price_history_date ON price_history (date);
+    CREATE INDEX ix_price_history_symbol_date ON price_history (instrument_symbol, date);
+    CREATE UNIQUE INDEX uq_price_history_symbol_date ON price_history (instrument_symbol, date);
+"""
+_LEGACY_UPSERT = text("""
+    INSERT INTO price_history
+        (instrument_symbol, date, open, high, low, close, volume, adjusted_close)
+    SELECT s, d, o, h, l, c, v, c
+    FROM unnest(
+        CAST(:symbols AS varchar[]), CAST(:dates AS date[]),
+        CAST(:opens AS float8[]), CAST(:highs AS float8[]), CAST(:lows AS float8[]),
+        CAST(:closes AS float8[]), CAST(:volumes AS float8[])
+    ) AS t(s, d, o, h, l, c, v)
+    ON CONFLICT (instrument_symbol, date) DO UPDATE SET
+        open = excluded.open, high = excluded.high, low = excluded.low, close = excluded.close,
+        volume = excluded.volume, adjusted_close = excluded.adjusted_close
+    WHERE price_history.close IS DISTINCT FROM excluded.close
+    RETURNING instrument_symbol, (xmax = 0) AS inserted
+""")
+_LEGACY_RANGES = text("""
+    SELECT p.instrument_symbol, p.date, COALESCE(p.adjusted_close, p.close)
+    FROM price_history p
+    JOIN unnest(CAST(:symbols AS varchar[]), CAST(:los AS date[]), CAST(:his AS date[])) AS r(s, lo, hi)
+      ON p.instrument_symbol = r.s AND p.date BETWEEN r.lo AND r.hi
+""")
+
+
+def _bars(symbols: List[str], days: List[date]) -> Dict[str, list]:
+    n = len(symbols) * len(days)
+    closes = (100 + np.random.default_rng(7).standard_normal(n).cumsum() * 0.1).tolist()
+    return {
+        "symbols": [s for _ in days for s in symbols],
+        "dates": [d for d in days for _ in symbols],
+        "opens": closes, "highs": closes, "lows": closes, "closes": closes,
+        "volumes": [1000.0] * n,
+    }
+
+
+def _chunks(cols: Dict[str, list], size: int):
+    for lo in range(0, len(cols["symbols"]), size):
+        yield {k: v[lo:lo + size] for k, v in cols.items()}
+
+
+def _timed(fn) -> float:
+    t = time.perf_counter()
+    fn()
+    return time.perf_counter() - t
+
+
+def run(layout_name: str, schema: str, symbols: List[str], days: List[date], args) -> Dict[str, float]:
+    upsert, ranges = (_LEGACY_UPSERT, _LEGACY_RANGES) if layout_name == "legacy" else (_UPSERT_PRICES_SQL, _RANGES_SQL)
+    split = len(days) - args.append_days
+    history, appended = days[:split], days[split:]
+    out: Dict[str, float] = {}
+
+    with engine.connect() as conn:
+        conn.execute(text(f"DROP SCHEMA IF EXISTS {schema} CASCADE; CREATE SCHEMA {schema}"))
+        conn.execute(text(f"SET search_path TO {schema}"))
+        conn.execute(text(
+            "CREATE TABLE instruments (symbol varchar PRIMARY KEY, "
+            "id integer GENERATED BY DEFAULT AS IDENTITY UNIQUE)"
+        ))
+        conn.execute(text("INSERT INTO instruments (symbol) SELECT unnest(CAST(:s AS varchar[]))"), {"s": symbols})
+        if layout_name == "legacy":
+            conn.execute(text(_LEGACY_DDL))
+        else:
+            years = list(range(days[0].year, days[-1].year + 2))
+            layout.create_table(conn, layout.TABLE, args.partitioned, years)
+            layout.add_keys(conn)
+        conn.commit()
+
+        def load(cols):
+            for chunk in _chunks(cols, _UPSERT_CHUNK):
+                conn.execute(upsert, chunk).fetchall()
+            conn.commit()
+
+        out["initial load (s)"] = _timed(lambda: load(_bars(symbols, history)))
+
+        def append():
+            for d in appended:
+                conn.execute(upsert, _bars(symbols, [d])).fetchall()
+                conn.commit()
+        out[f"{len(appended)} daily appends (ms/day)"] = _timed(append) * 1000 / max(1, len(appended))
+        out["re-upsert 30 days (s)"] = _timed(lambda: load(_bars(symbols, days[-30:])))
+        conn.execute(text("ANALYZE price_history"))
+        conn.commit()
+
+        out["table+indexes (MB)"] = conn.execute(text(
+            "SELECT sum(pg_total_relation_size(c.oid)) / 1048576.0 FROM pg_class c "
+            "WHERE c.relnamespace = current_schema()::regnamespace AND c.relkind IN ('r', 'p') "
+            "AND c.relname LIKE 'price_history%'"
+        )).scalar()
+        out["indexes (MB)"] = conn.execute(text(
+            "SELECT coalesce(sum(pg_relation_size(c.oid)), 0) / 1048576.0 FROM pg_class c "
+            "WHERE c.relnamespace = current_schema()::regnamespace AND c.relkind = 'i' "
+            "AND c.relname NOT LIKE 'instruments%'"
+        )).scalar()
+
+        def scans(suffix: str = "") -> None:
+            rnd = random.Random(11)
+
+            def point_ranges():
+                for _ in range(args.queries):
+                    lo = days[0] + timedelta(days=rnd.randrange(max(1, (days[-1] - days[0]).days - 365)))
+                    conn.execute(ranges, {
+                        "symbols": [rnd.choice(symbols)], "los": [lo], "his": [lo + timedelta(days=365)],
+                    }).fetchall()
+            point_ranges()                              # warm the cache; time the second pass
+            rnd.seed(11)
+            out[f"1y range x{args.queries} (ms/query){suffix}"] = _timed(point_ranges) * 1000 / args.queries
+
+            full = {"symbols": symbols, "los": [days[0]] * len(symbols), "his": [days[-1]] * len(symbols)}
+            conn.execute(ranges, full).fetchall()
+            out[f"full matrix (s){suffix}"] = _timed(lambda: conn.execute(ranges, full).fetchall())
+
+        scans()
+        if args.cluster:
+            if layout_name == "legacy":
+                targets = [("price_history", "uq_price_history_symbol_date")]
+            else:
+                targets = [(t, f"{t}_pkey") for t in (layout.partitions(conn) or [layout.TABLE])]
+            for table, index in targets:
+                conn.execute(text(f"CLUSTER {table} USING {index}"))
+            conn.execute(text("ANALYZE price_history"))
+            conn.commit()
+            scans(" clustered")
+
+        conn.execute(text("SET search_path TO public"))
+        conn.execute(text(f"DROP SCHEMA {schema} CASCADE"))
+        conn.commit()
+    return out
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--symbols", type=int, default=200)
+    parser.add_argument("--years", type=int, default=10)
+    parser.add_argument("--append-days", type=int, default=20)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--partitioned", action="store_true", help="partition the lean table by year")
+    parser.add_argument("--cluster", action="store_true", help="also time the scans after CLUSTER (see reindex_price_history.py)")
+    args = parser.parse_args()
+
+    end = date.today()
+    days = [d for d in (end - timedelta(days=i) for i in range(int(args.years * 365.25), -1, -1)) if d.weekday() < 5]
+    symbols = [f"B{i:04d}" for i in range(args.symbols)]
+    print(f"{len(symbols)} symbols x {len(days)} trading days = {len(symbols) * len(days):,} bars")
+
+    legacy = run("legacy", "bench_legacy", symbols, days, args)
+    lean = run("lean", "bench_lean", symbols, days, args)
+    label = "lean (partitioned)" if args.partitioned else "lean"
+    print(f"\n{'':34}{'legacy':>12}{label:>20}")
+    for key in legacy:
+        print(f"{key:34}{legacy[key]:>12.2f}{lean[key]:>20.2f}")
+
+
+if __name__ == "__main__":
+    main()
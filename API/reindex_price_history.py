@@ -0,0 +1,156 @@
+"""
+Maintenance for the lean price_history table (see app/db/price_history_layout.py).
+
+    python reindex_price_history.py status
+    python reindex_price_history.py reindex [--concurrently] [--year 2024 ...]
+    python reindex_price_history.py cluster [--year 2024 ...]
+    python reindex_price_history.py partitions [--years-ahead 1]
+    python reindex_price_history.py partition [--years-ahead 1]
+
+reindex     rebuilds the primary key index (bloated after large backfills or
+            re-upserts), partition by partition, then ANALYZE.
+cluster     rewrites each table / partition in primary-key order so one
+            symbol's bars are contiguous on disk. Daily ingestion appends in
+            date order, which scatters every symbol across the whole heap;
+            a clustered table serves range scans from a handful of pages.
+            Takes an exclusive lock per partition while it runs.
+partitions  adds missing yearly partitions up to --years-ahead past the
+            current year (rows already in the default partition are moved).
+partition   converts an unpartitioned price_history to yearly partitions
+            (copy into a partitioned table, swap, rebuild the keys). Writes
+            are blocked while it runs; reads are not until the swap.
+"""
+
+import argparse
+import logging
+import time
+from typing import List
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from app.db import price_history_layout as layout
+from app.db.session import engine
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+logger = logging.getLogger(__name__)
+
+_STAGING = "price_history_lean"
+
+
+def _targets(conn: Connection, years: List[int]) -> List[str]:
+    """Tables holding rows: the partitions (optionally only some years), or price_history itself."""
+    parts = layout.partitions(conn)
+    if not parts:
+        if years:
+            raise SystemExit("price_history is not partitioned; --year does not apply")
+        return [layout.TABLE]
+    if years:
+        wanted = {layout.partition_name(y) for y in years}
+        missing = wanted - set(parts)
+        if missing:
+            raise SystemExit(f"no such partitions: {', '.join(sorted(missing))}")
+        return [p for p in parts if p in wanted]
+    return parts
+
+
+def _pkey(conn: Connection, table: str) -> str:
+    return conn.execute(text(
+        "SELECT indexrelid::regclass::text FROM pg_index "
+        "WHERE indrelid = CAST(:t AS regclass) AND indisprimary"
+    ), {"t": table}).scalar()
+
+
+def status(conn: Connection, args) -> None:
+    rows = conn.execute(text("""
+        SELECT c.relname, c.reltuples::bigint,
+               pg_relation_size(c.oid) / 1048576.0,
+               pg_indexes_size(c.oid) / 1048576.0,
+               (SELECT correlation FROM pg_stats s
+                WHERE s.schemaname = current_schema() AND s.tablename = c.relname
+                  AND s.attname = 'instrument_id')
+        FROM pg_class c
+        WHERE c.relnamespace = current_schema()::regnamespace AND c.relkind = 'r'
+          AND (c.relname = :t OR c.relname = ANY(CAST(:parts AS text[])))
+        ORDER BY c.relname
+    """), {"t": layout.TABLE, "parts": layout.partitions(conn)}).fetchall()
+    print(f"{'table':28}{'rows':>14}{'heap MB':>10}{'index MB':>10}{'clustered':>11}")
+    for name, n, heap, idx, corr in rows:
+        clustered = f"{abs(corr):.2f}" if corr is not None else "-"
+        print(f"{name:28}{max(n, 0):>14,}{heap:>10.1f}{idx:>10.1f}{clustered:>11}")
+    print("\nclustered = |correlation| of instrument_id with physical order (1.00 = fully clustered)")
+
+
+def reindex(conn: Connection, args) -> None:
+    how = "CONCURRENTLY " if args.concurrently else ""
+    for table in _targets(conn, args.year):
+        started = time.monotonic()
+        conn.execute(text(f"REINDEX TABLE {how}{table}"))
+        conn.execute(text(f"ANALYZE {table}"))
+        logger.info(f"{table}: reindexed in {time.monotonic() - started:.1f}s")
+
+
+def cluster(conn: Connection, args) -> None:
+    for table in _targets(conn, args.year):
+        started = time.monotonic()
+        conn.execute(text(f"CLUSTER {table} USING {_pkey(conn, table)}"))
+        conn.execute(text(f"ANALYZE {table}"))
+        logger.info(f"{table}: clustered in {time.monotonic() - started:.1f}s")
+
+
+def partitions(conn: Connection, args) -> None:
+    if not layout.is_partitioned(conn):
+        raise SystemExit("price_history is not partitioned (convert it with: reindex_price_history.py partition)")
+    created = layout.ensure_year_partitions(conn, layout.year_span(conn, layout.TABLE, args.years_ahead))
+    logger.info(f"created {len(created)} partitions: {', '.join(created)}" if created else "partitions up to date")
+
+
+def partition(conn: Connection, args) -> None:
+    if layout.is_partitioned(conn):
+        raise SystemExit("price_history is already partitioned")
+    started = time.monotonic()
+    with engine.begin() as tx:
+        tx.execute(text(f"LOCK TABLE {layout.TABLE} IN EXCLUSIVE MODE"))
+        years = layout.year_span(tx, layout.TABLE, args.years_ahead)
+        layout.create_table(tx, _STAGING, True, years)
+        moved = tx.execute(text(
+            f"INSERT INTO {_STAGING} "
+            f"SELECT instrument_id, date, open, high, low, close, volume, adjusted_close "
+            f"FROM {layout.TABLE} ORDER BY instrument_id, date"
+        )).rowcount
+        tx.execute(text(f"DROP TABLE {layout.TABLE}"))
+        tx.execute(text(f"ALTER TABLE {_STAGING} RENAME TO {layout.TABLE}"))
+        layout.add_keys(tx)
+    conn.execute(text(f"ANALYZE {layout.TABLE}"))
+    logger.info(f"{layout.TABLE}: {moved:,} rows in {len(years)} yearly partitions "
+                f"({years[0]}–{years[-1]}) in {time.monotonic() - started:.1f}s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("status")
+    p = sub.add_parser("reindex")
+    p.add_argument("--concurrently", action="store_true", help="REINDEX CONCURRENTLY (no write lock, slower)")
+    p.add_argument("--year", type=int, nargs="*", default=[])
+    p = sub.add_parser("cluster")
+    p.add_argument("--year", type=int, nargs="*", default=[])
+    p = sub.add_parser("partitions")
+    p.add_argument("--years-ahead", type=int, default=layout.YEARS_AHEAD)
+    p = sub.add_parser("partition")
+    p.add_argument("--years-ahead", type=int, default=layout.YEARS_AHEAD)
+    args = parser.parse_args()
+
+    command = {
+        "status": status, "reindex": reindex, "cluster": cluster,
+        "partitions": partitions, "partition": partition,
+    }[args.command]
+    # REINDEX CONCURRENTLY and per-partition progress need statements outside one big transaction
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        if layout.is_legacy(conn):
+            raise SystemExit("price_history still has the original layout: run `alembic upgrade head` first")
+        command(conn, args)
+
+
+if __name__ == "__main__":
+    main()
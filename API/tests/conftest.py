@@ -0,0 +1,11 @@
+import os
+import sys
+
+# Settings need these at import time; the unit tests never connect to them
+for name, value in {
+    "POSTGRES_USER": "test", "POSTGRES_PASSWORD": "test", "POSTGRES_SERVER": "localhost",
+    "POSTGRES_PORT": "5432", "POSTGRES_DB": "test", "SECRET_KEY": "test", "REDIS_URL": "memory://",
+}.items():
+    os.environ.setdefault(name, value)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
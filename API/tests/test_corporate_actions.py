@@ -0,0 +1,83 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from app.services.corporate_actions import (
+    adjust_frame, extract_actions, later_splits, load_factors, merge_actions, unsplit_frames,
+)
+
+SYM = "SPLT"
+SPLIT_DATE, RATIO = date(2020, 8, 31), 4.0
+TODAY = date(2021, 6, 30)
+
+
+class FakeProvider:
+    """Traded closes with one 4-for-1 split; history() adjusts for every split through today, like Yahoo."""
+
+    def __init__(self):
+        self.days = pd.bdate_range("2019-01-01", TODAY)
+        traded = 100.0 * np.exp(np.cumsum(np.random.default_rng(0).normal(0, 0.01, len(self.days))))
+        self.traded = pd.Series(np.where(self.days < pd.Timestamp(SPLIT_DATE), traded, traded / RATIO), self.days)
+        self.adjusted = self.traded.where(self.days >= pd.Timestamp(SPLIT_DATE), self.traded / RATIO)
+        self.split_calls = 0
+
+    def history(self, start: date, end: date) -> pd.DataFrame:
+        window = (self.days >= pd.Timestamp(start)) & (self.days < pd.Timestamp(end))
+        df = pd.DataFrame({"Close": self.adjusted[window], "Stock Splits": 0.0})
+        if SPLIT_DATE in df.index.date:
+            df.loc[pd.Timestamp(SPLIT_DATE), "Stock Splits"] = RATIO
+        return df
+
+    def splits(self, symbol: str, start: date):
+        self.split_calls += 1
+        return [(SPLIT_DATE, RATIO)] if SPLIT_DATE >= start else []
+
+
+class FakeDb:
+    """price_history / corporate_actions as dicts; execute() only answers load_factors."""
+
+    def __init__(self):
+        self.closes = {}
+        self.splits = {}
+
+    def execute(self, statement, params):
+        return [(SYM, d, 1.0 / r) for d, r in sorted(self.splits.items()) if SYM in params["symbols"]]
+
+    def ingest(self, provider: FakeProvider, start: date, end: date) -> None:
+        frames = {SYM: provider.history(start, end)}
+        later, failed = later_splits(provider, frames, TODAY)
+        assert not failed
+        frames, actions = unsplit_frames(self, frames, merge_actions(extract_actions(frames), later))
+        self.closes.update(frames[SYM]["Close"].items())
+        self.splits.update({d: amount for d, kind, amount in actions.get(SYM, ()) if kind == "split"})
+
+
+def test_narrow_past_fetch_then_tail_fetch_spanning_a_split():
+    provider, db = FakeProvider(), FakeDb()
+    db.ingest(provider, date(2019, 3, 1), date(2019, 4, 1))
+    db.ingest(provider, date(2020, 8, 1), TODAY)
+
+    stored = pd.Series(db.closes).sort_index()
+    assert np.allclose(stored, provider.traded[stored.index])
+    read = adjust_frame(stored.to_frame(SYM), load_factors(db, [SYM], "split"))[SYM]
+    assert np.allclose(read, provider.adjusted[stored.index])
+
+
+def test_split_lookup_is_cached_per_day():
+    provider = FakeProvider()
+    frames = {SYM: provider.history(date(2019, 5, 1), date(2019, 6, 1))}
+    later_splits(provider, frames, date(2021, 7, 1))
+    later, _ = later_splits(provider, {SYM: provider.history(date(2019, 9, 1), date(2019, 10, 1))}, date(2021, 7, 1))
+    assert provider.split_calls == 1
+    assert later == {SYM: [(SPLIT_DATE, "split", RATIO)]}
+
+
+def test_failed_split_lookup_is_reported():
+    class Down(FakeProvider):
+        def splits(self, symbol, start):
+            raise RuntimeError("429 Too Many Requests")
+
+    provider = Down()
+    later, failed = later_splits(provider, {SYM: provider.history(date(2019, 1, 1), date(2019, 2, 1))}, TODAY)
+    assert later == {} and failed == [SYM]
@@ -0,0 +1,78 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.services import matrix_cache
+from app.services.matrix_cache import MatrixCache
+
+SYMS = ["AAA", "BBB"]
+
+
+class Storage:
+    """price_history as {symbol: {date: close}}; load() records the spans it is asked for."""
+
+    def __init__(self):
+        days = pd.bdate_range("2024-01-01", "2024-01-31").date
+        self.bars = {s: {d: float(i + 10 * k) for i, d in enumerate(days)} for k, s in enumerate(SYMS)}
+        self.loads = []
+
+    def load(self, symbols, start, end):
+        self.loads.append((tuple(symbols), start, end))
+        cols = {s: pd.Series({pd.Timestamp(d): c for d, c in self.bars[s].items() if start <= d <= end}) for s in symbols}
+        return pd.DataFrame(cols).sort_index()
+
+
+@pytest.fixture(autouse=True)
+def no_shared_memory(monkeypatch):
+    monkeypatch.setattr(matrix_cache, "get_shared_registry", lambda: None)
+
+
+def test_second_read_inside_the_span_is_a_hit():
+    storage, cache = Storage(), MatrixCache(1 << 20)
+    first = cache.get(SYMS, date(2024, 1, 1), date(2024, 1, 31), {"AAA": 1, "BBB": 1}, storage.load)
+    again = cache.get(SYMS, date(2024, 1, 8), date(2024, 1, 12), {"AAA": 1, "BBB": 1}, storage.load)
+    assert len(storage.loads) == 1
+    assert again.equals(first.loc["2024-01-08":"2024-01-12"])
+    assert cache.stats()["hits"] == 1
+
+
+def test_read_past_the_span_loads_only_the_missing_days():
+    storage, cache = Storage(), MatrixCache(1 << 20)
+    cache.get(SYMS, date(2024, 1, 1), date(2024, 1, 15), {}, storage.load)
+    frame = cache.get(SYMS, date(2024, 1, 1), date(2024, 1, 31), {}, storage.load)
+    assert storage.loads[-1] == (tuple(SYMS), date(2024, 1, 16), date(2024, 1, 31))
+    assert frame.index[-1] == pd.Timestamp("2024-01-31")
+
+
+def test_apply_bars_one_write_behind_is_not_reloaded():
+    storage, cache = Storage(), MatrixCache(1 << 20)
+    cache.get(SYMS, date(2024, 1, 1), date(2024, 1, 31), {"AAA": 5, "BBB": 1}, storage.load)
+    storage.bars["AAA"][date(2024, 1, 3)] = 42.0
+    cache.apply_bars(["AAA"], [date(2024, 1, 3)], [42.0], {"AAA": 6})
+    frame = cache.get(SYMS, date(2024, 1, 1), date(2024, 1, 31), {"AAA": 6, "BBB": 1}, storage.load)
+    assert len(storage.loads) == 1
+    assert frame.loc["2024-01-03", "AAA"] == 42.0
+
+
+def test_apply_bars_after_a_write_elsewhere_reloads_the_column():
+    storage, cache = Storage(), MatrixCache(1 << 20)
+    cache.get(SYMS, date(2024, 1, 1), date(2024, 1, 31), {"AAA": 5, "BBB": 1}, storage.load)
+    storage.bars["AAA"][date(2024, 1, 2)] = 99.0       # another host's correction: v6
+    storage.bars["AAA"][date(2024, 1, 5)] = 7.0        # this process's write: v7
+    cache.apply_bars(["AAA"], [date(2024, 1, 5)], [7.0], {"AAA": 7})
+    frame = cache.get(SYMS, date(2024, 1, 1), date(2024, 1, 31), {"AAA": 7, "BBB": 1}, storage.load)
+    assert storage.loads[-1] == (("AAA",), date(2024, 1, 1), date(2024, 1, 31))
+    assert frame.loc["2024-01-02", "AAA"] == 99.0
+    assert frame.loc["2024-01-05", "AAA"] == 7.0
+
+
+def test_apply_bars_adds_a_row_for_a_new_day_inside_the_span():
+    storage, cache = Storage(), MatrixCache(1 << 20)
+    cache.get(SYMS, date(2024, 1, 1), date(2024, 1, 31), {"AAA": 1, "BBB": 1}, storage.load)
+    cache.apply_bars(["BBB"], [date(2024, 1, 6)], [3.5], {"BBB": 2})   # a Saturday
+    frame = cache.get(SYMS, date(2024, 1, 1), date(2024, 1, 31), {"AAA": 1, "BBB": 2}, storage.load)
+    assert len(storage.loads) == 1
+    assert frame.loc["2024-01-06", "BBB"] == 3.5
+    assert np.isnan(frame.loc["2024-01-06", "AAA"])
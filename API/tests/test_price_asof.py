@@ -0,0 +1,60 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from app.services.price_asof import AsOfPrices
+
+# AAA trades Jan 2-4, BBB only from Jan 10: AAA's bars sit right before BBB's in the packed keys
+FRAME = pd.DataFrame(
+    {"AAA": [1.0, 2.0, 3.0, np.nan, np.nan], "BBB": [np.nan, np.nan, np.nan, 10.0, 11.0]},
+    index=pd.to_datetime(["2024-01-02", "2024-01-03", "2024-01-04", "2024-01-10", "2024-01-11"]),
+)
+
+
+class StubLoader:
+    def __init__(self, frame: pd.DataFrame):
+        self.frame = frame
+
+    def read(self, symbols, start, end, adjust="split"):
+        return self.frame
+
+
+def _lookup(pairs, staleness=7):
+    asof = AsOfPrices.__new__(AsOfPrices)
+    asof.loader = StubLoader(FRAME)
+    symbols, dates = zip(*pairs)
+    return asof.lookup(list(symbols), list(dates), max_staleness_days=staleness)
+
+
+def test_query_before_the_first_bar_is_missing():
+    out = _lookup([("AAA", date(2024, 1, 1)), ("AAA", date(2024, 1, 2))])
+    assert np.isnan(out["price"][0]) and np.isnat(out["date"][0])
+    assert out["price"][1] == 1.0
+
+
+def test_query_after_the_last_row_uses_the_last_bar_within_staleness():
+    out = _lookup([("BBB", date(2024, 1, 13)), ("BBB", date(2024, 2, 1))])
+    assert out["price"][0] == 11.0
+    assert out["date"][0] == np.datetime64("2024-01-11")
+    assert np.isnan(out["price"][1])
+
+
+def test_staleness_limit_is_inclusive():
+    out = _lookup([("AAA", date(2024, 1, 11)), ("AAA", date(2024, 1, 12))])
+    assert out["price"][0] == 3.0
+    assert np.isnan(out["price"][1])
+
+
+def test_neighbouring_symbols_bar_never_matches():
+    # BBB has no bar on or before Jan 5; the key search lands on AAA's Jan 4 bar
+    out = _lookup([("BBB", date(2024, 1, 5)), ("BBB", date(2024, 1, 10))], staleness=30)
+    assert np.isnan(out["price"][0])
+    assert out["price"][1] == 10.0
+
+
+def test_results_follow_input_order():
+    pairs = [("BBB", date(2024, 1, 11)), ("AAA", date(2024, 1, 3)), ("ZZZ", date(2024, 1, 3))]
+    out = _lookup(pairs)
+    assert out["price"][:2].tolist() == [11.0, 2.0]
+    assert np.isnan(out["price"][2])
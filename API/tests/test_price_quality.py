@@ -0,0 +1,71 @@
+import numpy as np
+
+from app.services.price_quality import (
+    NON_POSITIVE, RETURN_SPIKE, STALE_REPEAT, UNIT_GLITCH, screen_bars,
+)
+
+Z_LIMIT, STALE_RUN = 10.0, 5
+
+
+def _walk(n: int, seed: int, level: float = 100.0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return level * np.exp(np.cumsum(rng.normal(0, 0.01, n)))
+
+
+def _screen(*series: np.ndarray, volumes=None) -> np.ndarray:
+    codes = np.concatenate([np.full(len(s), i) for i, s in enumerate(series)])
+    closes = np.concatenate(series)
+    vols = np.full(len(closes), 1e6) if volumes is None else np.asarray(volumes, dtype=float)
+    flags, _ = screen_bars(codes, closes, closes, closes, closes, vols, Z_LIMIT, STALE_RUN)
+    return flags
+
+
+def test_clean_series_pass():
+    assert not _screen(_walk(250, 1), _walk(250, 2, level=5.0)).any()
+
+
+def test_reverted_spike_is_flagged():
+    closes = _walk(120, 3)
+    closes[60] *= 1.5
+    flags = _screen(closes)
+    assert flags[60] & RETURN_SPIKE
+    assert np.flatnonzero(flags).tolist() == [60]
+
+
+def test_lasting_jump_is_not_a_spike():
+    closes = _walk(120, 4)
+    closes[60:] *= 1.5
+    assert not _screen(closes).any()
+
+
+def test_unit_glitch_is_flagged():
+    closes = _walk(120, 5)
+    closes[40] *= 100
+    flags = _screen(closes)
+    assert flags[40] & UNIT_GLITCH
+    assert np.flatnonzero(flags).tolist() == [40]
+
+
+def test_stale_run_flags_from_the_nth_identical_close():
+    closes = _walk(120, 6)
+    closes[50:50 + STALE_RUN + 2] = closes[50]
+    flags = _screen(closes)
+    assert np.flatnonzero(flags & STALE_REPEAT).tolist() == list(range(50 + STALE_RUN - 1, 50 + STALE_RUN + 2))
+
+
+def test_short_repeat_with_volume_passes():
+    closes = _walk(120, 7)
+    closes[50:50 + STALE_RUN - 1] = closes[50]
+    assert not _screen(closes).any()
+
+
+def test_non_positive_close_is_flagged_without_hurting_neighbours():
+    closes = _walk(120, 8)
+    closes[30] = 0.0
+    flags = _screen(closes)
+    assert np.flatnonzero(flags).tolist() == [30]
+    assert flags[30] & NON_POSITIVE
+
+
+def test_checks_do_not_cross_symbols():
+    assert not _screen(_walk(60, 9, level=100.0), _walk(60, 10, level=1.0)).any()
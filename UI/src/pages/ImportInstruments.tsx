@@ -241,6 +241,7 @@ export function ImportInstruments({ onClose }: { onClose: () => void }) {
     const [rows, setRows] = useState<ParsedRow[]>([]);
     const [step, setStep] = useState<'upload' | 'preview' | 'importing' | 'done'>('upload');
     const [validating, setValidating] = useState(false);
+    const [validationProgress, setValidationProgress] = useState<{ done: number; total: number } | null>(null);
     const [importing, setImporting] = useState(false);
     const [dragActive, setDragActive] = useState(false);
     const [importResult, setImportResult] = useState<{ imported: number; errors: number; failed: any[] } | null>(null);
@@ -280,8 +281,12 @@ export function ImportInstruments({ onClose }: { onClose: () => void }) {
     }, [handleFile]);
 
     /* ─── Ticker validation ─── */
+    // Results stream back one symbol at a time (NDJSON), so rows update as they resolve
     const validateTickers = async (rowsToValidate: ParsedRow[]) => {
         setValidating(true);
+        setValidationProgress(null);
+        const rowKey = (sym: string, hint: string | null) => `${sym.toUpperCase()}|${hint ? hint.toUpperCase() : ''}`;
+        const seen = new Set<string>();
         try {
             // Build parallel arrays — filter out rows with no ticker, keeping hints aligned
             const paired = rowsToValidate
@@ -290,42 +295,25 @@ export function ImportInstruments({ onClose }: { onClose: () => void }) {
             const symbols = paired.map(p => p.sym);
             const currencyHints = paired.map(p => p.hint);
 
-            const result = await api.marketData.validateTickers(symbols, currencyHints);
-            // Build lookup: the backend may return a DIFFERENT symbol (e.g. RACE.MI)
-            // so we need to match by the original symbol we sent
-            const validByOriginal = new Map<string, any>();
-            const validByResolved = new Map<string, any>();
-            for (const v of result.valid) {
-                validByResolved.set(v.symbol, v);
-            }
-            // Map original symbols to their resolved info
-            for (let i = 0; i < symbols.length; i++) {
-                const origSym = symbols[i].toUpperCase();
-                // The backend returns the resolved symbol — find it
-                const resolvedInfo = validByResolved.get(origSym);
-                if (resolvedInfo) {
-                    validByOriginal.set(origSym, resolvedInfo);
-                } else {
-                    // Check if a resolved variant exists (e.g. RACE → RACE.MI)
-                    for (const [resolvedSym, info] of validByResolved.entries()) {
-                        if (resolvedSym.split('.')[0] === origSym) {
-                            validByOriginal.set(origSym, info);
-                            break;
-                        }
-                    }
+            await api.marketData.validateTickersStream(symbols, currencyHints, (event) => {
+                if (event.type === 'start') {
+                    setValidationProgress({ done: 0, total: event.total });
+                    return;
                 }
-            }
-
-            const unresolvedSet = new Set<string>(result.unresolved.map((s: string) => s.toUpperCase()));
-
-            setRows(prev => prev.map(r => {
-                const sym = (r.correctedTicker || r.ticker).toUpperCase();
-                const info = validByOriginal.get(sym);
-                if (info) {
+                if (event.type !== 'result') return;
+                setValidationProgress({ done: event.done, total: event.total });
+                const key = rowKey(event.symbol, event.currency_hint);
+                seen.add(key);
+                const info = event.instrument;
+
+                setRows(prev => prev.map(r => {
+                    const sym = (r.correctedTicker || r.ticker).toUpperCase();
+                    if (rowKey(sym, r.currencyDetected ? r.currency : null) !== key) return r;
+                    if (!info) return { ...r, status: 'unresolved' as const };
                     return {
                         ...r,
                         status: 'valid' as const,
-                        // Update the ticker to the resolved exchange symbol
+                        // Update the ticker to the resolved exchange symbol (e.g. RACE → RACE.MI)
                         correctedTicker: info.symbol !== sym ? info.symbol : r.correctedTicker,
                         yfName: info.name,
                         yfSector: info.sector,
@@ -333,16 +321,14 @@ export function ImportInstruments({ onClose }: { onClose: () => void }) {
                         // Use the currency from the resolved exchange (it matches the file's currency)
                         yfCurrency: info.currency,
                     };
-                }
-                if (unresolvedSet.has(sym)) {
-                    return { ...r, status: 'unresolved' as const };
-                }
-                // If ticker was sent for validation but wasn't found in valid or unresolved,
-                // mark as unresolved to avoid perpetual 'pending' spinner
-                if (sym && symbols.map(s => s.toUpperCase()).includes(sym)) {
-                    return { ...r, status: 'unresolved' as const };
-                }
-                return r;
+                }));
+            });
+
+            // Anything sent but never answered (stream cut short) must not spin forever
+            const sent = new Set(paired.map(p => rowKey(p.sym, p.hint)));
+            setRows(prev => prev.map(r => {
+                const key = rowKey(r.correctedTicker || r.ticker, r.currencyDetected ? r.currency : null);
+                return sent.has(key) && !seen.has(key) && r.status === 'pending' ? { ...r, status: 'unresolved' as const } : r;
             }));
         } catch (e) {
             console.error('Validation failed', e);
@@ -369,7 +355,7 @@ export function ImportInstruments({ onClose }: { onClose: () => void }) {
         setTickerSearchLoading(prev => ({ ...prev, [idx]: true }));
         tickerSearchTimers.current[idx] = setTimeout(async () => {
             try {
-                const results = await api.marketData.searchTicker(newTicker.trim());
+                const results = await api.marketData.searchTicker(newTicker.trim(), true);
                 setTickerSuggestions(prev => ({ ...prev, [idx]: results || [] }));
                 setShowSuggestions(prev => ({ ...prev, [idx]: true }));
             } catch {
@@ -497,7 +483,12 @@ export function ImportInstruments({ onClose }: { onClose: () => void }) {
                                 {pendingCount > 0 && (
                                     <span className="text-slate-400 flex items-center gap-1"><Loader2 className="w-4 h-4 animate-spin" />{pendingCount} pending</span>
                                 )}
-                                {validating && <Loader2 className="w-4 h-4 text-blue-400 animate-spin" />}
+                                {validating && (
+                                    <span className="text-blue-400 flex items-center gap-1">
+                                        <Loader2 className="w-4 h-4 animate-spin" />
+                                        {validationProgress && `${validationProgress.done}/${validationProgress.total}`}
+                                    </span>
+                                )}
                             </div>
 
                             {/* Unresolved Tickers — Correction UI (outside overflow container so dropdown is visible) */}
@@ -209,7 +209,7 @@ export function Positions() {
     setTickerSearchLoading(true);
     tickerSearchTimer.current = setTimeout(async () => {
       try {
-        const results = await api.marketData.searchTicker(value.trim());
+        const results = await api.marketData.searchTicker(value.trim(), true);
         setTickerSuggestions(results || []);
         setShowSuggestions(true);
       } catch {
@@ -61,7 +61,7 @@ export function Transactions() {
     setTickerSearchLoading(true);
     tickerSearchTimer.current = setTimeout(async () => {
       try {
-        const results = await api.marketData.searchTicker(value.trim());
+        const results = await api.marketData.searchTicker(value.trim(), true);
         setTickerSuggestions(results || []);
         setShowSuggestions(true);
       } catch { setTickerSuggestions([]); }
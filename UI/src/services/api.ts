@@ -23,6 +23,38 @@ export async function request(endpoint: string, options: RequestInit = {}) {
     return response.json();
 }
 
+/** POST a JSON body and call onEvent for every line of an NDJSON response. */
+export async function streamNdjson(endpoint: string, body: unknown, onEvent: (event: any) => void) {
+    const token = localStorage.getItem('access_token');
+    const response = await fetch(`${API_URL}${endpoint}`, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+            ...(token && { Authorization: `Bearer ${token}` }),
+        },
+        body: JSON.stringify(body),
+    });
+
+    if (!response.ok || !response.body) {
+        const error = await response.json().catch(() => ({ detail: 'Unknown error' }));
+        throw new Error(error.detail || 'API request failed');
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    for (;;) {
+        const { done, value } = await reader.read();
+        if (value) buffer += decoder.decode(value, { stream: !done });
+        const lines = buffer.split('\n');
+        buffer = done ? '' : lines.pop() ?? '';
+        for (const line of lines) {
+            if (line.trim()) onEvent(JSON.parse(line));
+        }
+        if (done) break;
+    }
+}
+
 export const api = {
     // ─── Auth ───────────────────────────────────────────
     auth: {
@@ -124,8 +156,12 @@ export const api = {
     // ─── Market Data ────────────────────────────────────
     marketData: {
         getPrice: (symbol: string, date: string) => request(`/market-data/price/${symbol}?date=${date}`),
-        searchTicker: (query: string) => request(`/market-data/search/${encodeURIComponent(query)}`),
+        // remote: also look the ticker up on the provider when the local index has no exact match
+        searchTicker: (query: string, remote = false) =>
+            request(`/market-data/search/${encodeURIComponent(query)}${remote ? '?remote=true' : ''}`),
         validateTickers: (symbols: string[], currencyHints?: (string | null)[]) =>
             request('/market-data/validate-tickers', { method: 'POST', body: JSON.stringify({ symbols, currency_hints: currencyHints }) }),
+        validateTickersStream: (symbols: string[], currencyHints: (string | null)[] | undefined, onEvent: (event: any) => void) =>
+            streamNdjson('/market-data/validate-tickers/stream', { symbols, currency_hints: currencyHints }, onEvent),
     },
 };